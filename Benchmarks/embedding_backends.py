@@ -0,0 +1,99 @@
+# Compares embedding backends (Embedding.Backends) on CPU: load time,
+# throughput in texts/s and parity with the fp32 torch model as the cosine
+# similarity of each text's two embeddings. The model has to be in the local
+# Hugging Face cache; the onnx backend exports it on the first run.
+#
+#   python -m Benchmarks.embedding_backends --threads 4 --texts 512
+#   python -m Benchmarks.embedding_backends --backends onnx --min-cosine 0.99
+#
+# Exits with 1 if a backend's mean cosine is below --min-cosine.
+import os
+
+# Offline: never reach out to the Hugging Face Hub
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+from Embedding.Backends import load_model, parity, throughput, supported_backends
+from Embedding.ModelRegistry import DEFAULT_MODEL_NAME
+from .fixtures import paragraph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend comparison")
+    parser.add_argument("--model-name", default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--backends", nargs="+", choices=supported_backends, default=supported_backends)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--texts", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--onnx-dir", default=None)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = [paragraph(rng, rng.choice([1, 2, 4])) for _ in range(args.texts)]
+
+    # Every backend is compared to the fp32 torch model
+    reference = load_model(args.model_name, "cpu", "fp32", "torch", args.threads)
+    results = {}
+    failures = []
+    print(f"{'backend':<11} {'load s':>7} {'texts/s':>9} {'speedup':>8} {'mean cos':>9} {'min cos':>8}")
+    for backend in args.backends:
+        if backend == "torch":
+            model, load_seconds = reference, None
+        else:
+            started = time.perf_counter()
+            model = load_model(
+                args.model_name, "cpu", "fp32", backend, args.threads, args.onnx_dir
+            )
+            load_seconds = time.perf_counter() - started
+        result = {
+            "load_seconds": load_seconds,
+            **throughput(model, texts, args.batch_size, args.repeat),
+            **parity(model, reference, texts),
+        }
+        results[backend] = result
+        if result["mean_cosine"] < args.min_cosine:
+            failures.append(backend)
+
+    base = results.get("torch") or throughput(reference, texts, args.batch_size, args.repeat)
+    for backend, result in results.items():
+        result["speedup"] = result["texts_per_second"] / base["texts_per_second"]
+        load = f"{result['load_seconds']:.1f}" if result["load_seconds"] is not None else "-"
+        print(
+            f"{backend:<11} {load:>7} {result['texts_per_second']:>9.1f} {result['speedup']:>7.2f}x "
+            f"{result['mean_cosine']:>9.4f} {result['min_cosine']:>8.4f}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "python": platform.python_version(),
+                    "cpu_count": os.cpu_count(),
+                    "model_name": args.model_name,
+                    "threads": args.threads,
+                    "texts": args.texts,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Results written to {args.output}")
+
+    for backend in failures:
+        print(f"{backend} mean cosine {results[backend]['mean_cosine']:.4f} is below {args.min_cosine}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# Synthetic CSV and PDF fixtures for the benchmark suite. Output is
+# deterministic for a given size and seed, so timings are comparable across
+# runs and machines.
+#
+#   python -m Benchmarks.fixtures /tmp/fixtures --sizes small medium
+import os
+import random
+import argparse
+import pandas as pd
+
+# rows for CSV fixtures, pages for PDF fixtures
+fixture_sizes = {
+    "small": {"rows": 1_000, "pages": 10},
+    "medium": {"rows": 10_000, "pages": 100},
+    "large": {"rows": 100_000, "pages": 500},
+}
+
+_words = (
+    "income household survey region average median growth annual report market "
+    "revenue cost customer product service policy county state population rate "
+    "employment education health energy water transport housing price index "
+    "data analysis model forecast trend sample estimate variance quarter year"
+).split()
+
+
+def sentence(rng: random.Random, min_words=6, max_words=18) -> str:
+    words = [rng.choice(_words) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(sentence(rng) for _ in range(sentences))
+
+
+def generate_csv(path: str, rows: int, seed: int = 0, text_column: str = "text"):
+    # Mostly short cells plus some long ones that the chunker has to split
+    rng = random.Random(seed)
+    texts = [
+        paragraph(rng, rng.choice([1, 1, 2, 3, 12])) for _ in range(rows)
+    ]
+    pd.DataFrame(
+        {"id": range(rows), text_column: texts, "value": [rng.random() for _ in texts]}
+    ).to_csv(path, index=False)
+    return path
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _page_stream(lines) -> bytes:
+    commands = ["BT", "/F1 10 Tf", "12 TL", "50 760 Td"]
+    for line in lines:
+        commands.append(f"({_pdf_escape(line)}) Tj T*")
+    commands.append("ET")
+    return "\n".join(commands).encode("latin-1")
+
+
+def generate_pdf(path: str, pages: int, seed: int = 0, lines_per_page: int = 55):
+    # Minimal PDF 1.4 writer: one Helvetica text stream per page, enough for
+    # PdfReader.extract_text without a PDF library
+    rng = random.Random(seed)
+    objects = []  # object number - 1 -> body bytes
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    pages_id = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for _ in range(pages):
+        words = paragraph(rng, lines_per_page // 2).split()
+        lines, line = [], []
+        for word in words:
+            line.append(word)
+            if len(" ".join(line)) > 90:
+                lines.append(" ".join(line))
+                line = []
+        if line:
+            lines.append(" ".join(line))
+        stream = _page_stream(lines[:lines_per_page])
+        content = add(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+        page_ids.append(
+            add(
+                (
+                    f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 612 792] "
+                    f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {content} 0 R >>"
+                ).encode("latin-1")
+            )
+        )
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[pages_id - 1] = (
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("latin-1")
+    )
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode(
+        "latin-1"
+    )
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(
+            b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(objects) + 1, catalog, xref)
+        )
+    return path
+
+
+def generate_fixtures(out_dir: str, sizes, seed: int = 0):
+    # Returns {(file_type, size): path}; existing files are reused
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for size in sizes:
+        csv_path = os.path.join(out_dir, f"fixture_{size}_{seed}.csv")
+        pdf_path = os.path.join(out_dir, f"fixture_{size}_{seed}.pdf")
+        if not os.path.exists(csv_path):
+            generate_csv(csv_path, fixture_sizes[size]["rows"], seed)
+        if not os.path.exists(pdf_path):
+            generate_pdf(pdf_path, fixture_sizes[size]["pages"], seed)
+        paths[("csv", size)] = csv_path
+        paths[("pdf", size)] = pdf_path
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate benchmark fixtures")
+    parser.add_argument("out_dir")
+    parser.add_argument(
+        "--sizes", nargs="+", choices=list(fixture_sizes), default=["small"]
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for (file_type, size), path in generate_fixtures(
+        args.out_dir, args.sizes, args.seed
+    ).items():
+        print(f"{file_type:>4} {size:>7} {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Measures cold import time of the public entry points in fresh interpreters
+# and checks that importing them loads none of the heavy dependencies, which
+# are imported on first use instead.
+#
+#   python -m Benchmarks.import_time --repeat 5 --max-seconds 1.0
+#
+# Exits with 1 when a heavy module is loaded at import or the median import
+# time is above --max-seconds.
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+entry_points = ["PineconeRag", "Retrieval.Retrieval", "Ingest.Ingest"]
+
+heavy_modules = [
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "pandas",
+    "PyPDF2",
+    "tiktoken",
+    "pinecone",
+]
+
+_probe = """
+import sys, json, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": seconds,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure(module, repeat):
+    # A fresh interpreter per run, so nothing is cached in sys.modules
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _probe.format(module=module, heavy=heavy_modules)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "median_seconds": statistics.median(run["seconds"] for run in runs),
+        "loaded": sorted({name for run in runs for name in run["loaded"]}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time benchmark")
+    parser.add_argument("--modules", nargs="+", default=entry_points)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'module':<22} {'median s':>9}  heavy modules loaded")
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        print(
+            f"{module:<22} {result['median_seconds']:>9.3f}  {', '.join(result['loaded']) or '-'}"
+        )
+        if result["loaded"]:
+            failures.append(f"{module} imports {', '.join(result['loaded'])}")
+        if result["median_seconds"] > args.max_seconds:
+            failures.append(
+                f"{module} takes {result['median_seconds']:.3f}s to import (max {args.max_seconds}s)"
+            )
+
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Measures PDF page extraction throughput for increasing worker counts.
+#
+#   python -m Benchmarks.pdf_extraction data_files/report.pdf --workers 1 2 4 8
+import os
+import time
+import asyncio
+import argparse
+from PyPDF2 import PdfReader
+from Ingest.PDFProcessor import extract_pages
+
+
+async def run(pdf_path, workers_list, repeat):
+    page_count = len(PdfReader(pdf_path).pages)
+    print(f"{pdf_path}: {page_count} pages")
+    print(f"{'workers':>8} {'seconds':>10} {'pages/s':>10} {'speedup':>8}")
+
+    baseline = None
+    expected = None
+    for workers in workers_list:
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            pages = await extract_pages(pdf_path, 0, page_count, workers)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        # Every worker count must produce the same pages in the same order
+        if expected is None:
+            expected = pages
+        elif pages != expected:
+            raise AssertionError(
+                f"Output with {workers} workers differs from {workers_list[0]} workers"
+            )
+
+        baseline = baseline or best
+        print(
+            f"{workers:>8} {best:>10.2f} {page_count / best:>10.1f} {baseline / best:>7.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF extraction scaling benchmark")
+    parser.add_argument("pdf_path")
+    cpu_count = os.cpu_count() or 1
+    default_workers = sorted({1, 2, 4, 8, cpu_count} & set(range(1, cpu_count + 1)))
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.pdf_path, args.workers, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Compares float32, float16 and int8 storage of embeddings: bytes held by the
+# ingest buffer and the local vector store, recall@k of local search against
+# float32 exact search, and query latency.
+#
+#   python -m Benchmarks.quantization --vectors 50000 --dimension 768
+#   python -m Benchmarks.quantization --embeddings corpus.npy
+#
+# Without --embeddings the fixture corpus is synthetic: normalized vectors
+# drawn around random cluster centers, shaped like sentence embeddings.
+import sys
+import time
+import asyncio
+import argparse
+import numpy as np
+from Embedding.Quantization import QuantizedVectors, supported_storage_dtypes
+from VectorStore.LocalVectorStore import LocalVectorStore
+from VectorStore.VectorStore import supported_metrics
+
+
+def fixture_corpus(count, dimension, clusters=100, noise=0.35, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size=count)]
+    vectors = vectors + noise * rng.normal(size=(count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def list_nbytes(vectors):
+    # Ingest buffer before this change: one float32 array object per chunk
+    return sum(vector.nbytes + sys.getsizeof(vector) for vector in vectors)
+
+
+async def search(store, queries, top_k):
+    started = time.perf_counter()
+    results = []
+    for query in queries:
+        response = await store.query(query, top_k=top_k, namespace="bench")
+        results.append([match["id"] for match in response["matches"]])
+    return results, (time.perf_counter() - started) / len(queries)
+
+
+async def run(vectors, queries, metric, top_k):
+    count, dimension = vectors.shape
+    print(f"{count} vectors, dimension {dimension}, {len(queries)} queries, metric {metric}, top_k {top_k}")
+    print(
+        f"{'dtype':>8} {'buffer MB':>10} {'store MB':>10} {'ratio':>6} {'recall':>7} {'ms/query':>9}"
+    )
+
+    rows = [vectors[i] for i in range(count)]
+    baseline_bytes = None
+    expected = None
+    for storage_dtype in supported_storage_dtypes:
+        buffer = QuantizedVectors.from_vectors(rows, storage_dtype)
+
+        store = LocalVectorStore(
+            dimension=dimension, metric=metric, storage_dtype=storage_dtype
+        )
+        await store.upsert(
+            [{"id": str(i), "values": vectors[i]} for i in range(count)],
+            namespace="bench",
+        )
+        store_bytes = store.get_namespace("bench").nbytes
+        results, latency = await search(store, queries, top_k)
+
+        # float32 exact search is the reference for recall
+        if expected is None:
+            expected, baseline_bytes = results, store_bytes
+        recall = np.mean(
+            [len(set(got) & set(want)) / top_k for got, want in zip(results, expected)]
+        )
+        print(
+            f"{storage_dtype:>8} {buffer.nbytes / 2**20:>10.1f} {store_bytes / 2**20:>10.1f} "
+            f"{baseline_bytes / store_bytes:>5.1f}x {recall:>7.3f} {latency * 1000:>9.2f}"
+        )
+    print(f"list of float32 arrays: {list_nbytes(rows) / 2**20:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding storage dtype benchmark")
+    parser.add_argument("--embeddings", help=".npy file of float32 embeddings")
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--metric", choices=supported_metrics, default="cosine")
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.embeddings:
+        vectors = np.load(args.embeddings).astype(np.float32)
+    else:
+        vectors = fixture_corpus(args.vectors, args.dimension)
+    # Queries are perturbed corpus vectors, so each has close neighbours
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), size=args.queries)]
+    queries = queries + 0.1 * rng.normal(size=queries.shape).astype(np.float32)
+
+    asyncio.run(run(vectors, queries, args.metric, args.top_k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+# Local stand-in for the Pinecone data plane, so the upsert and query paths
+# can be benchmarked offline. StubServer serves Pinecone-shaped JSON
+# endpoints backed by a LocalVectorStore; StubVectorStore is the matching
+# VectorStore client. Requests go over real HTTP on localhost, so record
+# serialization and round trips are part of the measurement. latency_ms adds
+# a fixed delay per request to model the network, and error_rate makes that
+# share of upserts fail with 429 or 503 to exercise client retries.
+#
+#   python -m Benchmarks.stub_server --port 5081 --dimension 768
+import json
+import time
+import random
+import queue
+import asyncio
+import argparse
+import threading
+import http.client
+from urllib.parse import urlencode, urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from VectorStore.VectorStore import VectorStore
+from VectorStore.LocalVectorStore import LocalVectorStore
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like the pooled sessions of the Pinecone client
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this Nagle's algorithm
+    # and delayed ACKs add ~40ms to every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _delay(self):
+        if self.server.latency_ms:
+            time.sleep(self.server.latency_ms / 1000)
+
+    def do_POST(self):
+        self._delay()
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        store = self.server.store
+        namespace = body.get("namespace", "")
+        self.server.requests += 1
+        try:
+            if self.path == "/vectors/upsert" and random.random() < self.server.error_rate:
+                self._reply(random.choice([429, 503]), {"error": "Injected failure"})
+            elif self.path == "/vectors/upsert":
+                store.get_namespace(namespace).upsert(body["vectors"])
+                self._reply(200, {"upsertedCount": len(body["vectors"])})
+            elif self.path == "/query":
+                result = store._query(
+                    body["vector"],
+                    body.get("topK", 3),
+                    namespace,
+                    body.get("includeValues", False),
+                    body.get("includeMetadata", True),
+                )
+                self._reply(200, result)
+            elif self.path == "/vectors/delete":
+                store.get_namespace(namespace).delete(body["ids"])
+                self._reply(200, {})
+            else:
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+        except Exception as e:
+            self._reply(400, {"error": str(e)})
+
+    def do_GET(self):
+        self._delay()
+        self.server.requests += 1
+        url = urlparse(self.path)
+        if url.path != "/vectors/fetch":
+            self._reply(404, {"error": f"Unknown path {url.path}"})
+            return
+        params = parse_qs(url.query)
+        result = asyncio.run(
+            self.server.store.fetch(
+                params.get("ids", []), params.get("namespace", [""])[0]
+            )
+        )
+        self._reply(200, result)
+
+
+class StubServer:
+    # Runs in a background thread; use as a context manager or start()/stop()
+    def __init__(
+        self,
+        dimension: int = 768,
+        metric: str = "cosine",
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0,
+        error_rate: float = 0,
+    ):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.store = LocalVectorStore(dimension=dimension, metric=metric)
+        self.httpd.latency_ms = latency_ms
+        self.httpd.error_rate = error_rate
+        self.httpd.requests = 0
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class StubServerError(RuntimeError):
+    def __init__(self, status, body):
+        super().__init__(f"Stub server error {status}: {body}")
+        self.status = status
+
+
+class StubVectorStore(VectorStore):
+    # VectorStore client for StubServer with a pool of keep-alive connections
+    def __init__(self, address: str, pool_size: int = 8):
+        self.address = address
+        self.pool = queue.Queue()
+        for _ in range(pool_size):
+            self.pool.put(http.client.HTTPConnection(address))
+
+    def _request(self, method, path, body=None):
+        connection = self.pool.get()
+        try:
+            payload = json.dumps(body).encode("utf-8") if body is not None else None
+            headers = {"Content-Type": "application/json"} if payload else {}
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            result = json.loads(response.read())
+            if response.status != 200:
+                raise StubServerError(response.status, result)
+            return result
+        except (http.client.HTTPException, ConnectionError):
+            connection.close()
+            raise
+        finally:
+            self.pool.put(connection)
+
+    async def upsert(self, vectors, namespace="", batch_size=100):
+        upserted = 0
+        for start in range(0, len(vectors), batch_size):
+            batch = [
+                {
+                    "id": record["id"],
+                    "values": [float(value) for value in record["values"]],
+                    "metadata": record.get("metadata") or {},
+                }
+                for record in vectors[start : start + batch_size]
+            ]
+            result = await asyncio.to_thread(
+                self._request,
+                "POST",
+                "/vectors/upsert",
+                {"vectors": batch, "namespace": namespace},
+            )
+            upserted += result["upsertedCount"]
+        return {"upserted_count": upserted}
+
+    async def query(
+        self,
+        vector,
+        top_k=3,
+        namespace="",
+        include_values=False,
+        include_metadata=True,
+    ):
+        return await asyncio.to_thread(
+            self._request,
+            "POST",
+            "/query",
+            {
+                "vector": [float(value) for value in vector],
+                "topK": top_k,
+                "namespace": namespace,
+                "includeValues": include_values,
+                "includeMetadata": include_metadata,
+            },
+        )
+
+    async def delete(self, ids, namespace=""):
+        return await asyncio.to_thread(
+            self._request,
+            "POST",
+            "/vectors/delete",
+            {"ids": list(ids), "namespace": namespace},
+        )
+
+    async def fetch(self, ids, namespace=""):
+        query = urlencode({"ids": list(ids), "namespace": namespace}, doseq=True)
+        return await asyncio.to_thread(
+            self._request, "GET", f"/vectors/fetch?{query}"
+        )
+
+    async def close(self):
+        while not self.pool.empty():
+            self.pool.get().close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Pinecone stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5081)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--metric", default="cosine")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    args = parser.parse_args()
+    server = StubServer(
+        args.dimension,
+        args.metric,
+        args.host,
+        args.port,
+        args.latency_ms,
+        args.error_rate,
+    )
+    print(f"Stub vector store listening on {server.address}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
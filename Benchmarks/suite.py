@@ -0,0 +1,369 @@
+# End-to-end ingestion and retrieval benchmark. It runs offline on CPU:
+# fixtures are generated locally (Benchmarks.fixtures) and Pinecone is
+# replaced by a stub server on localhost (Benchmarks.stub_server). The model
+# and tokenizer must already be in the local Hugging Face cache; --embedder
+# hashing replaces the model with a deterministic hashing embedder to time
+# everything around it.
+#
+#   python -m Benchmarks.suite --sizes small medium --output results.json
+#   python -m Benchmarks.suite --baseline baseline.json --fail-on-regression
+#
+# Per fixture it reports seconds for extract, chunk, embed, prepare (record
+# batch) and upsert (through UpsertEngine), upsert vectors/s, retries and
+# batch latency, and p50/p90/p99 query latency with `--concurrency` queries in
+# flight.
+import os
+
+# Offline: never reach out to the Hugging Face Hub
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import io
+import sys
+import json
+import time
+import zlib
+import random
+import asyncio
+import argparse
+import platform
+import contextlib
+import numpy as np
+from Embedding.ModelRegistry import get_model, DEFAULT_MODEL_NAME
+from Ingest.PDFProcessor import PDFProcessor
+from Ingest.CSVProcessor import CSVProcessor
+from Ingest.Ingest import Ingest
+from Instrumentation.Metrics import metrics
+from Retrieval.Retrieval import Retrieval
+from Retrieval.RetrievalService import RetrievalService
+from .fixtures import fixture_sizes, generate_fixtures, sentence
+from .stub_server import StubServer, StubVectorStore
+
+stages = ["extract", "chunk", "embed", "prepare", "upsert"]
+# Compared against the baseline, lower is better for all of them
+compared_metrics = stages + ["p50_ms", "p90_ms", "p99_ms"]
+
+
+class HashingEmbedder:
+    # Deterministic bag-of-words vectors, no weights to download
+    def __init__(self, dimension: int = 768, max_seq_length: int = 128):
+        self.dimension = dimension
+        self.max_seq_length = max_seq_length
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, zlib.crc32(word.encode("utf-8")) % self.dimension] += 1
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1)
+
+
+class _StubConnection:
+    # The part of ConnectionManager that Retrieval uses
+    def __init__(self, store):
+        self.store = store
+
+    async def get_vector_store(self):
+        return self.store
+
+
+def percentiles(latencies):
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        f"p{p}_ms": float(np.percentile(latencies_ms, p)) for p in (50, 90, 99)
+    }
+
+
+def stage_seconds():
+    # Seconds recorded so far per stage by the processors and Ingest, see
+    # Instrumentation.Metrics
+    return {
+        dict(labels)["stage"]: seconds
+        for labels, seconds in metrics.counters.get("stage_seconds_total", {}).items()
+    }
+
+
+async def bench_ingest(file_type, path, model, store, namespace, args):
+    # Runs the processor steps of PineconeRag.ingest and Ingest's upsert
+    # through UpsertEngine; stage timings are the ones they record
+    file_configs = {
+        "file_name": path,  # absolute, so the processors skip data_files/
+        "file_type": file_type,
+        "text_column": "text",
+        "start_row": 0,
+        "end_row": None,
+        "chunk_size": None,
+        "start_on_page": 0,
+        "end_on_page": None,
+        "workers": args.workers,
+    }
+    embedding_configs = {
+        "model_name": args.model_name,
+        "storage_dtype": args.storage_dtype,
+    }
+    processor_class = PDFProcessor if file_type == "pdf" else CSVProcessor
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor = processor_class(
+            file_configs, model=model, embedding_configs=embedding_configs
+        )
+    ingest = Ingest(
+        {
+            "file_configs": file_configs,
+            "pinecone_configs": {"namespace": namespace},
+            "upsert_configs": {
+                "max_batch_bytes": args.upsert_max_bytes,
+                "max_batch_records": args.upsert_batch_size,
+                "concurrency": args.upsert_concurrency,
+                "backoff_base": 0.01,
+            },
+        },
+        model=model,
+        connection=_StubConnection(store),
+    )
+
+    before = stage_seconds()
+    await processor.extract_text_content()
+    await processor.embeded_text_content()
+    await processor.prepare_records_for_upsert()
+    # Record dicts are built batch by batch inside the engine, so that cost
+    # is part of the upsert stage
+    upsert_stats = await ingest.upsert_to_pinecone(processor.get_pinecone_records())
+    after = stage_seconds()
+
+    return {
+        "chunks": len(processor.chunks),
+        "stages": {
+            stage: after.get(stage, 0) - before.get(stage, 0) for stage in stages
+        },
+        "embedding_stats": processor.embedding_stats,
+        "upsert": upsert_stats,
+    }
+
+
+async def bench_retrieval(retrieval, namespace, args, seed):
+    rng = random.Random(seed)
+    texts = [sentence(rng) for _ in range(args.queries)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    service = None
+    if args.service:
+        # Concurrent queries share encode calls, see RetrievalService
+        service = await RetrievalService(
+            retrieval,
+            max_batch_size=args.service_max_batch_size,
+            max_wait_ms=args.service_max_wait_ms,
+        ).start()
+    latencies = []
+    empty = 0
+
+    async def timed_query(text):
+        nonlocal empty
+        async with semaphore:
+            started = time.perf_counter()
+            matches = await (service or retrieval).query(
+                namespace, text, top_k=args.top_k
+            )
+            latencies.append(time.perf_counter() - started)
+            empty += not matches
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*[timed_query(text) for text in texts])
+    elapsed = time.perf_counter() - started
+    result = {
+        "queries": len(texts),
+        "concurrency": args.concurrency,
+        "empty_results": empty,
+        "qps": len(texts) / elapsed,
+        **percentiles(latencies),
+    }
+    if service is not None:
+        await service.stop()
+        result["mean_batch_size"] = service.mean_batch_size
+    return result
+
+
+async def run(args):
+    if args.embedder == "hashing":
+        model = HashingEmbedder(args.dimension)
+    else:
+        model = get_model({"model_name": args.model_name})
+    dimension = model.encode(["dimension probe"]).shape[1]
+    paths = generate_fixtures(args.fixtures_dir, args.sizes, args.seed)
+
+    results = {}
+    with StubServer(
+        dimension=dimension, latency_ms=args.latency_ms, error_rate=args.error_rate
+    ) as server:
+        store = StubVectorStore(server.address, pool_size=args.upsert_concurrency)
+        configs = {
+            "file_configs": {},
+            "pinecone_configs": {"dimension": dimension},
+            # Every query goes to the model and the store
+            "retrieval_configs": {
+                "query_embedding_cache_size": 0,
+                "query_result_cache_ttl": 0,
+            },
+        }
+        with contextlib.redirect_stdout(io.StringIO()):
+            retrieval = Retrieval(
+                configs,
+                model=model,
+                embedding_cache=None,
+                connection=_StubConnection(store),
+            )
+
+        for (file_type, size), path in paths.items():
+            if file_type not in args.file_types:
+                continue
+            name = f"{file_type}/{size}"
+            best = None
+            for repeat in range(args.repeat):
+                namespace = f"{file_type}-{size}-{repeat}"
+                result = await bench_ingest(
+                    file_type, path, model, store, namespace, args
+                )
+                result["retrieval"] = await bench_retrieval(
+                    retrieval, namespace, args, args.seed + repeat
+                )
+                best = result if best is None else merge_best(best, result)
+            results[name] = best
+            print_result(name, best)
+        await store.close()
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "embedder": args.embedder,
+        "model_name": args.model_name if args.embedder == "model" else None,
+        "storage_dtype": args.storage_dtype,
+        "results": results,
+    }
+
+
+def merge_best(best, result):
+    # Fastest time per stage and percentile across repeats
+    for stage, seconds in result["stages"].items():
+        best["stages"][stage] = min(best["stages"][stage], seconds)
+    for key, value in result["retrieval"].items():
+        if key.endswith("_ms"):
+            best["retrieval"][key] = min(best["retrieval"][key], value)
+        elif key == "qps":
+            best["retrieval"][key] = max(best["retrieval"][key], value)
+    return best
+
+
+def print_result(name, result):
+    stage_times = " ".join(
+        f"{stage} {result['stages'][stage]:.2f}s" for stage in stages
+    )
+    retrieval = result["retrieval"]
+    upsert = result["upsert"]
+    print(f"{name:<11} {result['chunks']:>7} chunks  {stage_times}")
+    print(
+        f"{'':<11} upsert {upsert['vectors_per_second']:.0f} vectors/s in {upsert['batches']} requests, "
+        f"p50 {upsert['p50_batch_ms']:.1f}ms p99 {upsert['p99_batch_ms']:.1f}ms, {upsert['retries']} retries"
+    )
+    print(
+        f"{'':<11} queries p50 {retrieval['p50_ms']:.1f}ms p90 {retrieval['p90_ms']:.1f}ms "
+        f"p99 {retrieval['p99_ms']:.1f}ms {retrieval['qps']:.1f} qps"
+        + (
+            f", {retrieval['mean_batch_size']:.1f} queries per encode"
+            if retrieval.get("mean_batch_size")
+            else ""
+        )
+    )
+
+
+def metric_values(result):
+    return {**result["stages"], **{
+        key: value for key, value in result["retrieval"].items() if key.endswith("_ms")
+    }}
+
+
+def compare(current, baseline, tolerance):
+    # Returns the regressions: metrics more than tolerance slower than baseline
+    regressions = []
+    print(f"\n{'fixture':<11} {'metric':<9} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            print(f"{name:<11} not in baseline")
+            continue
+        before = metric_values(baseline["results"][name])
+        after = metric_values(result)
+        for metric in compared_metrics:
+            if metric not in before or metric not in after or before[metric] <= 0:
+                continue
+            change = after[metric] / before[metric] - 1
+            flag = ""
+            if change > tolerance:
+                flag = " REGRESSION"
+                regressions.append((name, metric, change))
+            print(
+                f"{name:<11} {metric:<9} {before[metric]:>10.4f} {after[metric]:>10.4f} {change:>+7.1%}{flag}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion and retrieval benchmark")
+    parser.add_argument("--sizes", nargs="+", choices=list(fixture_sizes), default=["small"])
+    parser.add_argument("--file-types", nargs="+", choices=["csv", "pdf"], default=["csv", "pdf"])
+    parser.add_argument("--fixtures-dir", default=os.path.join("Benchmarks", "fixtures_data"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--embedder", choices=["model", "hashing"], default="model")
+    parser.add_argument("--model-name", default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--dimension", type=int, default=768, help="hashing embedder only")
+    parser.add_argument("--storage-dtype", default="float32")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--upsert-batch-size", type=int, default=1000, help="max records per request")
+    parser.add_argument("--upsert-max-bytes", type=int, default=1_800_000, help="max estimated bytes per request")
+    parser.add_argument("--upsert-concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=0, help="stub server delay per request")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of upserts the stub server fails")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--service", action="store_true", help="query through RetrievalService")
+    parser.add_argument("--service-max-wait-ms", type=float, default=5)
+    parser.add_argument("--service-max-batch-size", type=int, default=32)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+    if args.fail_on_regression and not args.baseline:
+        parser.error("--fail-on-regression requires --baseline")
+
+    current = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        # Baselines are machine specific, so none is committed: a missing one
+        # fails the check instead of passing it without comparing anything
+        if not os.path.exists(args.baseline):
+            print(
+                f"Baseline {args.baseline} not found, nothing was compared. "
+                f"Record one on this machine with --output {args.baseline}"
+            )
+            if args.fail_on_regression:
+                sys.exit(1)
+            return
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.tolerance:.0%}")
+            if args.fail_on_regression:
+                sys.exit(1)
+        else:
+            print(f"No metric regressed by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
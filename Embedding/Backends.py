@@ -0,0 +1,236 @@
+import os
+import time
+import hashlib
+import logging
+import numpy as np
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# torch: the SentenceTransformer model as is (fp32, or fp16 on GPU)
+# torch-int8: Linear layers dynamically quantized to int8, CPU only
+# onnx: the transformer exported to ONNX and run with ONNX Runtime, CPU only
+supported_backends = ["torch", "torch-int8", "onnx"]
+cpu_only_backends = ["torch-int8", "onnx"]
+
+DEFAULT_ONNX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pinecone_rag", "onnx")
+
+
+def validate_backend(backend: Optional[str]) -> str:
+    backend = (backend or "torch").lower()
+    if backend not in supported_backends:
+        raise ValueError(
+            f"Embedding backend '{backend}' not supported. Supported backends: {', '.join(supported_backends)}"
+        )
+    return backend
+
+
+def set_torch_threads(threads: Optional[int]):
+    # Process-wide: applies to every torch model, not just the one being loaded
+    if not threads:
+        return
+    import torch
+
+    torch.set_num_threads(threads)
+    logger.info(f"torch intra-op threads set to {threads}")
+
+
+def load_torch(model_name: str, device: str, precision: str, threads=None):
+    from sentence_transformers import SentenceTransformer
+
+    set_torch_threads(threads)
+    model = SentenceTransformer(model_name, device=device)
+    if precision == "fp16":
+        if device == "cpu":
+            logger.warning("fp16 is not supported on cpu, keeping fp32 weights")
+        else:
+            model = model.half()
+    model.eval()
+    return model
+
+
+def load_torch_int8(model_name: str, threads=None):
+    # Weights of every Linear layer are stored as int8 and activations are
+    # quantized per batch at run time, so no calibration data is needed
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    set_torch_threads(threads)
+    model = SentenceTransformer(model_name, device="cpu")
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def onnx_model_path(model_name: str, onnx_dir: Optional[str] = None) -> str:
+    model_dir = hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(onnx_dir or DEFAULT_ONNX_DIR, model_dir, "model.onnx")
+
+
+def export_onnx(model, path: str) -> str:
+    # Exports the transformer of a SentenceTransformer (token embeddings out,
+    # pooling is done by OnnxEmbedder) with dynamic batch and sequence axes
+    import torch
+
+    transformer = model[0].auto_model
+    encoded = model.tokenizer(["onnx export"], return_tensors="pt")
+    input_names = [
+        name
+        for name in ("input_ids", "attention_mask", "token_type_ids")
+        if name in encoded
+    ]
+
+    class _TokenEmbeddings(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(input_names, inputs)))[0]
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings().eval(),
+            tuple(encoded[name] for name in input_names),
+            tmp_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+    os.replace(tmp_path, path)
+    logger.info(f"Exported ONNX model to {path}")
+    return path
+
+
+class OnnxEmbedder:
+    # Drop-in for SentenceTransformer.encode on ONNX Runtime. The model is
+    # exported on first use to <onnx_dir>/<model hash>/model.onnx and reused
+    # after that. Pooling and normalization follow the sentence-transformers
+    # modules of the original model.
+    def __init__(self, model_name: str, onnx_dir: Optional[str] = None, threads=None):
+        try:
+            # onnx is needed by torch.onnx.export, onnxruntime to run the model
+            import onnx
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                f"The 'onnx' embedding backend requires onnx and onnxruntime ({e.name} is missing). "
+                "Install them with `pip install -r requirements-onnx.txt`"
+            ) from e
+        from sentence_transformers import SentenceTransformer
+        from sentence_transformers.models import Pooling, Normalize
+
+        reference = SentenceTransformer(model_name, device="cpu")
+        self.model_name = model_name
+        self.tokenizer = reference.tokenizer
+        self.max_seq_length = reference.max_seq_length
+        self.dimension = reference.get_sentence_embedding_dimension()
+        pooling = next(
+            (module for module in reference if isinstance(module, Pooling)), None
+        )
+        self.pooling_mode = pooling.get_pooling_mode_str() if pooling else "mean"
+        if self.pooling_mode not in ("mean", "cls", "max"):
+            raise ValueError(
+                f"Pooling mode '{self.pooling_mode}' not supported by the onnx backend"
+            )
+        self.normalize = any(isinstance(module, Normalize) for module in reference)
+
+        self.path = onnx_model_path(model_name, onnx_dir)
+        if not os.path.exists(self.path):
+            export_onnx(reference, self.path)
+        del reference
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            self.path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def _pool(self, token_embeddings, attention_mask):
+        if self.pooling_mode == "cls":
+            return token_embeddings[:, 0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        if self.pooling_mode == "max":
+            return np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        return (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                list(texts[start : start + batch_size]),
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            inputs = {
+                name: encoded[name].astype(np.int64)
+                for name in self.input_names
+                if name in encoded
+            }
+            token_embeddings = self.session.run(None, inputs)[0]
+            embeddings[start : start + len(token_embeddings)] = self._pool(
+                token_embeddings, encoded["attention_mask"]
+            )
+        if self.normalize:
+            embeddings /= np.maximum(
+                np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12
+            )
+        return embeddings
+
+
+def load_model(
+    model_name: str,
+    device: str,
+    precision: str,
+    backend: str = "torch",
+    threads: Optional[int] = None,
+    onnx_dir: Optional[str] = None,
+):
+    if backend == "torch-int8":
+        return load_torch_int8(model_name, threads)
+    if backend == "onnx":
+        return OnnxEmbedder(model_name, onnx_dir, threads)
+    return load_torch(model_name, device, precision, threads)
+
+
+def parity(candidate, reference, texts: List[str]) -> dict:
+    # Cosine similarity between each text's embedding from candidate and from
+    # reference (usually the fp32 torch backend)
+    a = np.asarray(candidate.encode(texts), dtype=np.float32)
+    b = np.asarray(reference.encode(texts), dtype=np.float32)
+    cosines = (a * b).sum(axis=1) / np.maximum(
+        np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12
+    )
+    return {
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "p1_cosine": float(np.percentile(cosines, 1)),
+    }
+
+
+def throughput(model, texts: List[str], batch_size: int = 32, repeat: int = 3) -> dict:
+    # Best of repeat runs, after one warmup batch
+    model.encode(texts[:batch_size], batch_size=batch_size)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        model.encode(texts, batch_size=batch_size)
+        best = min(best, time.perf_counter() - started)
+    return {"seconds": best, "texts_per_second": len(texts) / best}
@@ -0,0 +1,358 @@
+import logging
+import os
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from typing import List, Optional
+from .ModelRegistry import DEFAULT_MODEL_NAME
+from .Quantization import (
+    quantize,
+    dequantize,
+    storage_numpy_dtypes,
+    storage_suffixes,
+    validate_storage_dtype,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between index writes made by encode_texts, see EmbeddingCache.flush
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+
+def normalize_text(text: str) -> str:
+    # Whitespace and unicode form differences should not cause cache misses
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+
+def cache_key(model_name: str, text: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    # On-disk cache of embeddings keyed by hash(model name, normalized text).
+    # Vectors live in a memory-mapped matrix (vectors.f32, .f16 or .i8 with
+    # per-row scales in scales.f32, see storage_dtype) and a SQLite index
+    # (index.sqlite) maps each key to its row and last use. Index changes are
+    # written incrementally by flush(), which encode_texts calls at most every
+    # flush_interval seconds, and at close. When max_entries is reached the
+    # least recently used rows are reused, but only once the removal of their
+    # old keys is committed, so a crash never leaves a key pointing at the
+    # vector of another text.
+    def __init__(
+        self,
+        cache_dir: str,
+        model_name: str,
+        max_entries: int = 1_000_000,
+        storage_dtype: str = "float32",
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be greater than 0")
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.storage_dtype = validate_storage_dtype(storage_dtype)
+        self.flush_interval = flush_interval
+        self.index_path = os.path.join(cache_dir, "index.sqlite")
+        self.vectors_path = os.path.join(
+            cache_dir, f"vectors.{storage_suffixes[self.storage_dtype]}"
+        )
+        self.scales_path = os.path.join(cache_dir, "scales.f32")
+        self.dimension = None
+        self.vectors = None
+        self.scales = None
+        # key -> row, ordered from least to most recently used
+        self.entries = OrderedDict()
+        # key -> (row, use) written to the index by the next flush
+        self._pending = {}
+        self._clock = 0
+        self.free_rows = []
+        self._next_row = 0
+        self.hits = 0
+        self.misses = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.connection = sqlite3.connect(self.index_path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    row INTEGER NOT NULL UNIQUE,
+                    used INTEGER NOT NULL
+                )
+                """
+            )
+        self._load()
+
+    def _remove_vector_files(self):
+        for suffix in storage_suffixes.values():
+            path = os.path.join(self.cache_dir, f"vectors.{suffix}")
+            if os.path.exists(path):
+                os.remove(path)
+        if os.path.exists(self.scales_path):
+            os.remove(self.scales_path)
+
+    def _load(self):
+        meta = dict(self.connection.execute("SELECT name, value FROM meta"))
+        if not meta.get("dimension"):
+            # Nothing was stored yet
+            self._remove_vector_files()
+            return
+
+        if (
+            int(meta["max_entries"]) != self.max_entries
+            or meta["storage_dtype"] != self.storage_dtype
+        ):
+            logger.warning(
+                "Embedding cache size or storage dtype changed, starting a new cache"
+            )
+            with self.connection:
+                self.connection.execute("DELETE FROM entries")
+                self.connection.execute("DELETE FROM meta")
+            self._remove_vector_files()
+            return
+
+        self.dimension = int(meta["dimension"])
+        rows = self.connection.execute(
+            "SELECT key, row, used FROM entries ORDER BY used"
+        ).fetchall()
+        self.entries = OrderedDict((key, row) for key, row, _ in rows)
+        self._clock = rows[-1][2] if rows else 0
+        self._open_vectors()
+        used = set(self.entries.values())
+        self._next_row = max(used) + 1 if used else 0
+        self.free_rows = [
+            row for row in range(self._next_row - 1, -1, -1) if row not in used
+        ]
+
+    def _open_vectors(self):
+        mode = "r+" if os.path.exists(self.vectors_path) else "w+"
+        self.vectors = np.memmap(
+            self.vectors_path,
+            dtype=storage_numpy_dtypes[self.storage_dtype],
+            mode=mode,
+            shape=(self.max_entries, self.dimension),
+        )
+        if self.storage_dtype == "int8":
+            mode = "r+" if os.path.exists(self.scales_path) else "w+"
+            self.scales = np.memmap(
+                self.scales_path, dtype=np.float32, mode=mode, shape=(self.max_entries,)
+            )
+
+    def _allocate_row(self, evicted: list):
+        if self.free_rows:
+            return self.free_rows.pop()
+        if self._next_row < self.max_entries:
+            row = self._next_row
+            self._next_row += 1
+            return row
+        # Evict the least recently used entry and reuse its row
+        key, row = self.entries.popitem(last=False)
+        self._pending.pop(key, None)
+        evicted.append(key)
+        return row
+
+    def _touch(self, key: str, row: int):
+        self._clock += 1
+        self.entries[key] = row
+        self.entries.move_to_end(key)
+        self._pending[key] = (row, self._clock)
+
+    def key(self, text: str) -> str:
+        return cache_key(self.model_name, text)
+
+    def get_many(self, texts: List[str]):
+        # Returns (vectors, misses): vectors[i] is None for every index in misses
+        results = [None] * len(texts)
+        misses = []
+        with self._lock:
+            for i, text in enumerate(texts):
+                key = self.key(text)
+                row = self.entries.get(key)
+                if row is None:
+                    misses.append(i)
+                    continue
+                self._touch(key, row)
+                results[i] = dequantize(
+                    self.vectors[row : row + 1],
+                    None if self.scales is None else self.scales[row : row + 1],
+                )[0]
+            self.hits += len(texts) - len(misses)
+            self.misses += len(misses)
+        return results, misses
+
+    def put_many(self, texts: List[str], vectors):
+        if len(texts) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(texts) > self.max_entries:
+            # Only the last max_entries texts would survive eviction anyway
+            texts, vectors = texts[-self.max_entries :], vectors[-self.max_entries :]
+        data, scales = quantize(vectors, self.storage_dtype)
+        with self._lock:
+            if self.vectors is None:
+                self.dimension = int(vectors.shape[1])
+                with self.connection:
+                    self.connection.executemany(
+                        "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                        [
+                            ("model_name", self.model_name),
+                            ("dimension", str(self.dimension)),
+                            ("max_entries", str(self.max_entries)),
+                            ("storage_dtype", self.storage_dtype),
+                        ],
+                    )
+                self._open_vectors()
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match cache dimension {self.dimension}"
+                )
+
+            keys = [self.key(text) for text in texts]
+            # Keys of the batch that are already cached become the most
+            # recently used first, so allocating rows below never evicts them
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+            evicted = []
+            rows = []
+            for key in keys:
+                row = self.entries.get(key)
+                if row is None:
+                    row = self._allocate_row(evicted)
+                    # Held until written below, so later texts cannot evict it
+                    self.entries[key] = row
+                rows.append(row)
+            if evicted:
+                # The evicted keys must be gone from the index before their
+                # rows are overwritten
+                with self.connection:
+                    self.connection.executemany(
+                        "DELETE FROM entries WHERE key = ?", [(key,) for key in evicted]
+                    )
+            for i, (key, row) in enumerate(zip(keys, rows)):
+                self.vectors[row] = data[i]
+                if scales is not None:
+                    self.scales[row] = scales[i]
+                self._touch(key, row)
+
+    def flush_due(self) -> bool:
+        return bool(self._pending) and (
+            time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    def flush(self):
+        # Writes the vectors, then the new entries and use order to the index
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._pending or self.vectors is None:
+                return
+            self.vectors.flush()
+            if self.scales is not None:
+                self.scales.flush()
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO entries (key, row, used) VALUES (?, ?, ?)",
+                    [(key, row, used) for key, (row, used) in self._pending.items()],
+                )
+            self._pending = {}
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.connection.close()
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "storage_dtype": self.storage_dtype,
+            "bytes": self._nbytes(),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _nbytes(self):
+        if self.vectors is None:
+            return 0
+        return self.vectors.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(
+    cache_dir: Optional[str],
+    model_name: str,
+    max_entries: int = 1_000_000,
+    storage_dtype: str = "float32",
+    flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+):
+    # One cache object per directory, model and storage dtype so processors
+    # and Retrieval share the same in-memory index
+    if not cache_dir:
+        return None
+    storage_dtype = validate_storage_dtype(storage_dtype)
+    model_dir = hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:12]
+    cache_dir = os.path.join(cache_dir, f"{model_dir}-{storage_dtype}")
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = EmbeddingCache(
+                cache_dir,
+                model_name,
+                max_entries=max_entries,
+                storage_dtype=storage_dtype,
+                flush_interval=flush_interval,
+            )
+            _caches[cache_dir] = cache
+        return cache
+
+
+def get_embedding_cache(embedding_configs=None):
+    embedding_configs = embedding_configs or {}
+    model_name = embedding_configs.get("model_name") or DEFAULT_MODEL_NAME
+    backend = (embedding_configs.get("backend") or "torch").lower()
+    precision = (embedding_configs.get("precision") or "fp32").lower()
+    # Quantized, exported and half precision models give slightly different
+    # vectors, so their entries are kept apart from the reference model's
+    model_name = f"{model_name}#{backend}#{precision}"
+    return get_cache(
+        embedding_configs.get("cache_dir"),
+        model_name,
+        max_entries=embedding_configs.get("cache_max_entries") or 1_000_000,
+        storage_dtype=embedding_configs.get("storage_dtype") or "float32",
+        flush_interval=embedding_configs.get("cache_flush_interval")
+        or DEFAULT_FLUSH_INTERVAL,
+    )
+
+
+@atexit.register
+def flush_caches():
+    # Entries added since the last timed flush are written at exit
+    with _caches_lock:
+        for cache in _caches.values():
+            try:
+                cache.flush()
+            except Exception as e:
+                logger.error(f"Error flushing embedding cache {cache.cache_dir}: {e}")
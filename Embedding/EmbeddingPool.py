@@ -0,0 +1,236 @@
+import os
+import atexit
+import asyncio
+import logging
+import threading
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing.context import SpawnContext, SpawnProcess
+from typing import List, Optional
+from .ModelRegistry import ModelRegistry, get_model
+
+logger = logging.getLogger(__name__)
+
+# Read by OpenMP, MKL and OpenBLAS once, when numpy or torch is first imported
+thread_variables = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+# Set in each worker process by _init_worker
+_worker_model = None
+
+_environ_lock = threading.Lock()
+
+
+class _PinnedSpawnProcess(SpawnProcess):
+    # Started with thread_variables set to `threads` in its environment. A
+    # spawned child imports numpy (through the parent's __main__ and this
+    # module) before any initializer runs, so the variables have to be there
+    # when it starts for the math libraries to pick them up.
+    threads = 1
+
+    def start(self):
+        with _environ_lock:
+            saved = {variable: os.environ.get(variable) for variable in thread_variables}
+            os.environ.update({variable: str(self.threads) for variable in thread_variables})
+            try:
+                super().start()
+            finally:
+                for variable, value in saved.items():
+                    if value is None:
+                        os.environ.pop(variable, None)
+                    else:
+                        os.environ[variable] = value
+
+
+class PinnedSpawnContext(SpawnContext):
+    # Spawn context whose processes run the math libraries on `threads`
+    # threads, so workers do not oversubscribe the cores
+    def __init__(self, threads: int):
+        self.threads = threads
+
+    def Process(self, *args, **kwargs):
+        process = _PinnedSpawnProcess(*args, **kwargs)
+        process.threads = self.threads
+        return process
+
+
+def _init_worker(embedding_configs, threads):
+    global _worker_model
+    _worker_model = get_model({**embedding_configs, "threads": threads})
+
+
+def _describe_worker():
+    return (
+        _worker_model.get_sentence_embedding_dimension(),
+        getattr(_worker_model, "max_seq_length", None),
+    )
+
+
+def _encode_into(shm_name, shape, rows, texts):
+    # Writes the embeddings of texts to rows of the shared (n, dimension)
+    # float32 array, so only the texts and row numbers are pickled
+    shm = SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        out[rows] = _worker_model.encode(texts, batch_size=len(texts))
+        del out
+    finally:
+        shm.close()
+    return len(rows)
+
+
+class EmbeddingPool:
+    # Shards embedding batches across worker processes, each holding its own
+    # model copy with `threads` intra-op threads. Results are written to a
+    # shared memory array and returned in input order. Stands in for the
+    # model in encode_texts and the processors: encode_texts hands all
+    # planned batches to encode_batches at once, so they run in parallel.
+    def __init__(
+        self,
+        embedding_configs=None,
+        workers: Optional[int] = None,
+        threads: Optional[int] = None,
+    ):
+        cpu_count = os.cpu_count() or 1
+        self.embedding_configs = {
+            **(embedding_configs or {}),
+            "device": (embedding_configs or {}).get("device") or "cpu",
+        }
+        self.workers = workers or max(1, cpu_count // (threads or 1))
+        self.threads = threads or max(1, cpu_count // self.workers)
+        self.tokenizer = None
+        self._executor = None
+        self._dimension = None
+        self._max_seq_length = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # Spawned rather than forked: torch and its thread pools are not fork safe
+        with self._lock:
+            if self._executor is not None:
+                return self
+            logger.info(
+                f"Starting embedding pool: {self.workers} workers x {self.threads} threads"
+            )
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=PinnedSpawnContext(self.threads),
+                initializer=_init_worker,
+                initargs=(self.embedding_configs, self.threads),
+            )
+            self._dimension, self._max_seq_length = executor.submit(
+                _describe_worker
+            ).result()
+            self._executor = executor
+        return self
+
+    @property
+    def max_seq_length(self):
+        self.start()
+        return self._max_seq_length
+
+    def get_sentence_embedding_dimension(self):
+        self.start()
+        return self._dimension
+
+    def _submit(self, texts: List[str], batches: List[List[int]]):
+        # One task per batch, all writing to the same shared memory array
+        self.start()
+        shape = (len(texts), self._dimension)
+        shm = SharedMemory(create=True, size=max(1, shape[0] * shape[1] * 4))
+        try:
+            futures = [
+                self._executor.submit(
+                    _encode_into, shm.name, shape, batch, [texts[i] for i in batch]
+                )
+                for batch in batches
+            ]
+        except BaseException:
+            self._release(shm, [])
+            raise
+        return shm, shape, futures
+
+    @staticmethod
+    def _release(shm, futures):
+        # Tasks that have not started are cancelled and running ones awaited,
+        # so no worker is still writing when the memory is unlinked
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        shm.close()
+        shm.unlink()
+
+    @staticmethod
+    def _read(shm, shape) -> np.ndarray:
+        return np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+
+    async def encode_batches(self, texts: List[str], batches: List[List[int]]):
+        # batches are lists of indexes into texts (see plan_batches)
+        shm, shape, futures = await asyncio.to_thread(self._submit, texts, batches)
+        try:
+            await asyncio.gather(*[asyncio.wrap_future(future) for future in futures])
+            return self._read(shm, shape)
+        finally:
+            await asyncio.to_thread(self._release, shm, futures)
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        batches = [
+            list(range(start, min(start + batch_size, len(texts))))
+            for start in range(0, len(texts), batch_size)
+        ]
+        shm, shape, futures = self._submit(list(texts), batches)
+        try:
+            for future in futures:
+                future.result()
+            return self._read(shm, shape)
+        finally:
+            self._release(shm, futures)
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_embedding_pool(embedding_configs=None) -> Optional[EmbeddingPool]:
+    # One pool per model (see ModelRegistry.key) and size for the whole
+    # process. None unless embedding_configs["workers"] asks for more than one
+    # worker process.
+    embedding_configs = embedding_configs or {}
+    workers = embedding_configs.get("workers")
+    if not workers or workers <= 1:
+        return None
+    threads = embedding_configs.get("worker_threads")
+    key = ModelRegistry.key(
+        embedding_configs.get("model_name"),
+        # Pools run on cpu unless a device is given, see EmbeddingPool
+        embedding_configs.get("device") or "cpu",
+        embedding_configs.get("precision"),
+        embedding_configs.get("backend"),
+    ) + (embedding_configs.get("onnx_dir"), workers, threads)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = EmbeddingPool(embedding_configs, workers, threads)
+            _pools[key] = pool
+        return pool
+
+
+def get_ingest_model(embedding_configs=None):
+    # The embedding pool when one is configured, otherwise the shared model
+    return get_embedding_pool(embedding_configs) or get_model(embedding_configs)
+
+
+@atexit.register
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
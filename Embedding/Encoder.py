@@ -0,0 +1,148 @@
+import logging
+import asyncio
+import numpy as np
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Defaults for length-bucketed batching. A batch is padded to its longest
+# text, so batches are formed from texts of similar length and sized by
+# padded tokens rather than by a fixed count.
+DEFAULT_MAX_BATCH_TOKENS = 4096
+DEFAULT_MAX_BATCH_SIZE = 256
+
+
+def estimate_token_counts(model, texts: List[str]) -> List[int]:
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is not None:
+        return [len(ids) for ids in tokenizer(list(texts), verbose=False)["input_ids"]]
+    # Rough estimate for models without a tokenizer attribute
+    return [len(text) // 4 + 2 for text in texts]
+
+
+def plan_batches(
+    token_counts: List[int],
+    max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+    max_seq_length: Optional[int] = None,
+):
+    # Returns (batches, padded_tokens, real_tokens). Each batch is a list of
+    # indexes into token_counts; len(batch) * longest text stays within
+    # max_batch_tokens (a single text longer than the budget gets its own batch).
+    if max_seq_length:
+        token_counts = [min(count, max_seq_length) for count in token_counts]
+
+    order = sorted(range(len(token_counts)), key=lambda i: token_counts[i])
+    batches = []
+    padded_tokens = 0
+    batch = []
+    batch_max = 0
+    for index in order:
+        count = token_counts[index]
+        longest = max(batch_max, count)
+        if batch and (
+            len(batch) >= max_batch_size or (len(batch) + 1) * longest > max_batch_tokens
+        ):
+            batches.append(batch)
+            padded_tokens += len(batch) * batch_max
+            batch, longest = [], count
+        batch.append(index)
+        batch_max = longest
+    if batch:
+        batches.append(batch)
+        padded_tokens += len(batch) * batch_max
+
+    return batches, padded_tokens, sum(token_counts)
+
+
+def padding_waste(padded_tokens: int, real_tokens: int) -> float:
+    # Share of the tokens in all batches that are padding
+    if padded_tokens == 0:
+        return 0.0
+    return 1 - real_tokens / padded_tokens
+
+
+async def encode_texts(
+    model,
+    texts: List[str],
+    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+    cache=None,
+    token_counts: Optional[List[int]] = None,
+    max_batch_tokens: Optional[int] = None,
+    stats: Optional[dict] = None,
+):
+    # Looks every text up in the embedding cache first and only runs the model
+    # on the misses. Misses are sorted by token length and grouped into batches
+    # of at most max_batch_tokens padded tokens and max_batch_size texts.
+    # Vectors are returned in the same order as texts. When stats
+    # is given it accumulates batches, padded_tokens, real_tokens and
+    # padding_waste across calls.
+    if stats is not None:
+        for key in ("batches", "padded_tokens", "real_tokens", "padding_waste"):
+            stats.setdefault(key, 0)
+
+    if len(texts) == 0:
+        return []
+
+    if cache is not None:
+        embeddings, misses = cache.get_many(texts)
+        logger.debug(
+            f"Embedding cache: {len(texts) - len(misses)} hits, {len(misses)} misses"
+        )
+    else:
+        embeddings, misses = [None] * len(texts), list(range(len(texts)))
+
+    if len(misses) == 0:
+        return embeddings
+
+    miss_texts = [texts[index] for index in misses]
+    if token_counts is None:
+        miss_counts = await asyncio.to_thread(estimate_token_counts, model, miss_texts)
+    else:
+        miss_counts = [token_counts[index] for index in misses]
+
+    batches, padded_tokens, real_tokens = plan_batches(
+        miss_counts,
+        max_batch_tokens=max_batch_tokens or DEFAULT_MAX_BATCH_TOKENS,
+        max_batch_size=max_batch_size,
+        max_seq_length=getattr(model, "max_seq_length", None),
+    )
+
+    encode_batches = getattr(model, "encode_batches", None)
+    if encode_batches is not None:
+        # An EmbeddingPool runs all batches at once across its worker processes
+        miss_embeddings = await encode_batches(miss_texts, batches)
+        for index, embedding in enumerate(miss_embeddings):
+            embeddings[misses[index]] = embedding
+        if cache is not None:
+            cache.put_many(miss_texts, miss_embeddings)
+    else:
+        for batch_indexes in batches:
+            batch = [miss_texts[index] for index in batch_indexes]
+            # batch_size keeps the model from re-splitting the planned batch
+            batch_embeddings = await asyncio.to_thread(
+                model.encode, batch, batch_size=len(batch)
+            )
+            for index, embedding in zip(batch_indexes, batch_embeddings):
+                embeddings[misses[index]] = embedding
+            if cache is not None:
+                cache.put_many(batch, batch_embeddings)
+
+    if cache is not None and cache.flush_due():
+        # Index writes are incremental and at most every flush_interval seconds
+        await asyncio.to_thread(cache.flush)
+
+    if stats is not None:
+        stats["batches"] += len(batches)
+        stats["padded_tokens"] += padded_tokens
+        stats["real_tokens"] += real_tokens
+        stats["padding_waste"] = padding_waste(
+            stats["padded_tokens"], stats["real_tokens"]
+        )
+
+    return embeddings
+
+
+async def encode_text(model, text: str, cache=None) -> np.ndarray:
+    embeddings = await encode_texts(model, [text], cache=cache, token_counts=[0])
+    return embeddings[0]
@@ -0,0 +1,144 @@
+import logging
+import threading
+from typing import TypedDict, Optional
+from .Backends import load_model, validate_backend, cpu_only_backends
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+
+supported_precisions = ["fp32", "fp16"]
+
+
+class EmbeddingConfigs(TypedDict):
+    model_name: Optional[str]
+    device: Optional[str]
+    precision: Optional[str]
+    backend: Optional[str]
+    threads: Optional[int]
+    onnx_dir: Optional[str]
+
+
+default_embedding_configs: EmbeddingConfigs = {
+    "model_name": DEFAULT_MODEL_NAME,
+    "device": None,
+    "precision": "fp32",
+    "backend": "torch",
+    "threads": None,
+    "onnx_dir": None,
+}
+
+
+def default_device() -> str:
+    # torch and sentence_transformers take seconds to import, so they are
+    # loaded when a model is first needed rather than with this module
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class ModelRegistry:
+    # One model instance per (model_name, device, precision, backend) for the
+    # whole process, shared by PineconeRag, both processors and Retrieval.
+    # threads and onnx_dir only apply when the model is first loaded.
+    _models = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def key(cls, model_name=None, device=None, precision=None, backend=None):
+        precision = (precision or "fp32").lower()
+        if precision not in supported_precisions:
+            raise ValueError(
+                f"Precision '{precision}' not supported. Supported precisions: {', '.join(supported_precisions)}"
+            )
+        backend = validate_backend(backend)
+        if backend in cpu_only_backends:
+            if precision != "fp32":
+                raise ValueError(f"Backend '{backend}' only supports fp32 precision")
+            if device not in (None, "cpu"):
+                logger.warning(f"Backend '{backend}' runs on cpu, ignoring device {device}")
+            device = "cpu"
+        return (
+            model_name or DEFAULT_MODEL_NAME,
+            device or default_device(),
+            precision,
+            backend,
+        )
+
+    @classmethod
+    def get(
+        cls,
+        model_name=None,
+        device=None,
+        precision=None,
+        backend=None,
+        threads=None,
+        onnx_dir=None,
+    ):
+        key = cls.key(model_name, device, precision, backend)
+        model = cls._models.get(key)
+        if model is not None:
+            return model
+
+        with cls._lock:
+            # Another thread may have finished loading while we waited on the lock
+            model = cls._models.get(key)
+            if model is None:
+                model = cls._load(*key, threads=threads, onnx_dir=onnx_dir)
+                cls._models[key] = model
+        return model
+
+    @classmethod
+    def _load(cls, model_name, device, precision, backend, threads=None, onnx_dir=None):
+        logger.info(
+            f"Loading sentence transformer model: {model_name} ({backend}, {device}, {precision})"
+        )
+        return load_model(model_name, device, precision, backend, threads, onnx_dir)
+
+    @classmethod
+    def warmup(
+        cls,
+        model_name=None,
+        device=None,
+        precision=None,
+        backend=None,
+        threads=None,
+        onnx_dir=None,
+    ):
+        model = cls.get(model_name, device, precision, backend, threads, onnx_dir)
+        # A first forward pass initializes kernels and thread pools
+        model.encode(["warmup"])
+        return model
+
+    @classmethod
+    def loaded(cls):
+        return list(cls._models.keys())
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._models.clear()
+
+
+def get_model(embedding_configs: Optional[EmbeddingConfigs] = None):
+    embedding_configs = embedding_configs or {}
+    return ModelRegistry.get(
+        embedding_configs.get("model_name"),
+        embedding_configs.get("device"),
+        embedding_configs.get("precision"),
+        embedding_configs.get("backend"),
+        embedding_configs.get("threads"),
+        embedding_configs.get("onnx_dir"),
+    )
+
+
+def warmup(embedding_configs: Optional[EmbeddingConfigs] = None):
+    embedding_configs = embedding_configs or {}
+    return ModelRegistry.warmup(
+        embedding_configs.get("model_name"),
+        embedding_configs.get("device"),
+        embedding_configs.get("precision"),
+        embedding_configs.get("backend"),
+        embedding_configs.get("threads"),
+        embedding_configs.get("onnx_dir"),
+    )
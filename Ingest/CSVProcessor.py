@@ -1,11 +1,17 @@
-from sentence_transformers import SentenceTransformer
+import io
+import logging
 import os
-import pandas as pd
-import torch
 import asyncio
-from transformers import AutoTokenizer
+from Embedding.EmbeddingPool import get_ingest_model
+from .Chunker import Chunker
+from .Processor import Processor
+from .RecordBatch import RecordBatch
+from .Pipeline import DEFAULT_BATCH_SIZE
+from Instrumentation.Metrics import metrics
 from typing import TypedDict, Optional
 
+logger = logging.getLogger(__name__)
+
 
 class Configs(TypedDict):
     file_name: str
@@ -13,6 +19,11 @@ class Configs(TypedDict):
     text_column: str
     start_row: Optional[int]
     end_row: Optional[int]
+    start_byte: Optional[int]
+    end_byte: Optional[int]
+    chunk_size: Optional[int]
+    chunk_tokens: Optional[int]
+    chunk_overlap: Optional[int]
 
 
 default_configs: Configs = {
@@ -21,54 +32,144 @@ default_configs: Configs = {
     "text_column": "text",
     "start_row": 0,
     "end_row": None,
+    # Byte range of rows start_row to end_row, when known (see
+    # IngestScheduler.plan). The reader seeks to start_byte instead of
+    # parsing and skipping the rows before it.
+    "start_byte": None,
+    "end_byte": None,
+    # Rows per chunk when streaming. None reads the whole file at once.
+    "chunk_size": None,
+    # Max tokens per chunk, longer cells are split. None uses the model's max
+    # sequence length.
+    "chunk_tokens": None,
+    # Tokens shared by consecutive chunks of a split cell
+    "chunk_overlap": None,
 }
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-
-
-def count_tokens(text: str) -> int:
-    tokenizer = AutoTokenizer.from_pretrained(
-        "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
-    )
-    encoding = tokenizer.encode_plus(text, add_special_tokens=True)
-    return len(encoding["input_ids"])
 
-
-class CSVProcessor:
-    def __init__(self, configs: Configs = default_configs):
-        print("Initializing CSVProcessor...")
+class CSVProcessor(Processor):
+    def __init__(
+        self,
+        configs: Configs = default_configs,
+        model=None,
+        embedding_cache=None,
+        embedding_configs=None,
+    ):
+        logger.debug("Initializing CSVProcessor...")
         if not configs["file_name"]:
             raise ValueError("File name is required")
         try:
             self.configs = configs
             self.raw_text_content = []
+            self.chunks = []  # Chunk text with row/offset provenance
             self.embedded_text_content = []
-            self.final_records_to_upsert = []
+            # Columnar records to upsert, see RecordBatch
+            self.final_records_to_upsert = RecordBatch.from_chunks([], [])
 
-            print(
-                f"Loading sentence transformer model for file: {self.configs['file_name']}"
+            # Reuse the process-wide model (or embedding pool, when
+            # embedding_configs["workers"] is set) instead of loading a copy
+            self.model = (
+                model if model is not None else get_ingest_model(embedding_configs)
             )
-            self.model = SentenceTransformer(
-                "sentence-transformers/paraphrase-multilingual-mpnet-base-v2",
-                device=device,
+            self.embedding_cache = embedding_cache
+            self.embedding_configs = embedding_configs or {}
+            # Batches, padded/real tokens and padding_waste of the embedding step
+            self.embedding_stats = {}
+            # Ids of every chunk in the file and ids that are already upserted
+            self.seen_ids = set()
+            self.skip_ids = set()
+            self.chunker = Chunker(
+                max_tokens=configs.get("chunk_tokens")
+                or getattr(self.model, "max_seq_length", None),
+                overlap=configs.get("chunk_overlap"),
+                # Windows are measured with the tokenizer of the model that embeds them
+                model_name=self.embedding_configs.get("model_name"),
             )
-            print("CSVProcessor initialized successfully")
+            logger.debug("CSVProcessor initialized successfully")
         except Exception as e:
-            print(f"Error initializing CSVProcessor: {e}")
+            logger.error(f"Error initializing CSVProcessor: {e}")
             raise
 
-    def get_reader(self):
-        print("Getting CSV reader...")
+    def get_csv_path(self):
         root_dir = os.path.dirname(os.path.dirname(__file__))
-        csv_path = os.path.join(root_dir, "data_files", self.configs["file_name"])
-        print(f"Attempting to read CSV from: {csv_path}")
+        return os.path.join(root_dir, "data_files", self.configs["file_name"])
+
+    def get_reader(self):
+        logger.debug("Getting CSV reader...")
+        csv_path = self.get_csv_path()
+        logger.debug(f"Attempting to read CSV from: {csv_path}")
+        import pandas as pd
+
         df = pd.read_csv(csv_path)
-        print("CSV reader obtained successfully")
+        logger.debug("CSV reader obtained successfully")
         return df
 
+    def get_chunked_reader(self):
+        # Only text_column is parsed. Rows before start_row are skipped by
+        # seeking to start_byte when it is set, or by the parser otherwise,
+        # instead of being loaded and sliced off afterwards
+        start_from = self.configs.get("start_row") or 0
+        end_on = self.configs.get("end_row")
+        if end_on is not None and start_from > end_on:
+            raise ValueError("File config error: start_row cannot be greater than end_row")
+
+        csv_path = self.get_csv_path()
+        logger.debug(f"Streaming CSV from: {csv_path}")
+        import pandas as pd
+
+        try:
+            if self.configs.get("start_byte") is not None:
+                return pd.read_csv(
+                    self.read_byte_range(csv_path),
+                    header=None,
+                    names=pd.read_csv(csv_path, nrows=0).columns,
+                    usecols=[self.configs["text_column"]],
+                    chunksize=self.configs["chunk_size"],
+                )
+            return pd.read_csv(
+                csv_path,
+                usecols=[self.configs["text_column"]],
+                skiprows=range(1, start_from + 1) if start_from else None,
+                nrows=end_on - start_from if end_on is not None else None,
+                chunksize=self.configs["chunk_size"],
+            )
+        except ValueError as e:
+            if "Usecols" in str(e):
+                raise ValueError(
+                    f"Column '{self.configs['text_column']}' not found in CSV"
+                ) from e
+            raise
+
+    def read_byte_range(self, csv_path):
+        # One unit's rows (see rows_per_unit), not the whole file
+        with open(csv_path, "rb") as f:
+            f.seek(self.configs["start_byte"])
+            end_byte = self.configs.get("end_byte")
+            return io.BytesIO(
+                f.read(end_byte - self.configs["start_byte"]) if end_byte else f.read()
+            )
+
+    def iter_text_chunks(self):
+        # Yields (offset, texts) where offset is the position of the first row
+        # of the chunk relative to start_row
+        offset = 0
+        with self.get_chunked_reader() as reader:
+            while True:
+                with metrics.stage("extract") as stage:
+                    chunk = next(reader, None)
+                    if chunk is not None:
+                        texts = chunk[self.configs["text_column"]].tolist()
+                        stage.add(rows=len(texts))
+                if chunk is None:
+                    return
+                yield offset, texts
+                offset += len(texts)
+
     async def extract_text_content(self):
-        print("Starting text extraction from CSV...")
-        df = self.get_reader()
+        logger.debug("Starting text extraction from CSV...")
+        with metrics.stage("extract") as stage:
+            df = self.get_reader()
+            stage.add(rows=len(df))
 
         if self.configs["text_column"] not in df.columns:
             raise ValueError(f"Column '{self.configs['text_column']}' not found in CSV")
@@ -76,77 +177,82 @@ class CSVProcessor:
         start_from = self.configs["start_row"] or 0
         end_on = self.configs["end_row"] or len(df)
 
-        print(f"Processing rows from {start_from} to {end_on}...")
-        self.raw_text_content = (
-            df[self.configs["text_column"]].iloc[start_from:end_on].tolist()
-        )
-        print(
-            f"Completed text extraction. Total rows processed: {len(self.raw_text_content)}"
+        logger.debug(f"Processing rows from {start_from} to {end_on}...")
+        texts = df[self.configs["text_column"]].iloc[start_from:end_on].tolist()
+        self.chunks = self.chunk_rows(texts, first_row=start_from)
+        self.raw_text_content = [chunk["text"] for chunk in self.chunks]
+        logger.info(
+            f"Completed text extraction. Total rows processed: {len(texts)}, chunks: {len(self.seen_ids)}, new or changed: {len(self.chunks)}"
         )
 
-    async def embeded_text_content(self):
-        print("Starting text embedding process...")
-        raw_text_content = self.raw_text_content
+    def chunk_rows(self, texts, first_row):
+        with metrics.stage("chunk") as stage:
+            chunks = self.chunker.chunk_texts(texts, first_row=first_row)
+            stage.add(
+                rows=len(texts),
+                chunks=len(chunks),
+                tokens=sum(chunk["token_count"] for chunk in chunks),
+            )
+        return self.assign_ids(chunks)
 
-        if len(raw_text_content) == 0:
-            print("No text content to process")
-            return
+    async def stream_records(self):
+        # Generator pipeline for large files: each chunk is read, embedded and
+        # turned into records before the next one is read, so peak memory is
+        # bounded by chunk_size instead of the file size
+        if not self.configs.get("chunk_size"):
+            raise ValueError("chunk_size is required to stream a CSV")
 
-        print("Encoding text content...")
-        batch_size = 32
-        self.embedded_text_content = []
-        for i in range(0, len(raw_text_content), batch_size):
-            batch = raw_text_content[i : i + batch_size]
-            embeddings = await asyncio.to_thread(self.model.encode, batch)
-            self.embedded_text_content.extend(embeddings)
-        print("Embedded text content generated successfully")
-
-    async def prepare_records_for_upsert(self):
-        print("Preparing records for Pinecone upsert...")
-
-        if len(self.embedded_text_content) == 0:
-            print("No embeddings generated")
-            raise ValueError("No embeddings to upsert")
-
-        print("Structuring embeddings for upsert...")
-        self.final_records_to_upsert = []
-
-        for index, (original_text, embedding) in enumerate(
-            zip(self.raw_text_content, self.embedded_text_content)
-        ):
-            record = {
-                "id": str(index),
-                "values": embedding,
-                "metadata": {"original_text": original_text},
-            }
-            if index < 5:
-                print(record)
-            self.final_records_to_upsert.append(record)
-
-        print(
-            f"Prepared {len(self.final_records_to_upsert)} records for Pinecone upsert"
-        )
+        logger.debug("Starting streaming CSV processing...")
+        start_from = self.configs.get("start_row") or 0
+        total = 0
+        for offset, texts in self.iter_text_chunks():
+            chunks = self.chunk_rows(texts, first_row=start_from + offset)
+            if len(chunks) == 0:
+                continue
+            embeddings = await self.encode_chunks(chunks)
+            records = [
+                {
+                    "id": chunk["id"],
+                    "values": embedding,
+                    "metadata": {"original_text": chunk["text"], **chunk["metadata"]},
+                }
+                for chunk, embedding in zip(chunks, embeddings)
+            ]
+            total += len(records)
+            logger.debug(f"Prepared {total} records so far")
+            yield records
 
-    
-    def get_text_content(self):
-        print("Retrieving text content...")
-        return self.raw_text_content
+        logger.info(
+            f"Streaming CSV processing completed. Total chunks processed: {total}"
+        )
 
-    def get_embeded_text_content(self):
-        print("Retrieving embedded text content...")
-        return self.embedded_text_content
+    async def iter_text_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        # Pipeline extract stage. Chunks are read off the event loop so the
+        # embed and upsert stages keep running while the parser works.
+        if not self.configs.get("chunk_size"):
+            await self.extract_text_content()
+            for batch in self._batch_chunks(self.chunks, batch_size):
+                yield batch
+            return
 
-    def get_pinecone_records(self):
-        print("Retrieving Pinecone records...")
-        return self.final_records_to_upsert
+        start_from = self.configs.get("start_row") or 0
+        reader = self.iter_text_chunks()
+        while True:
+            next_chunk = await asyncio.to_thread(next, reader, None)
+            if next_chunk is None:
+                break
+            offset, texts = next_chunk
+            chunks = self.chunk_rows(texts, first_row=start_from + offset)
+            for batch in self._batch_chunks(chunks, batch_size):
+                yield batch
 
     async def run(self, return_records=False):
-        print("Starting CSV processing pipeline...")
+        logger.debug("Starting CSV processing pipeline...")
         await self.extract_text_content()
         await self.embeded_text_content()
         await self.prepare_records_for_upsert()
 
-        print("CSV processing completed")
+        logger.info("CSV processing completed")
 
         if return_records:
             return self.get_pinecone_records()
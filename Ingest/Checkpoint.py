@@ -0,0 +1,248 @@
+import os
+import json
+import shutil
+import asyncio
+import hashlib
+import logging
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from .Pipeline import IngestPipeline, DEFAULT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def _fsync_write(path: str, write):
+    # Written to a temporary file and renamed, so a shard is either complete
+    # or absent after a crash
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def checkpoint_key(file_path: str, configs: dict) -> str:
+    # One checkpoint per source file, range, model and chunking settings
+    digest = hashlib.sha256()
+    digest.update(os.path.abspath(file_path).encode("utf-8"))
+    digest.update(json.dumps(configs, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class CheckpointedRecords(list):
+    # Records of one batch, tagged with the shard they came from so the
+    # upsert stage can acknowledge it
+    def __init__(self, records, shard: int):
+        super().__init__(records)
+        self.shard = shard
+
+
+class Checkpoint:
+    # Append-only record of an ingestion run under <checkpoint_dir>/<key>/:
+    #
+    #   meta.json               source file size and mtime, settings
+    #   chunks-000001.jsonl     extracted chunks of batch 1
+    #   vectors-000001.npy      their embeddings, same row order
+    #   acks.log                one shard number per line once it is upserted
+    #   extracted.json          written when extraction finished, with seen ids
+    #
+    # Shards are written before the next stage uses them and acks after the
+    # upsert returns, so a crash loses at most the batches in flight. A resumed
+    # run skips acknowledged batches and reuses stored chunks and vectors.
+    # A changed source file or settings start a new checkpoint.
+    def __init__(self, checkpoint_dir: str, file_path: str, configs: Optional[dict] = None):
+        configs = configs or {}
+        self.path = os.path.join(checkpoint_dir, checkpoint_key(file_path, configs))
+        self.file_path = file_path
+        stat = os.stat(file_path)
+        self.meta = {
+            "source": os.path.abspath(file_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "configs": json.loads(json.dumps(configs, default=str)),
+        }
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["size"] != self.meta["size"] or meta["mtime"] != self.meta["mtime"]:
+                logger.info(f"Source changed since checkpoint {self.path}, starting over")
+                shutil.rmtree(self.path)
+        os.makedirs(self.path, exist_ok=True)
+        if not os.path.exists(meta_path):
+            _fsync_write(meta_path, lambda f: f.write(json.dumps(self.meta).encode("utf-8")))
+
+        self.acked_shards = set()
+        acks_path = os.path.join(self.path, "acks.log")
+        if os.path.exists(acks_path):
+            with open(acks_path, "r", encoding="utf-8") as f:
+                # A torn last line is ignored
+                self.acked_shards = {
+                    int(line) for line in f.read().split("\n")[:-1] if line.strip()
+                }
+
+        self.shards = sorted(
+            int(name[len("chunks-") : -len(".jsonl")])
+            for name in os.listdir(self.path)
+            if name.startswith("chunks-") and name.endswith(".jsonl")
+        )
+        self.next_shard = (self.shards[-1] + 1) if self.shards else 1
+        # Shards written by this run. Unacknowledged chunks of an interrupted
+        # extraction are extracted again into new shards, which supersede the
+        # old ones.
+        self.written_shards = []
+
+        # id -> (shard, row) of every stored vector
+        self.vector_rows: Dict[str, Tuple[int, int]] = {}
+        self.acked_ids = set()
+        for shard in self.shards:
+            ids = [chunk["id"] for chunk in self.read_chunks(shard)]
+            if shard in self.acked_shards:
+                self.acked_ids.update(ids)
+            if os.path.exists(self._vectors_path(shard)):
+                for row, record_id in enumerate(ids):
+                    self.vector_rows[record_id] = (shard, row)
+
+        self.extracted = None
+        extracted_path = os.path.join(self.path, "extracted.json")
+        if os.path.exists(extracted_path):
+            with open(extracted_path, "r", encoding="utf-8") as f:
+                self.extracted = json.load(f)
+
+        if self.shards:
+            logger.info(
+                f"Resuming from checkpoint {self.path}: {len(self.acked_shards)} of {len(self.shards)} batches upserted, "
+                f"{len(self.vector_rows)} vectors stored"
+            )
+
+    def _chunks_path(self, shard: int) -> str:
+        return os.path.join(self.path, f"chunks-{shard:06d}.jsonl")
+
+    def _vectors_path(self, shard: int) -> str:
+        return os.path.join(self.path, f"vectors-{shard:06d}.npy")
+
+    def read_chunks(self, shard: int) -> List[dict]:
+        with open(self._chunks_path(shard), "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def write_chunks(self, chunks: List[dict]) -> int:
+        with self._lock:
+            shard = self.next_shard
+            self.next_shard += 1
+        content = "".join(json.dumps(chunk, default=int) + "\n" for chunk in chunks)
+        _fsync_write(self._chunks_path(shard), lambda f: f.write(content.encode("utf-8")))
+        with self._lock:
+            self.shards.append(shard)
+            self.written_shards.append(shard)
+        return shard
+
+    def write_vectors(self, shard: int, ids: List[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        _fsync_write(self._vectors_path(shard), lambda f: np.save(f, vectors))
+        for row, record_id in enumerate(ids):
+            self.vector_rows[record_id] = (shard, row)
+
+    def read_vectors(self, ids: List[str]) -> List[Optional[np.ndarray]]:
+        # Stored vector of each id, None where there is none
+        loaded = {}
+        vectors = []
+        for record_id in ids:
+            location = self.vector_rows.get(record_id)
+            if location is None:
+                vectors.append(None)
+                continue
+            shard, row = location
+            if shard not in loaded:
+                loaded[shard] = np.load(self._vectors_path(shard), mmap_mode="r")
+            vectors.append(np.array(loaded[shard][row]))
+        return vectors
+
+    def ack(self, shard: int, ids: List[str]):
+        with self._lock:
+            with open(os.path.join(self.path, "acks.log"), "a", encoding="utf-8") as f:
+                f.write(f"{shard}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.acked_shards.add(shard)
+            self.acked_ids.update(ids)
+
+    def mark_extracted(self, seen_ids):
+        # Only the shards of this extraction pass are replayed on resume
+        self.extracted = {
+            "seen_ids": sorted(seen_ids),
+            "shards": sorted(self.written_shards),
+        }
+        _fsync_write(
+            os.path.join(self.path, "extracted.json"),
+            lambda f: f.write(json.dumps(self.extracted).encode("utf-8")),
+        )
+
+    def remove(self):
+        # Called once every batch is upserted
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def checkpointed_pipeline(
+    processor,
+    checkpoint: Checkpoint,
+    upsert,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    configs: Optional[dict] = None,
+) -> IngestPipeline:
+    # IngestPipeline over processor whose batches go through checkpoint:
+    # extracted batches are stored as chunk shards, embeddings as .npy shards
+    # and each upsert is acknowledged. upsert(records) writes one batch.
+
+    async def source():
+        if checkpoint.extracted is not None:
+            # Extraction finished in an earlier run: replay the stored chunks
+            processor.seen_ids = set(checkpoint.extracted["seen_ids"])
+            for shard in checkpoint.extracted["shards"]:
+                if shard in checkpoint.acked_shards:
+                    continue
+                yield shard, await asyncio.to_thread(checkpoint.read_chunks, shard)
+            return
+
+        async for batch in processor.iter_text_batches(batch_size=batch_size):
+            pending = [chunk for chunk in batch if chunk["id"] not in checkpoint.acked_ids]
+            if not pending:
+                continue
+            shard = await asyncio.to_thread(checkpoint.write_chunks, pending)
+            yield shard, pending
+        await asyncio.to_thread(checkpoint.mark_extracted, processor.seen_ids)
+
+    async def embed(item):
+        shard, batch = item
+        ids = [chunk["id"] for chunk in batch]
+        vectors = await asyncio.to_thread(checkpoint.read_vectors, ids)
+        misses = [i for i, vector in enumerate(vectors) if vector is None]
+        if misses:
+            embeddings = await processor.encode_chunks([batch[i] for i in misses])
+            for i, embedding in zip(misses, embeddings):
+                vectors[i] = embedding
+            await asyncio.to_thread(checkpoint.write_vectors, shard, ids, np.stack(vectors))
+        return CheckpointedRecords(
+            [
+                {
+                    "id": chunk["id"],
+                    "values": vector,
+                    "metadata": {"original_text": chunk["text"], **chunk["metadata"]},
+                }
+                for chunk, vector in zip(batch, vectors)
+            ],
+            shard,
+        )
+
+    async def upsert_and_ack(records):
+        await upsert(records)
+        await asyncio.to_thread(
+            checkpoint.ack, records.shard, [record["id"] for record in records]
+        )
+
+    return IngestPipeline(source=source, embed=embed, upsert=upsert_and_ack, configs=configs)
@@ -0,0 +1,158 @@
+from bisect import bisect_right
+from functools import lru_cache
+from typing import List, TypedDict, Optional
+from Embedding.ModelRegistry import DEFAULT_MODEL_NAME
+
+# Max sequence length of the default sentence transformer. Text past this
+# window is truncated by the model and never embedded.
+DEFAULT_MAX_TOKENS = 128
+DEFAULT_OVERLAP = 16
+
+
+class Chunk(TypedDict, total=False):
+    # Record id, assigned by the processor (see Manifest.make_record_id)
+    id: str
+    text: str
+    # Model input length, special tokens included
+    token_count: int
+    # Provenance stored with the record, e.g. page/end_page/start_offset/end_offset
+    # for PDFs or row/start_offset/end_offset for CSVs
+    metadata: dict
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name: str = DEFAULT_MODEL_NAME):
+    # Loaded once per model name, the fast (Rust) tokenizer is required for
+    # offset mappings and batched encoding
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(model_name, use_fast=True)
+
+
+def count_tokens_batch(
+    texts: List[str], model_name: str = DEFAULT_MODEL_NAME
+) -> List[int]:
+    if len(texts) == 0:
+        return []
+    encodings = get_tokenizer(model_name)(
+        list(texts), add_special_tokens=True, verbose=False
+    )
+    return [len(input_ids) for input_ids in encodings["input_ids"]]
+
+
+def count_tokens(text: str, model_name: str = DEFAULT_MODEL_NAME) -> int:
+    return count_tokens_batch([text], model_name)[0]
+
+
+class Chunker:
+    # Splits text into windows that fit the model's max sequence length,
+    # with `overlap` tokens repeated between consecutive windows.
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        overlap: Optional[int] = None,
+        model_name: Optional[str] = None,
+    ):
+        self.max_tokens = max_tokens or DEFAULT_MAX_TOKENS
+        self.overlap = DEFAULT_OVERLAP if overlap is None else overlap
+        model_name = model_name or DEFAULT_MODEL_NAME
+        self.model_name = model_name
+        self.tokenizer = get_tokenizer(model_name)
+        # Room for the special tokens the model adds around every input
+        self.special_tokens = self.tokenizer.num_special_tokens_to_add()
+        self.window = self.max_tokens - self.special_tokens
+
+        if self.window <= 0:
+            raise ValueError("max_tokens is too small for the model's special tokens")
+        if not 0 <= self.overlap < self.window:
+            raise ValueError(
+                f"overlap must be between 0 and {self.window - 1} for max_tokens={self.max_tokens}"
+            )
+
+    def _encode(self, texts: List[str]):
+        return self.tokenizer(
+            texts,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            verbose=False,
+        )["offset_mapping"]
+
+    def _windows(self, offsets):
+        # Yields (start_char, end_char, token_count) for each window
+        if len(offsets) == 0:
+            return
+        step = self.window - self.overlap
+        start = 0
+        while True:
+            end = min(start + self.window, len(offsets))
+            token_count = end - start + self.special_tokens
+            yield offsets[start][0], offsets[end - 1][1], token_count
+            if end == len(offsets):
+                return
+            start += step
+
+    def chunk_pages(self, pages: List[str], first_page: int = 0) -> List[Chunk]:
+        # Pages are joined into one document so chunks can span page breaks.
+        # Each chunk records the page it starts and ends on and its character
+        # offsets within those pages.
+        page_starts = []
+        parts = []
+        position = 0
+        for page in pages:
+            page = (page or "").strip()
+            page_starts.append(position)
+            parts.append(page)
+            position += len(page) + 1
+        document = "\n".join(parts)
+
+        def locate(char_offset):
+            index = bisect_right(page_starts, char_offset) - 1
+            return index, char_offset - page_starts[index]
+
+        chunks = []
+        for start_char, end_char, token_count in self._windows(
+            self._encode([document])[0]
+        ):
+            page, start_offset = locate(start_char)
+            end_page, end_offset = locate(end_char - 1)
+            chunks.append(
+                {
+                    "text": document[start_char:end_char],
+                    "token_count": token_count,
+                    "metadata": {
+                        "page": first_page + page,
+                        "end_page": first_page + end_page,
+                        "start_offset": start_offset,
+                        "end_offset": end_offset + 1,
+                    },
+                }
+            )
+        return chunks
+
+    def chunk_texts(self, texts: List[str], first_row: int = 0) -> List[Chunk]:
+        # One chunk per short text, several overlapping chunks for long ones.
+        # Blank and non-string values (e.g. empty CSV cells) produce no chunks.
+        rows = [
+            (first_row + index, text)
+            for index, text in enumerate(texts)
+            if isinstance(text, str) and text.strip()
+        ]
+        if len(rows) == 0:
+            return []
+
+        chunks = []
+        all_offsets = self._encode([text for _, text in rows])
+        for (row, text), offsets in zip(rows, all_offsets):
+            for start_char, end_char, token_count in self._windows(offsets):
+                chunks.append(
+                    {
+                        "text": text[start_char:end_char],
+                        "token_count": token_count,
+                        "metadata": {
+                            "row": row,
+                            "start_offset": start_char,
+                            "end_offset": end_char,
+                        },
+                    }
+                )
+        return chunks
@@ -0,0 +1,273 @@
+import os
+import zlib
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional
+from Instrumentation.Metrics import metrics
+from .PDFProcessor import extract_pages
+
+logger = logging.getLogger(__name__)
+
+# Keys of PDF objects left out of page fingerprints: back references, and
+# embedded font programs and images, which extract_text() does not read
+_skipped_keys = {"/Parent", "/FontFile", "/FontFile2", "/FontFile3", "/Thumb"}
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+def file_hash(path: str) -> str:
+    # sha256 of the file content, memoized per path, size and mtime so the
+    # units of one file (see IngestScheduler) read it once
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        if key in _file_hashes:
+            return _file_hashes[key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    with _file_hashes_lock:
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+
+def _update_digest(digest, obj, memo: dict, depth: int = 0):
+    # Hashes a PDF object and everything it references. Shared objects (fonts,
+    # forms) are hashed once per reader through memo.
+    from PyPDF2.generic import (
+        ArrayObject,
+        DictionaryObject,
+        IndirectObject,
+        StreamObject,
+    )
+
+    if depth > 32:
+        return
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key not in memo:
+            memo[key] = b""  # cycles hash as empty
+            inner = hashlib.sha256()
+            _update_digest(inner, obj.get_object(), memo, depth + 1)
+            memo[key] = inner.digest()
+        digest.update(memo[key])
+        return
+    if isinstance(obj, DictionaryObject):
+        if obj.get("/Subtype") == "/Image":
+            digest.update(b"image")
+            return
+        digest.update(b"<<")
+        for key in sorted(obj.keys()):
+            if key in _skipped_keys:
+                continue
+            digest.update(str(key).encode("utf-8"))
+            _update_digest(digest, obj.raw_get(key), memo, depth + 1)
+        if isinstance(obj, StreamObject):
+            # Still encoded: identifies the content without decompressing it
+            data = obj._data or b""
+            digest.update(b"stream")
+            digest.update(data.encode("latin-1") if isinstance(data, str) else data)
+        digest.update(b">>")
+        return
+    if isinstance(obj, ArrayObject):
+        digest.update(b"[")
+        for item in obj:
+            _update_digest(digest, item, memo, depth + 1)
+        digest.update(b"]")
+        return
+    digest.update(repr(obj).encode("utf-8"))
+
+
+def page_fingerprints(pdf_path: str, pages: List[int]) -> Dict[int, str]:
+    # Fingerprint of everything extract_text() reads for each page: content
+    # streams, inherited resources (fonts, encodings, forms) and rotation,
+    # plus the PyPDF2 version. Equal fingerprints give equal text, so pages
+    # kept when a document is appended to or edited are not extracted again.
+    from PyPDF2 import PdfReader, __version__
+
+    reader = PdfReader(pdf_path)
+    memo = {}
+    fingerprints = {}
+    for index in pages:
+        page = reader.pages[index]
+        digest = hashlib.sha256(f"PyPDF2 {__version__}".encode("utf-8"))
+        for key in ("/Contents", "/Resources", "/Rotate"):
+            digest.update(key.encode("utf-8"))
+            if key in page:
+                _update_digest(digest, page.raw_get(key), memo)
+            elif key == "/Resources":
+                # Inherited from the page tree
+                parent = page["/Parent"] if "/Parent" in page else None
+                while parent is not None and "/Resources" not in parent:
+                    parent = parent["/Parent"] if "/Parent" in parent else None
+                if parent is not None:
+                    _update_digest(digest, parent.raw_get("/Resources"), memo)
+        fingerprints[index] = digest.hexdigest()
+    return fingerprints
+
+
+class ExtractionCache:
+    # SQLite store of extracted PDF page text. Page texts are zlib compressed
+    # and stored once per page fingerprint; documents map (file content hash,
+    # page index) to fingerprints, and files hold page counts. An unchanged
+    # file is served without opening it in PyPDF2; a changed or appended one
+    # only extracts pages whose fingerprint was never seen.
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pages (
+                    fingerprint TEXT PRIMARY KEY,
+                    text BLOB NOT NULL
+                )
+                """
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    file_hash TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    PRIMARY KEY (file_hash, page)
+                )
+                """
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    file_hash TEXT PRIMARY KEY,
+                    page_count INTEGER NOT NULL
+                )
+                """
+            )
+
+    def page_count(self, pdf_path: str) -> int:
+        key = file_hash(pdf_path)
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT page_count FROM files WHERE file_hash = ?", (key,)
+            ).fetchone()
+        if row is not None:
+            return row[0]
+        from PyPDF2 import PdfReader
+
+        count = len(PdfReader(pdf_path).pages)
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (file_hash, page_count) VALUES (?, ?)",
+                (key, count),
+            )
+        return count
+
+    def get_document_pages(self, key: str, start: int, end: int) -> Dict[int, str]:
+        # page index -> text of the cached pages of file hash key in [start, end)
+        with self._lock:
+            rows = self.connection.execute(
+                """
+                SELECT documents.page, pages.text FROM documents
+                JOIN pages ON pages.fingerprint = documents.fingerprint
+                WHERE documents.file_hash = ? AND documents.page >= ? AND documents.page < ?
+                """,
+                (key, start, end),
+            ).fetchall()
+        return {page: zlib.decompress(text).decode("utf-8") for page, text in rows}
+
+    def get_texts(self, fingerprints: List[str]) -> Dict[str, str]:
+        texts = {}
+        with self._lock:
+            # Under SQLite's default limit of 999 parameters per statement
+            for start in range(0, len(fingerprints), 500):
+                part = fingerprints[start : start + 500]
+                rows = self.connection.execute(
+                    f"SELECT fingerprint, text FROM pages WHERE fingerprint IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                for fingerprint, text in rows:
+                    texts[fingerprint] = zlib.decompress(text).decode("utf-8")
+        return texts
+
+    def put_pages(self, key: str, fingerprints: Dict[int, str], texts: Dict[str, str]):
+        # fingerprints maps page index -> fingerprint, texts fingerprint -> new text
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO pages (fingerprint, text) VALUES (?, ?)",
+                [
+                    (fingerprint, zlib.compress(text.encode("utf-8")))
+                    for fingerprint, text in texts.items()
+                ],
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO documents (file_hash, page, fingerprint) VALUES (?, ?, ?)",
+                [(key, page, fingerprint) for page, fingerprint in fingerprints.items()],
+            )
+
+    async def extract(
+        self, pdf_path: str, start: int, end: int, workers: int, executor=None
+    ) -> List[str]:
+        # Text of pages [start, end), in order, like extract_pages
+        key = await asyncio.to_thread(file_hash, pdf_path)
+        cached = await asyncio.to_thread(self.get_document_pages, key, start, end)
+        missing = [page for page in range(start, end) if page not in cached]
+        if not missing:
+            metrics.inc("extraction_cache_pages_total", len(cached), {"result": "hit"})
+            logger.debug(f"Extraction cache: all {len(cached)} pages cached")
+            return [cached[page] for page in range(start, end)]
+
+        fingerprints = await asyncio.to_thread(page_fingerprints, pdf_path, missing)
+        known = await asyncio.to_thread(self.get_texts, list(set(fingerprints.values())))
+        unseen = [page for page in missing if fingerprints[page] not in known]
+        extracted = (
+            await extract_pages(pdf_path, start, end, workers, executor, pages=unseen)
+            if unseen
+            else []
+        )
+        new_texts = {fingerprints[page]: text for page, text in zip(unseen, extracted)}
+        await asyncio.to_thread(self.put_pages, key, fingerprints, new_texts)
+
+        for result, pages in (
+            ("hit", len(cached)),
+            ("reused", len(missing) - len(unseen)),
+            ("miss", len(unseen)),
+        ):
+            if pages:
+                metrics.inc("extraction_cache_pages_total", pages, {"result": result})
+        logger.debug(
+            f"Extraction cache: {len(cached)} pages cached, {len(missing) - len(unseen)} reused, {len(unseen)} extracted"
+        )
+        texts = {**known, **new_texts}
+        return [
+            cached[page] if page in cached else texts[fingerprints[page]]
+            for page in range(start, end)
+        ]
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_extraction_cache(path: Optional[str]) -> Optional[ExtractionCache]:
+    # One cache per file for the whole process, None when path is not set
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = ExtractionCache(path)
+            _caches[path] = cache
+        return cache
@@ -1,9 +1,17 @@
+import logging
 from .PDFProcessor import PDFProcessor
 from .CSVProcessor import CSVProcessor
-import asyncio
 from enum import Enum
-from typing import TypedDict, Optional
-from pinecone import PineconeAsyncio, ServerlessSpec
+from typing import TYPE_CHECKING, TypedDict, Optional
+from VectorStore.ConnectionManager import ConnectionManager
+from .UpsertEngine import UpsertEngine
+from .ExtractionCache import get_extraction_cache
+from Instrumentation.Metrics import metrics
+
+if TYPE_CHECKING:
+    from pinecone import ServerlessSpec
+
+logger = logging.getLogger(__name__)
 
 class DeletionProtection(Enum):
     DISABLED = "disabled"
@@ -16,63 +24,73 @@ class PineconeConfig(TypedDict):
     host: Optional[str]  #
     dimension: int
     metric: str
-    spec: ServerlessSpec
+    spec: "ServerlessSpec"
     deletion_protection: Optional[DeletionProtection]
     tags: Optional[dict]
 
 
 class Ingest:
-    def __init__(self,configs,):
+    def __init__(self, configs, model=None, embedding_cache=None, connection=None):
         self.configs = configs
+        self.model = model
+        self.embedding_cache = embedding_cache
+        self.connection = connection
         self.file_configs = configs["file_configs"]
         self.pinecone_configs = configs["pinecone_configs"]
+        self.upsert_engine = UpsertEngine(configs.get("upsert_configs"))
 
     async def process(self):
         file_type = self.configs["file_configs"]["file_type"].lower()
         if file_type == "pdf":
-            dataset_processor = PDFProcessor(configs=self.file_configs)
+            dataset_processor = PDFProcessor(
+                configs=self.file_configs,
+                model=self.model,
+                embedding_cache=self.embedding_cache,
+                embedding_configs=self.configs.get("embedding_configs"),
+                extraction_cache=get_extraction_cache(
+                    (self.configs.get("ingest_configs") or {}).get(
+                        "extraction_cache_path"
+                    )
+                ),
+            )
         elif file_type == "csv":
-            dataset_processor = CSVProcessor(configs=self.file_configs)
+            dataset_processor = CSVProcessor(
+                configs=self.file_configs,
+                model=self.model,
+                embedding_cache=self.embedding_cache,
+                embedding_configs=self.configs.get("embedding_configs"),
+            )
 
         records = await dataset_processor.run_process(return_records=True)
-        print("pinecone_records", len(records))
+        logger.debug(f"Pinecone records: {len(records)}")
 
         return records
 
     async def upsert_to_pinecone(self, records):
+        # Without a shared connection, open one for this call only
+        connection = self.connection or ConnectionManager(self.configs)
         try:
-            async with PineconeAsyncio(
-                api_key=self.pinecone_configs["api_key"]
-            ) as pc:
-                if not await pc.has_index(self.pinecone_configs["name"]):
-                    print("Creating index")
-                    pc_config = self.pinecone_configs.copy()
-                    pc_config.pop("host")
-                    pc_index = await pc.create_index(**pc_config)
-
-                    print("Created pc_index", pc_index)
-
-                    # SHOULD RETURN PC_INDEX to user
-                else:
-                    if not self.pinecone_configs["host"]:
-                        raise KeyError("PineconeConfig missing 'host' key")
-
-                    print("Using existing index")
-                    pc_index = pc.IndexAsyncio(self.pinecone_configs["host"])
+            pc_index = await connection.get_vector_store()
 
             if records is None or len(records) == 0:
                 raise ValueError("Records array is empty.")
 
-            await pc_index.upsert(
-                vectors=records,
-                namespace=(
-                    self.pinecone_configs["namespace"]
-                    if self.pinecone_configs["namespace"]
-                    else self.file_configs["file_name"]
-                ),
-                batch_size=100,
-            )
-            print(f"Successfully upserted all {len(records)} records")
+            async with metrics.stage("upsert") as stage:
+                result = await self.upsert_engine.upsert(
+                    pc_index,
+                    records,
+                    namespace=(
+                        self.pinecone_configs["namespace"]
+                        if self.pinecone_configs["namespace"]
+                        else self.file_configs["file_name"]
+                    ),
+                )
+                stage.add(vectors=result["vectors"])
+            logger.info(f"Successfully upserted all {len(records)} records")
+            return result
         except Exception as e:
-            print(f"Error upserting records: {e}")
+            logger.error(f"Error upserting records: {e}")
             raise
+        finally:
+            if connection is not self.connection:
+                await connection.close()
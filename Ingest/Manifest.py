@@ -0,0 +1,80 @@
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Iterable, Set
+
+
+def content_hash(text: str) -> str:
+    text = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_position(chunk) -> str:
+    # Position from the chunk's provenance: row or page plus character offset
+    metadata = chunk.get("metadata", {})
+    if "row" in metadata:
+        return f"r{metadata['row']}.{metadata.get('start_offset', 0)}"
+    if "page" in metadata:
+        return f"p{metadata['page']}.{metadata.get('start_offset', 0)}"
+    raise ValueError("Chunk has no row or page provenance")
+
+
+def make_record_id(source: str, chunk) -> str:
+    # Deterministic across runs: the same text at the same position of the
+    # same file always gets the same id, and files sharing a namespace never
+    # collide
+    source_hash = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+    return f"{source_hash}-{chunk_position(chunk)}-{content_hash(chunk['text'])}"
+
+
+class Manifest:
+    # SQLite record of the ids upserted per (namespace, source file), used to
+    # embed and upsert only new or changed chunks and to delete the vectors of
+    # chunks that disappeared from the file
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    namespace TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    upserted_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, id)
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS records_source ON records (namespace, source)"
+            )
+
+    def get_ids(self, namespace: str, source: str) -> Set[str]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT id FROM records WHERE namespace = ? AND source = ?",
+                (namespace, source),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def add(self, namespace: str, source: str, ids: Iterable[str]):
+        now = time.time()
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO records (namespace, source, id, upserted_at) VALUES (?, ?, ?, ?)",
+                [(namespace, source, id, now) for id in ids],
+            )
+
+    def remove(self, namespace: str, ids: Iterable[str]):
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM records WHERE namespace = ? AND id = ?",
+                [(namespace, id) for id in ids],
+            )
+
+    def close(self):
+        self.connection.close()
@@ -1,14 +1,18 @@
-from sentence_transformers import SentenceTransformer
+import logging
 import os
-from PyPDF2 import PdfReader
-import torch
 import asyncio
-import tiktoken
-from transformers import AutoTokenizer
-from pinecone import ServerlessSpec
-from enum import Enum
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from Embedding.EmbeddingPool import get_ingest_model
+from .Chunker import Chunker
+from .Processor import Processor
+from .RecordBatch import RecordBatch
+from .Pipeline import DEFAULT_BATCH_SIZE
+from Instrumentation.Metrics import metrics
 from typing import TypedDict, Optional
 
+logger = logging.getLogger(__name__)
+
 
 class Configs(TypedDict):
     file_name: str
@@ -16,6 +20,9 @@ class Configs(TypedDict):
     file_type: str
     start_on_page: Optional[int]
     end_on_page: Optional[int]
+    workers: Optional[int]
+    chunk_tokens: Optional[int]
+    chunk_overlap: Optional[int]
 
 
 default_configs: Configs = {
@@ -24,23 +31,98 @@ default_configs: Configs = {
     "file_type": None,
     "start_on_page": 0,
     "end_on_page": None,
+    # Processes used for page extraction. None uses every CPU core.
+    "workers": None,
+    # Max tokens per chunk. None uses the model's max sequence length.
+    "chunk_tokens": None,
+    # Tokens shared by consecutive chunks. None uses the Chunker default.
+    "chunk_overlap": None,
 }
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-
 
-def count_tokens(text: str) -> int:
-    # encode_plus returns input_ids including special tokens
-    tokenizer = AutoTokenizer.from_pretrained(
-        "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+def extract_page_list(pdf_path: str, pages: list) -> list:
+    # Runs in a worker process: each worker opens the PDF itself so that only
+    # the path and the extracted text cross the process boundary
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() for i in pages]
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> list:
+    return extract_page_list(pdf_path, range(start, end))
+
+
+def shard_page_range(start: int, end: int, shards: int) -> list:
+    total = end - start
+    shards = max(1, min(shards, total))
+    size, remainder = divmod(total, shards)
+    ranges = []
+    for i in range(shards):
+        shard_end = start + size + (1 if i < remainder else 0)
+        ranges.append((start, shard_end))
+        start = shard_end
+    return ranges
+
+
+async def extract_pages(
+    pdf_path: str,
+    start_from: int,
+    end_on: int,
+    workers: int,
+    executor=None,
+    pages: Optional[list] = None,
+):
+    # page.extract_text() is pure CPU work, so pages are sharded into
+    # contiguous ranges over a process pool and reassembled in page order.
+    # executor is a pool shared across files (see IngestScheduler); without
+    # one a pool is created for this call. pages, when given, lists the page
+    # indexes to extract instead of start_from to end_on (see ExtractionCache).
+    pages = list(range(start_from, end_on)) if pages is None else list(pages)
+    if workers <= 1 or len(pages) <= 1:
+        return await asyncio.to_thread(extract_page_list, pdf_path, pages)
+
+    # A few shards per worker keeps workers busy when some pages are slower
+    shards = shard_page_range(0, len(pages), workers * 4)
+    logger.debug(
+        f"Extracting {len(pages)} pages with {workers} workers in {len(shards)} shards..."
     )
-    encoding = tokenizer.encode_plus(text, add_special_tokens=True)
-    return len(encoding["input_ids"])
-
+    loop = asyncio.get_running_loop()
+
+    async def run(executor):
+        return await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    executor, extract_page_list, pdf_path, pages[start:end]
+                )
+                for start, end in shards
+            ]
+        )
 
-class PDFProcessor:
-    def __init__(self, configs):
-        print("Initializing PDFProcessor...")
+    if executor is not None:
+        results = await run(executor)
+    else:
+        # Spawned, not forked: the parent holds model weights, worker threads
+        # and an event loop that forked children would inherit
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results = await run(executor)
+
+    return [text for shard in results for text in shard]
+
+
+class PDFProcessor(Processor):
+    def __init__(
+        self,
+        configs,
+        model=None,
+        embedding_cache=None,
+        embedding_configs=None,
+        executor=None,
+        extraction_cache=None,
+    ):
+        logger.debug("Initializing PDFProcessor...")
 
         # Done in PineconeRag validations?
         if not configs["file_name"]:
@@ -48,153 +130,114 @@ class PDFProcessor:
         try:
             self.configs = configs
             self.raw_text_content = []
+            self.chunks = []  # Chunk text with page/offset provenance
             self.embedded_text_content = []
-            self.final_records_to_upsert = []  # Final list dict to upsert
+            # Columnar records to upsert, see RecordBatch
+            self.final_records_to_upsert = RecordBatch.from_chunks([], [])
 
-            print(
-                f"Loading sentence transformer model for file: {self.configs['file_name']}"
+            # Reuse the process-wide model (or embedding pool, when
+            # embedding_configs["workers"] is set) instead of loading a copy
+            self.model = (
+                model if model is not None else get_ingest_model(embedding_configs)
             )
-            self.model = SentenceTransformer(
-                "sentence-transformers/paraphrase-multilingual-mpnet-base-v2",
-                device=device,
+            self.embedding_cache = embedding_cache
+            self.embedding_configs = embedding_configs or {}
+            # Optional process pool for page extraction, shared across files
+            self.executor = executor
+            # Optional ExtractionCache: page text of earlier runs is reused
+            self.extraction_cache = extraction_cache
+            # Batches, padded/real tokens and padding_waste of the embedding step
+            self.embedding_stats = {}
+            # Ids of every chunk in the file and ids that are already upserted
+            self.seen_ids = set()
+            self.skip_ids = set()
+            self.chunker = Chunker(
+                max_tokens=configs.get("chunk_tokens")
+                or getattr(self.model, "max_seq_length", None),
+                overlap=configs.get("chunk_overlap"),
+                # Windows are measured with the tokenizer of the model that embeds them
+                model_name=self.embedding_configs.get("model_name"),
             )
-            print("PDFProcessor initialized successfully")
+            logger.debug("PDFProcessor initialized successfully")
         except Exception as e:
-            print(f"Error initializing PDFProcessor: {e}")
+            logger.error(f"Error initializing PDFProcessor: {e}")
             raise
 
-    def get_reader(self):
-        print("Getting PDF reader...")
+    def get_pdf_path(self):
         root_dir = os.path.dirname(os.path.dirname(__file__))
-        pdf_path = os.path.join(root_dir, "data_files", self.configs["file_name"])
-        print(f"Attempting to read PDF from: {pdf_path}")
+        return os.path.join(root_dir, "data_files", self.configs["file_name"])
+
+    def get_reader(self):
+        logger.debug("Getting PDF reader...")
+        pdf_path = self.get_pdf_path()
+        logger.debug(f"Attempting to read PDF from: {pdf_path}")
+        from PyPDF2 import PdfReader
+
         reader = PdfReader(pdf_path)
-        print("PDF reader obtained successfully")
+        logger.debug("PDF reader obtained successfully")
         return reader
 
+    async def get_page_count(self):
+        if self.extraction_cache is not None:
+            # Unchanged files are counted without parsing them
+            return await asyncio.to_thread(
+                self.extraction_cache.page_count, self.get_pdf_path()
+            )
+        return len(self.get_reader().pages)
+
     # extracts and stores text_content
     async def extract_text_content(self):
-        print("Starting text extraction from PDF...")
-        reader = self.get_reader()
-        tasks = []
-        pages = reader.pages
+        logger.debug("Starting text extraction from PDF...")
+        page_count = await self.get_page_count()
         start_from = self.configs["start_on_page"] or 0
-        end_on = self.configs["end_on_page"] or len(pages)
+        end_on = min(self.configs["end_on_page"] or page_count, page_count)
 
-        if len(pages) == 0:
+        if page_count == 0:
             raise ValueError("No pages to extract from")
 
         if start_from > end_on:
             raise ValueError("File config error: start_from cannot be greater than end_on")
-        
-        for i, page in enumerate(pages[start_from:end_on]):
-            if i % 100 == 0:
-                print(f"Processing page {i}...")
-            task = asyncio.create_task(self.process_page(page))
-            tasks.append(task)
-
-        raw_text_content = await asyncio.gather(*tasks)
-        self.raw_text_content = self.process_text_across_pages(raw_text_content)
-        print(f"Completed text extraction. Total pages processed: {i}")
-
-    async def process_page(self, page):
-        text = page.extract_text()
-        return text
-
-    def process_text_across_pages(self, raw_text_content):
-        if not raw_text_content:
-            return []
-
-        processed_content = []
-        current_text = raw_text_content[0].strip()
-        
-        terminal_punctuation = {".", "!", "?", ":", ";"}
-
-        for next_text in raw_text_content[1:]:
-            next_text = next_text.strip()
-
-            # If current text ends with terminal punctuation, don't merge
-            if current_text and current_text[-1] in terminal_punctuation:
-                processed_content.append(current_text)
-                current_text = next_text
-                continue
-
-            # If next text starts with a capital letter, don't merge
-            if next_text and next_text[0].isupper():
-                processed_content.append(current_text)
-                current_text = next_text
-                continue
-
-            # Merge the texts with a space
-            current_text = f"{current_text} {next_text}"
-
-        # Add the last piece of text
-        if current_text:
-            processed_content.append(current_text)
-        print(processed_content)
-        return processed_content
-
-    async def embeded_text_content(self):
-        print("Starting text embedding process...")
-        raw_text_content = self.raw_text_content
-
-        if len(raw_text_content) == 0:
-            print("No text content to process")
-            return
-
-        print("Encoding text content...")
-        batch_size = 32
-        self.embedded_text_content = []
-        for i in range(0, len(raw_text_content), batch_size):
-            batch = raw_text_content[i : i + batch_size]
-            embeddings = await asyncio.to_thread(self.model.encode, batch)
-            self.embedded_text_content.extend(embeddings)
-        # self.embedded_text_content = self.model.encode(raw_text_content)
-        print("Embedded text content generated successfully")
-
-    def get_text_content(self):
-        print("Retrieving text content...")
-        return self.raw_text_content
-
-    def get_embeded_text_content(self):
-        print("Retrieving embedded text content...")
-        return self.embedded_text_content
-
-    def get_pinecone_records(self):
-        print("Retrieving Pinecone records...")
-        return self.final_records_to_upsert
-
-    async def prepare_records_for_upsert(self):
-        print("Preparing records for Pinecone upsert...")
-
-        if len(self.embedded_text_content) == 0:
-            print("No embeddings generated")
-            raise ValueError("No embeddings to upsert")
-
-        print("Structuring embeddings for upsert...")
-        self.final_records_to_upsert = []
-
-        for index, (original_text, embedding) in enumerate(
-            zip(self.raw_text_content, self.embedded_text_content)
-        ):
-            record = {
-                "id": str(index),
-                "values": embedding,
-                "metadata": {"original_text": original_text},
-            }
-            self.final_records_to_upsert.append(record)
-
-        print(
-            f"Prepared {len(self.final_records_to_upsert)} records for Pinecone upsert"
+
+        workers = self.configs.get("workers") or os.cpu_count() or 1
+        async with metrics.stage("extract") as stage:
+            if self.extraction_cache is not None:
+                raw_text_content = await self.extraction_cache.extract(
+                    self.get_pdf_path(), start_from, end_on, workers, self.executor
+                )
+            else:
+                raw_text_content = await extract_pages(
+                    self.get_pdf_path(), start_from, end_on, workers, self.executor
+                )
+            stage.add(pages=len(raw_text_content))
+        async with metrics.stage("chunk") as stage:
+            chunks = await asyncio.to_thread(
+                self.chunker.chunk_pages, raw_text_content, start_from
+            )
+            stage.add(
+                pages=len(raw_text_content),
+                chunks=len(chunks),
+                tokens=sum(chunk["token_count"] for chunk in chunks),
+            )
+        self.chunks = self.assign_ids(chunks)
+        self.raw_text_content = [chunk["text"] for chunk in self.chunks]
+        logger.info(
+            f"Completed text extraction. Total pages processed: {len(raw_text_content)}, chunks: {len(self.seen_ids)}, new or changed: {len(self.chunks)}"
         )
 
+    async def iter_text_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        # Pipeline extract stage. Chunks can span page breaks, so batches are
+        # handed to the embed stage once extraction finishes.
+        await self.extract_text_content()
+        for batch in self._batch_chunks(self.chunks, batch_size):
+            yield batch
+
     async def run(self, return_records=False):
-        print("Starting PDF processing pipeline...")
+        logger.debug("Starting PDF processing pipeline...")
         await self.extract_text_content()
         await self.embeded_text_content()
         await self.prepare_records_for_upsert()
 
-        print("PDF processing completed")
+        logger.info("PDF processing completed")
 
         if return_records:
             return self.final_records_to_upsert
@@ -0,0 +1,139 @@
+import logging
+import time
+import asyncio
+from Instrumentation.Metrics import metrics
+from typing import Any, AsyncIterator, Awaitable, Callable, List, TypedDict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineConfigs(TypedDict):
+    queue_size: Optional[int]
+    embed_concurrency: Optional[int]
+    upsert_concurrency: Optional[int]
+
+
+default_pipeline_configs: PipelineConfigs = {
+    # Batches buffered between two stages before the upstream stage waits
+    "queue_size": 4,
+    "embed_concurrency": 1,
+    "upsert_concurrency": 2,
+}
+
+# Chunks per batch handed from the extract stage to embed, for every ingest
+# path (ingest_configs["batch_size"])
+DEFAULT_BATCH_SIZE = 32
+
+# Marks the end of a queue, one per downstream worker
+_DONE = object()
+
+
+class IngestPipeline:
+    # Connects extract -> embed -> upsert with bounded asyncio queues. Each
+    # stage runs as its own set of workers, so batch N+1 is embedded while
+    # batch N is being upserted, and a full queue makes the upstream stage
+    # wait (backpressure) instead of buffering the whole dataset. If any stage
+    # fails every other stage is cancelled and the error is raised from run().
+    def __init__(
+        self,
+        source: Callable[[], AsyncIterator[Any]],
+        embed: Callable[[Any], Awaitable[List[dict]]],
+        upsert: Callable[[List[dict]], Awaitable[None]],
+        configs: Optional[PipelineConfigs] = None,
+    ):
+        configs = {**default_pipeline_configs, **(configs or {})}
+        self.source = source
+        self.embed = embed
+        self.upsert = upsert
+        self.queue_size = configs["queue_size"]
+        self.embed_concurrency = configs["embed_concurrency"]
+        self.upsert_concurrency = configs["upsert_concurrency"]
+        self.stats = {
+            "extracted_batches": 0,
+            "embedded_batches": 0,
+            "upserted_batches": 0,
+            "upserted_records": 0,
+            "seconds": 0.0,
+        }
+
+        if min(self.queue_size, self.embed_concurrency, self.upsert_concurrency) < 1:
+            raise ValueError(
+                "queue_size, embed_concurrency and upsert_concurrency must be at least 1"
+            )
+
+    def _record_depth(self, name, queue):
+        metrics.set_gauge("pipeline_queue_depth", queue.qsize(), {"queue": name})
+
+    async def _extract(self, embed_queue):
+        async for batch in self.source():
+            await embed_queue.put(batch)
+            self._record_depth("embed", embed_queue)
+            self.stats["extracted_batches"] += 1
+        for _ in range(self.embed_concurrency):
+            await embed_queue.put(_DONE)
+
+    async def _embed(self, embed_queue, upsert_queue):
+        while True:
+            batch = await embed_queue.get()
+            self._record_depth("embed", embed_queue)
+            if batch is _DONE:
+                return
+            records = await self.embed(batch)
+            self.stats["embedded_batches"] += 1
+            await upsert_queue.put(records)
+            self._record_depth("upsert", upsert_queue)
+
+    async def _close_upsert_queue(self, embed_workers, upsert_queue):
+        await asyncio.gather(*embed_workers)
+        for _ in range(self.upsert_concurrency):
+            await upsert_queue.put(_DONE)
+
+    async def _upsert(self, upsert_queue):
+        while True:
+            records = await upsert_queue.get()
+            self._record_depth("upsert", upsert_queue)
+            if records is _DONE:
+                return
+            await self.upsert(records)
+            self.stats["upserted_batches"] += 1
+            self.stats["upserted_records"] += len(records)
+
+    async def run(self):
+        started = time.perf_counter()
+        embed_queue = asyncio.Queue(maxsize=self.queue_size)
+        upsert_queue = asyncio.Queue(maxsize=self.queue_size)
+
+        embed_workers = [
+            asyncio.create_task(self._embed(embed_queue, upsert_queue))
+            for _ in range(self.embed_concurrency)
+        ]
+        tasks = [
+            asyncio.create_task(self._extract(embed_queue)),
+            *embed_workers,
+            asyncio.create_task(self._close_upsert_queue(embed_workers, upsert_queue)),
+            *[
+                asyncio.create_task(self._upsert(upsert_queue))
+                for _ in range(self.upsert_concurrency)
+            ],
+        ]
+
+        try:
+            done, pending = await asyncio.wait(
+                tasks, return_when=asyncio.FIRST_EXCEPTION
+            )
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+        finally:
+            # Runs on failure and when run() itself is cancelled
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.stats["seconds"] = time.perf_counter() - started
+
+        logger.info(
+            f"Pipeline upserted {self.stats['upserted_records']} records in "
+            f"{self.stats['upserted_batches']} batches ({self.stats['seconds']:.2f}s)"
+        )
+        return self.stats
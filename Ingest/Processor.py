@@ -0,0 +1,122 @@
+import logging
+from Embedding.Encoder import encode_texts
+from Embedding.Quantization import QuantizedVectors
+from .Manifest import make_record_id
+from .RecordBatch import RecordBatch
+from Instrumentation.Metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Processor:
+    # Embedding and record steps shared by CSVProcessor and PDFProcessor.
+    # Subclasses set configs, model, embedding_cache, embedding_configs,
+    # embedding_stats, seen_ids, skip_ids, chunks and raw_text_content, and
+    # implement extract_text_content and iter_text_batches.
+
+    def assign_ids(self, chunks):
+        # Gives every chunk its deterministic record id. Chunks listed in
+        # skip_ids (already upserted, see Manifest) are dropped before embedding.
+        kept = []
+        for chunk in chunks:
+            chunk["id"] = make_record_id(self.configs["file_name"], chunk)
+            self.seen_ids.add(chunk["id"])
+            if chunk["id"] not in self.skip_ids:
+                kept.append(chunk)
+        return kept
+
+    async def embeded_text_content(self):
+        logger.debug("Starting text embedding process...")
+        raw_text_content = self.raw_text_content
+
+        if len(raw_text_content) == 0:
+            logger.warning("No text content to process")
+            return
+
+        logger.debug("Encoding text content...")
+        # One contiguous matrix in the configured storage dtype, dequantized
+        # row by row when records are prepared for upsert
+        self.embedded_text_content = QuantizedVectors.from_vectors(
+            await self.encode_chunks(self.chunks),
+            self.embedding_configs.get("storage_dtype"),
+        )
+        logger.info(
+            f"Embedded text content generated successfully. Padding waste: {self.embedding_stats['padding_waste']:.1%}"
+        )
+
+    async def encode_chunks(self, chunks):
+        # Chunks carry their token counts, so batches are planned by length
+        # without tokenizing again
+        token_counts = [chunk["token_count"] for chunk in chunks]
+        async with metrics.stage("embed") as stage:
+            embeddings = await encode_texts(
+                self.model,
+                [chunk["text"] for chunk in chunks],
+                cache=self.embedding_cache,
+                token_counts=token_counts,
+                max_batch_tokens=self.embedding_configs.get("max_batch_tokens"),
+                stats=self.embedding_stats,
+            )
+            stage.add(
+                chunks=len(chunks), tokens=sum(token_counts), vectors=len(embeddings)
+            )
+        return embeddings
+
+    async def prepare_records_for_upsert(self):
+        logger.debug("Preparing records for Pinecone upsert...")
+
+        if len(self.embedded_text_content) == 0:
+            logger.warning("No embeddings generated")
+            raise ValueError("No embeddings to upsert")
+
+        logger.debug("Structuring embeddings for upsert...")
+        with metrics.stage("prepare") as stage:
+            self.final_records_to_upsert = RecordBatch.from_chunks(
+                self.chunks, self.embedded_text_content
+            )
+            stage.add(records=len(self.final_records_to_upsert))
+        logger.debug(f"First record ids: {self.final_records_to_upsert.ids[:5]}")
+
+        logger.info(
+            f"Prepared {len(self.final_records_to_upsert)} records for Pinecone upsert"
+        )
+
+    def _batch_chunks(self, chunks, batch_size):
+        for i in range(0, len(chunks), batch_size):
+            yield [
+                {
+                    "id": chunk["id"],
+                    "text": chunk["text"],
+                    "token_count": chunk["token_count"],
+                    "metadata": chunk["metadata"],
+                }
+                for chunk in chunks[i : i + batch_size]
+            ]
+
+    async def embed_batch(self, batch):
+        # Pipeline embed stage: turns a batch of {"id", "text", "metadata"} into records
+        embeddings = await self.encode_chunks(batch)
+        return [
+            {
+                "id": item["id"],
+                "values": embedding,
+                "metadata": {
+                    "original_text": item["text"],
+                    **item.get("metadata", {}),
+                },
+            }
+            for item, embedding in zip(batch, embeddings)
+        ]
+
+    def get_text_content(self):
+        logger.debug("Retrieving text content...")
+        return self.raw_text_content
+
+    def get_embeded_text_content(self):
+        logger.debug("Retrieving embedded text content...")
+        return self.embedded_text_content
+
+    def get_pinecone_records(self):
+        # Sequence of {"id", "values", "metadata"} dicts, built on access
+        logger.debug("Retrieving Pinecone records...")
+        return self.final_records_to_upsert
@@ -0,0 +1,101 @@
+import numpy as np
+from typing import List, Optional
+from Embedding.Quantization import QuantizedVectors
+
+# Records per upsert request
+DEFAULT_UPSERT_BATCH_SIZE = 100
+
+
+def _column(values):
+    # Integer provenance (row, page, offsets) is packed into an int64 array;
+    # anything else stays a list. Missing values are None.
+    if all(type(value) is int for value in values):
+        return np.asarray(values, dtype=np.int64)
+    return list(values)
+
+
+class RecordBatch:
+    # Columnar upsert records: ids, one contiguous vector matrix, the chunk
+    # texts and one column per metadata key. Record dicts are only built for
+    # the slice being upserted. Slicing returns a view over the same vector
+    # matrix, and indexing and iteration yield the same
+    # {"id", "values", "metadata"} dicts as the old list of records.
+    def __init__(
+        self,
+        ids: List[str],
+        vectors: QuantizedVectors,
+        texts: List[str],
+        metadata: Optional[dict] = None,
+    ):
+        if not len(ids) == len(vectors) == len(texts):
+            raise ValueError("ids, vectors and texts must have the same length")
+        self.ids = ids
+        self.vectors = vectors
+        self.texts = texts
+        self.metadata = metadata or {}  # key -> column
+
+    @classmethod
+    def from_chunks(cls, chunks, vectors):
+        if not isinstance(vectors, QuantizedVectors):
+            vectors = QuantizedVectors.from_vectors(list(vectors))
+        keys = []
+        for chunk in chunks:
+            for key in chunk.get("metadata", {}):
+                if key not in keys:
+                    keys.append(key)
+        metadata = {
+            key: _column([chunk.get("metadata", {}).get(key) for chunk in chunks])
+            for key in keys
+        }
+        return cls(
+            [chunk["id"] for chunk in chunks],
+            vectors,
+            [chunk["text"] for chunk in chunks],
+            metadata,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RecordBatch(
+                self.ids[index],
+                self.vectors[index],
+                self.texts[index],
+                {key: column[index] for key, column in self.metadata.items()},
+            )
+        if index < 0:
+            index += len(self)
+        return self[index : index + 1].to_records()[0]
+
+    def __iter__(self):
+        for part in self.iter_slices():
+            yield from part.to_records()
+
+    def iter_slices(self, batch_size: int = DEFAULT_UPSERT_BATCH_SIZE):
+        for start in range(0, len(self), batch_size):
+            yield self[start : start + batch_size]
+
+    def to_records(self):
+        # Materializes this batch as Pinecone record dicts, with float32 values
+        values = self.vectors.to_float().tolist()
+        columns = [
+            (key, column.tolist() if isinstance(column, np.ndarray) else column)
+            for key, column in self.metadata.items()
+        ]
+        records = []
+        for i, id in enumerate(self.ids):
+            metadata = {"original_text": self.texts[i]}
+            for key, column in columns:
+                if column[i] is not None:
+                    metadata[key] = column[i]
+            records.append({"id": id, "values": values[i], "metadata": metadata})
+        return records
+
+
+def iter_record_slices(records, batch_size: int = DEFAULT_UPSERT_BATCH_SIZE):
+    # Upsert-sized lists of record dicts from a RecordBatch or a plain list
+    for start in range(0, len(records), batch_size):
+        part = records[start : start + batch_size]
+        yield part.to_records() if isinstance(part, RecordBatch) else part
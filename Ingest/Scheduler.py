@@ -0,0 +1,506 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, TypedDict, Union
+from Embedding.EmbeddingPool import get_ingest_model
+from Instrumentation.Metrics import metrics
+from VectorStore.ConnectionManager import ConnectionManager
+from .CSVProcessor import CSVProcessor
+from .PDFProcessor import PDFProcessor
+from .Pipeline import IngestPipeline, DEFAULT_BATCH_SIZE
+from .Checkpoint import Checkpoint, checkpointed_pipeline
+from .ExtractionCache import get_extraction_cache
+from .UpsertEngine import UpsertEngine
+
+logger = logging.getLogger(__name__)
+
+scheduler_file_types = {".pdf": "pdf", ".csv": "csv"}
+scheduler_orders = ["largest_first", "smallest_first", "listed"]
+
+
+class SchedulerConfigs(TypedDict):
+    pages_per_unit: Optional[int]
+    rows_per_unit: Optional[int]
+    concurrency: Optional[int]
+    max_in_flight_bytes: Optional[int]
+    memory_per_source_byte: Optional[float]
+    order: Optional[str]
+    extract_workers: Optional[int]
+
+
+default_scheduler_configs: SchedulerConfigs = {
+    # Size of a work unit: a page range of a PDF or a row range of a CSV
+    "pages_per_unit": 50,
+    "rows_per_unit": 20_000,
+    # Work units processed at the same time
+    "concurrency": 4,
+    # Cap on the estimated memory of all units in flight. A unit is estimated
+    # at its share of the file size times memory_per_source_byte; a unit above
+    # the cap runs on its own.
+    "max_in_flight_bytes": 2 * 1024**3,
+    "memory_per_source_byte": 4.0,
+    # Longest units first keeps one large file from finishing last
+    "order": "largest_first",
+    # Processes for PDF page extraction, shared by every unit. None uses
+    # every CPU core.
+    "extract_workers": None,
+}
+
+
+class WorkUnit(TypedDict):
+    path: str
+    file_type: str
+    start: int
+    end: int
+    # Byte range of the rows of a CSV unit, None for PDFs
+    start_byte: Optional[int]
+    end_byte: Optional[int]
+    source_bytes: int
+    estimated_bytes: int
+
+
+def discover_files(source: Union[str, Iterable[str]]) -> List[str]:
+    # source is a directory (searched recursively), a manifest file listing
+    # one path per line or a JSON list of paths, or an iterable of paths.
+    # Relative paths in a manifest are relative to the manifest.
+    if not isinstance(source, str):
+        paths = list(source)
+    elif os.path.isdir(source):
+        paths = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in sorted(names)
+        ]
+        paths = [
+            path
+            for path in paths
+            if os.path.splitext(path)[1].lower() in scheduler_file_types
+        ]
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            if source.endswith(".json"):
+                paths = json.load(f)
+            else:
+                paths = [line.strip() for line in f if line.strip()]
+        base_dir = os.path.dirname(os.path.abspath(source))
+        paths = [os.path.join(base_dir, path) for path in paths]
+
+    files = []
+    for path in paths:
+        if os.path.splitext(path)[1].lower() not in scheduler_file_types:
+            raise ValueError(f"File type of '{path}' not supported")
+        files.append(os.path.abspath(path))
+    return files
+
+
+def count_pdf_pages(path: str) -> int:
+    from PyPDF2 import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def plan_csv_ranges(path: str, rows_per_unit: int) -> List[tuple]:
+    # (start_row, end_row, start_byte, end_byte) of every rows_per_unit rows,
+    # from one binary pass over the file. A line ends a row only when the
+    # quotes seen so far are balanced, so quoted newlines inside a cell do not
+    # split it; units then seek straight to their first row.
+    ranges = []
+    with open(path, "rb") as f:
+        f.readline()  # header
+        start_row, start_byte = 0, f.tell()
+        rows, quotes, position = 0, 0, start_byte
+        for line in f:
+            position += len(line)
+            quotes += line.count(b'"')
+            if quotes % 2 or not line.strip():
+                continue
+            rows += 1
+            if rows - start_row == rows_per_unit:
+                ranges.append((start_row, rows, start_byte, position))
+                start_row, start_byte = rows, position
+        if rows > start_row:
+            ranges.append((start_row, rows, start_byte, position))
+    return ranges
+
+
+class MemoryBudget:
+    # Byte-weighted semaphore for the estimated memory of units in flight
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, amount: int) -> int:
+        amount = min(amount, self.limit)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.used + amount <= self.limit)
+            self.used += amount
+            self.peak = max(self.peak, self.used)
+        return amount
+
+    async def release(self, amount: int):
+        async with self._condition:
+            self.used -= amount
+            self._condition.notify_all()
+
+
+class IngestScheduler:
+    # Ingests many PDFs and CSVs at once. Files are split into work units
+    # (page or row ranges) that run as separate IngestPipelines over one
+    # shared embedding model or EmbeddingPool and one shared page extraction
+    # pool, at most `concurrency` at a time and within max_in_flight_bytes.
+    # Records go to the namespace of pinecone_configs, or to one namespace per
+    # file (its path relative to the source directory) when that is empty.
+    def __init__(
+        self,
+        configs,
+        model=None,
+        embedding_cache=None,
+        connection=None,
+        manifest=None,
+    ):
+        self.configs = configs
+        self.scheduler_configs = {
+            **default_scheduler_configs,
+            **(configs.get("scheduler_configs") or {}),
+        }
+        if self.scheduler_configs["order"] not in scheduler_orders:
+            raise ValueError(
+                f"Order '{self.scheduler_configs['order']}' not supported. Supported orders: {', '.join(scheduler_orders)}"
+            )
+        self.file_configs = configs.get("file_configs") or {}
+        self.ingest_configs = configs.get("ingest_configs") or {}
+        self.embedding_configs = configs.get("embedding_configs") or {}
+        self.pinecone_configs = configs.get("pinecone_configs") or {}
+        self.model = (
+            model if model is not None else get_ingest_model(self.embedding_configs)
+        )
+        self.embedding_cache = embedding_cache
+        self.connection = connection
+        self.manifest = manifest
+        self.upsert_engine = UpsertEngine(configs.get("upsert_configs"))
+        self.extraction_cache = get_extraction_cache(
+            self.ingest_configs.get("extraction_cache_path")
+        )
+        self.base_dir = None
+
+    def get_source_name(self, path: str) -> str:
+        # Path relative to data_files, like file_configs["file_name"] of a
+        # single-file ingest, so record ids and manifest sources do not depend
+        # on where the checkout lives. Files outside data_files keep their
+        # absolute path. CSV ids match a single-file ingest; PDF units are
+        # chunked per page range, so chunks that a single-file ingest lets
+        # span a unit boundary get other ids (see README, Batch ingestion).
+        data_files = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data_files")
+        try:
+            relative = os.path.relpath(path, data_files)
+        except ValueError:  # another drive on Windows
+            return path
+        return path if relative.split(os.sep)[0] == os.pardir else relative
+
+    def get_namespace(self, path: str) -> str:
+        if self.pinecone_configs.get("namespace"):
+            return self.pinecone_configs["namespace"]
+        if self.base_dir:
+            return os.path.relpath(path, self.base_dir)
+        return os.path.basename(path)
+
+    async def plan(self, files: List[str]) -> List[WorkUnit]:
+        pages_per_unit = self.scheduler_configs["pages_per_unit"]
+        rows_per_unit = self.scheduler_configs["rows_per_unit"]
+        factor = self.scheduler_configs["memory_per_source_byte"]
+
+        async def plan_file(path):
+            file_type = scheduler_file_types[os.path.splitext(path)[1].lower()]
+            if file_type == "pdf":
+                total = await asyncio.to_thread(count_pdf_pages, path)
+                size = os.path.getsize(path)
+                ranges = [
+                    (
+                        start,
+                        min(start + pages_per_unit, total),
+                        None,
+                        None,
+                        size * (min(start + pages_per_unit, total) - start) // total,
+                    )
+                    for start in range(0, total, pages_per_unit)
+                ]
+            else:
+                ranges = [
+                    (start, end, start_byte, end_byte, end_byte - start_byte)
+                    for start, end, start_byte, end_byte in await asyncio.to_thread(
+                        plan_csv_ranges, path, rows_per_unit
+                    )
+                ]
+            units = [
+                {
+                    "path": path,
+                    "file_type": file_type,
+                    "start": start,
+                    "end": end,
+                    "start_byte": start_byte,
+                    "end_byte": end_byte,
+                    "source_bytes": source_bytes,
+                    "estimated_bytes": int(source_bytes * factor),
+                }
+                for start, end, start_byte, end_byte, source_bytes in ranges
+            ]
+            if not units:
+                logger.warning(f"Nothing to ingest in {path}")
+            return units
+
+        planned = await asyncio.gather(*[plan_file(path) for path in files])
+        units = [unit for file_units in planned for unit in file_units]
+        order = self.scheduler_configs["order"]
+        if order != "listed":
+            units.sort(
+                key=lambda unit: unit["source_bytes"],
+                reverse=order == "largest_first",
+            )
+        return units
+
+    def build_processor(self, unit: WorkUnit, executor, extract_workers: int):
+        shared = {
+            "file_name": self.get_source_name(unit["path"]),
+            "file_type": unit["file_type"],
+            "chunk_tokens": self.file_configs.get("chunk_tokens"),
+            "chunk_overlap": self.file_configs.get("chunk_overlap"),
+        }
+        if unit["file_type"] == "pdf":
+            return PDFProcessor(
+                {
+                    **shared,
+                    "start_on_page": unit["start"],
+                    "end_on_page": unit["end"],
+                    "workers": extract_workers,
+                },
+                model=self.model,
+                embedding_cache=self.embedding_cache,
+                embedding_configs=self.embedding_configs,
+                executor=executor,
+                extraction_cache=self.extraction_cache,
+            )
+        return CSVProcessor(
+            {
+                **shared,
+                "text_column": self.file_configs.get("text_column") or "text",
+                "start_row": unit["start"],
+                "end_row": unit["end"],
+                "start_byte": unit["start_byte"],
+                "end_byte": unit["end_byte"],
+                "chunk_size": self.file_configs.get("chunk_size") or 10_000,
+            },
+            model=self.model,
+            embedding_cache=self.embedding_cache,
+            embedding_configs=self.embedding_configs,
+        )
+
+    async def run_unit(
+        self, unit: WorkUnit, pc_index, executor, extract_workers, file_state
+    ):
+        processor = self.build_processor(unit, executor, extract_workers)
+        namespace = self.get_namespace(unit["path"])
+        processor.skip_ids = file_state["skip_ids"]
+
+        def on_batch(batch):
+            if self.manifest:
+                self.manifest.add(
+                    namespace,
+                    self.get_source_name(unit["path"]),
+                    [record["id"] for record in batch],
+                )
+
+        async def upsert(records):
+            async with metrics.stage("upsert") as stage:
+                result = await self.upsert_engine.upsert(
+                    pc_index, records, namespace, on_batch=on_batch
+                )
+                stage.add(vectors=result["vectors"])
+
+        batch_size = self.ingest_configs.get("batch_size") or DEFAULT_BATCH_SIZE
+        pipeline_configs = {
+            key: self.ingest_configs[key]
+            for key in ("queue_size", "embed_concurrency", "upsert_concurrency")
+            if self.ingest_configs.get(key)
+        }
+        checkpoint = None
+        if self.ingest_configs.get("checkpoint_dir"):
+            # One checkpoint per unit, see Checkpoint
+            checkpoint = await asyncio.to_thread(
+                Checkpoint,
+                self.ingest_configs["checkpoint_dir"],
+                unit["path"],
+                {
+                    "start": unit["start"],
+                    "end": unit["end"],
+                    "file_configs": processor.configs,
+                    "model_name": self.embedding_configs.get("model_name"),
+                    "backend": self.embedding_configs.get("backend"),
+                    "namespace": namespace,
+                },
+            )
+            pipeline = checkpointed_pipeline(
+                processor, checkpoint, upsert, batch_size, pipeline_configs
+            )
+        else:
+            pipeline = IngestPipeline(
+                source=lambda: processor.iter_text_batches(batch_size=batch_size),
+                embed=processor.embed_batch,
+                upsert=upsert,
+                configs=pipeline_configs,
+            )
+        stats = await pipeline.run()
+        file_state["seen_ids"] |= processor.seen_ids
+        if checkpoint is not None:
+            checkpoint.remove()
+        return stats["upserted_records"]
+
+    async def delete_removed_records(self, pc_index, path, file_state):
+        # Only once every unit of the file succeeded, so seen_ids is complete
+        if not self.manifest:
+            return 0
+        namespace = self.get_namespace(path)
+        removed = list(file_state["skip_ids"] - file_state["seen_ids"])
+        for i in range(0, len(removed), 1000):
+            batch = removed[i : i + 1000]
+            await pc_index.delete(ids=batch, namespace=namespace)
+            self.manifest.remove(namespace, batch)
+            metrics.inc("records_deleted_total", len(batch))
+        return len(removed)
+
+    async def run(self, source: Union[str, Iterable[str]]) -> dict:
+        # Returns aggregate throughput, failed units and the namespaces written
+        started = time.perf_counter()
+        if isinstance(source, str) and os.path.isdir(source):
+            self.base_dir = os.path.abspath(source)
+        files = discover_files(source)
+        units = await self.plan(files)
+        logger.info(f"Planned {len(units)} work units for {len(files)} files")
+
+        # Without a shared connection, open one for this run only
+        connection = self.connection or ConnectionManager(self.configs)
+        try:
+            pc_index = await connection.get_vector_store()
+            report = await self._run(files, units, pc_index)
+        finally:
+            if connection is not self.connection:
+                await connection.close()
+
+        seconds = time.perf_counter() - started
+        report.update(
+            {
+                "seconds": seconds,
+                "records_per_second": report["records"] / seconds if seconds else 0.0,
+                "megabytes_per_second": (
+                    report["source_bytes"] / 1e6 / seconds if seconds else 0.0
+                ),
+            }
+        )
+        logger.info(
+            f"Ingested {report['files']} files ({report['units']} units, {report['records']} records) in {seconds:.1f}s: "
+            f"{report['records_per_second']:.1f} records/s, {report['megabytes_per_second']:.2f} MB/s, "
+            f"{len(report['failed_units'])} failed units"
+        )
+        return report
+
+    async def _run(self, files, units, pc_index):
+        budget = MemoryBudget(self.scheduler_configs["max_in_flight_bytes"])
+        queue = asyncio.Queue()
+        for unit in units:
+            queue.put_nowait(unit)
+
+        units_per_file = Counter(unit["path"] for unit in units)
+        file_states = {}
+        for path in files:
+            skip_ids = (
+                self.manifest.get_ids(
+                    self.get_namespace(path), self.get_source_name(path)
+                )
+                if self.manifest
+                else set()
+            )
+            file_states[path] = {
+                "skip_ids": skip_ids,
+                "seen_ids": set(),
+                "pending": units_per_file[path],
+                "failed": False,
+            }
+
+        report = {
+            "files": len(files),
+            "units": len(units),
+            "pages": 0,
+            "rows": 0,
+            "records": 0,
+            "deleted": 0,
+            "source_bytes": 0,
+            "failed_units": [],
+            "failed_deletes": [],
+            "namespaces": set(),
+        }
+
+        extract_workers = (
+            self.scheduler_configs["extract_workers"] or os.cpu_count() or 1
+        )
+
+        async def worker(executor):
+            while not queue.empty():
+                unit = queue.get_nowait()
+                state = file_states[unit["path"]]
+                reserved = await budget.acquire(unit["estimated_bytes"])
+                try:
+                    records = await self.run_unit(
+                        unit, pc_index, executor, extract_workers, state
+                    )
+                    report["records"] += records
+                    report["pages" if unit["file_type"] == "pdf" else "rows"] += (
+                        unit["end"] - unit["start"]
+                    )
+                    report["source_bytes"] += unit["source_bytes"]
+                    report["namespaces"].add(self.get_namespace(unit["path"]))
+                    metrics.inc("scheduler_units_total", 1, {"status": "done"})
+                except Exception as e:
+                    logger.error(
+                        f"Error ingesting {unit['path']} [{unit['start']}:{unit['end']}]: {e}"
+                    )
+                    state["failed"] = True
+                    report["failed_units"].append({**unit, "error": str(e)})
+                    metrics.inc("scheduler_units_total", 1, {"status": "failed"})
+                finally:
+                    await budget.release(reserved)
+                state["pending"] -= 1
+                if state["pending"] == 0 and not state["failed"]:
+                    try:
+                        report["deleted"] += await self.delete_removed_records(
+                            pc_index, unit["path"], state
+                        )
+                    except Exception as e:
+                        # The file's vectors are upserted; stale ones are
+                        # deleted by the next run
+                        logger.error(
+                            f"Error deleting removed records of {unit['path']}: {e}"
+                        )
+                        report["failed_deletes"].append(
+                            {"path": unit["path"], "error": str(e)}
+                        )
+
+        # Spawned, see extract_pages
+        with ProcessPoolExecutor(
+            max_workers=extract_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            await asyncio.gather(
+                *[
+                    worker(executor)
+                    for _ in range(self.scheduler_configs["concurrency"])
+                ]
+            )
+
+        report["peak_in_flight_bytes"] = budget.peak
+        report["namespaces"] = sorted(report["namespaces"])
+        return report
@@ -0,0 +1,235 @@
+import json
+import time
+import random
+import asyncio
+import logging
+import numpy as np
+from typing import Callable, List, Optional, TypedDict
+from Instrumentation.Metrics import metrics
+from .RecordBatch import iter_record_slices
+
+logger = logging.getLogger(__name__)
+
+# JSON bytes per vector value: a float32 written as a Python float repr,
+# e.g. "-0.034127116203308105, "
+VALUE_BYTES = 22
+# id, "values" and "metadata" keys, braces and separators
+RECORD_OVERHEAD_BYTES = 48
+
+# HTTP statuses worth retrying: throttling and server side failures
+retryable_statuses = {408, 429, 500, 502, 503, 504}
+# Request too large for the server: split the batch instead of retrying it
+too_large_statuses = {413}
+
+
+class UpsertConfigs(TypedDict):
+    max_batch_bytes: Optional[int]
+    max_batch_records: Optional[int]
+    concurrency: Optional[int]
+    max_retries: Optional[int]
+    backoff_base: Optional[float]
+    backoff_max: Optional[float]
+
+
+default_upsert_configs: UpsertConfigs = {
+    # Pinecone accepts at most 2 MB and 1000 records per upsert request
+    "max_batch_bytes": 1_800_000,
+    "max_batch_records": 1000,
+    # Requests in flight at once
+    "concurrency": 4,
+    # Attempts after the first one for throttled and transient failures,
+    # waiting a random time up to min(backoff_max, backoff_base * 2**attempt)
+    "max_retries": 5,
+    "backoff_base": 0.5,
+    "backoff_max": 20.0,
+}
+
+
+def record_bytes(record: dict) -> int:
+    # Estimated JSON size of one record in an upsert request
+    metadata = record.get("metadata") or {}
+    return (
+        RECORD_OVERHEAD_BYTES
+        + len(record["id"])
+        + len(record["values"]) * VALUE_BYTES
+        + len(json.dumps(metadata, ensure_ascii=False, default=str).encode("utf-8"))
+    )
+
+
+def plan_upsert_batches(records, max_batch_bytes: int, max_batch_records: int):
+    # Yields lists of record dicts of at most max_batch_bytes estimated bytes
+    # and max_batch_records records. A record above max_batch_bytes on its own
+    # is sent alone and left to the server to accept or reject.
+    batch = []
+    batch_bytes = 0
+    # RecordBatch rows are materialized one slice at a time
+    for part in iter_record_slices(records, max_batch_records):
+        for record in part:
+            size = record_bytes(record)
+            if batch and (
+                batch_bytes + size > max_batch_bytes or len(batch) >= max_batch_records
+            ):
+                yield batch, batch_bytes
+                batch, batch_bytes = [], 0
+            batch.append(record)
+            batch_bytes += size
+    if batch:
+        yield batch, batch_bytes
+
+
+def error_status(error: Exception) -> Optional[int]:
+    # HTTP status of a Pinecone, aiohttp or stub client error, when there is one
+    for attribute in ("status", "status_code", "code"):
+        status = getattr(error, attribute, None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    status = error_status(error)
+    if status is not None:
+        return status in retryable_statuses
+    # aiohttp client errors without a status are connection level failures
+    return type(error).__module__.startswith("aiohttp")
+
+
+def is_too_large(error: Exception) -> bool:
+    status = error_status(error)
+    if status in too_large_statuses:
+        return True
+    message = str(error).lower()
+    return status == 400 and ("too large" in message or "exceeds" in message)
+
+
+class UpsertEngine:
+    # Upserts records in batches sized by estimated request bytes, with up to
+    # `concurrency` requests in flight, jittered exponential backoff on
+    # throttling and transient errors, and batches split in half when the
+    # server rejects them as too large. Records may be a list of dicts or a
+    # RecordBatch. Returns per-call stats and records upsert_batch_seconds,
+    # upsert_retries_total and upsert_vectors_total metrics.
+    def __init__(self, configs: Optional[UpsertConfigs] = None):
+        configs = {**default_upsert_configs, **(configs or {})}
+        self.max_batch_bytes = configs["max_batch_bytes"]
+        self.max_batch_records = configs["max_batch_records"]
+        self.concurrency = configs["concurrency"]
+        self.max_retries = configs["max_retries"]
+        self.backoff_base = configs["backoff_base"]
+        self.backoff_max = configs["backoff_max"]
+
+        if min(self.max_batch_bytes, self.max_batch_records, self.concurrency) < 1:
+            raise ValueError(
+                "max_batch_bytes, max_batch_records and concurrency must be at least 1"
+            )
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter, so throttled workers do not retry in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def _send(self, index, batch: List[dict], namespace: str, stats: dict):
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                await index.upsert(vectors=batch, namespace=namespace, batch_size=len(batch))
+            except Exception as e:
+                if is_too_large(e) and len(batch) > 1:
+                    logger.warning(
+                        f"Upsert of {len(batch)} records rejected as too large, splitting"
+                    )
+                    stats["splits"] += 1
+                    middle = len(batch) // 2
+                    await self._send(index, batch[:middle], namespace, stats)
+                    await self._send(index, batch[middle:], namespace, stats)
+                    return
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                attempt += 1
+                stats["retries"] += 1
+                metrics.inc("upsert_retries_total", 1, {"status": str(error_status(e))})
+                logger.warning(
+                    f"Upsert failed ({e}), retry {attempt}/{self.max_retries} in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            seconds = time.perf_counter() - started
+            stats["latencies"].append(seconds)
+            stats["batches"] += 1
+            stats["vectors"] += len(batch)
+            metrics.observe("upsert_batch_seconds", seconds)
+            metrics.inc("upsert_vectors_total", len(batch))
+            return
+
+    async def upsert(
+        self,
+        index,
+        records,
+        namespace: str = "",
+        on_batch: Optional[Callable[[List[dict]], None]] = None,
+    ) -> dict:
+        # on_batch(batch) runs after each batch is accepted, e.g. to record its
+        # ids in the Manifest. The first batch that still fails after its
+        # retries cancels the others and is raised.
+        stats = {
+            "vectors": 0,
+            "batches": 0,
+            "bytes": 0,
+            "retries": 0,
+            "splits": 0,
+            "latencies": [],
+        }
+        if records is None or len(records) == 0:
+            return self._summary(stats, 0.0)
+
+        started = time.perf_counter()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def produce():
+            for batch, batch_bytes in plan_upsert_batches(
+                records, self.max_batch_bytes, self.max_batch_records
+            ):
+                stats["bytes"] += batch_bytes
+                await queue.put(batch)
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def consume():
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    return
+                await self._send(index, batch, namespace, stats)
+                if on_batch is not None:
+                    on_batch(batch)
+
+        tasks = [asyncio.create_task(produce())] + [
+            asyncio.create_task(consume()) for _ in range(self.concurrency)
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        return self._summary(stats, time.perf_counter() - started)
+
+    @staticmethod
+    def _summary(stats: dict, seconds: float) -> dict:
+        latencies = np.asarray(stats.pop("latencies")) * 1000
+        stats["seconds"] = seconds
+        stats["vectors_per_second"] = stats["vectors"] / seconds if seconds else 0.0
+        for p in (50, 90, 99):
+            stats[f"p{p}_batch_ms"] = (
+                float(np.percentile(latencies, p)) if len(latencies) else None
+            )
+        return stats
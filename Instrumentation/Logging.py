@@ -0,0 +1,28 @@
+import logging
+from typing import Optional, Union
+
+# Top-level packages and modules of this project; each module logs to
+# logging.getLogger(__name__), so these are the parents of every logger
+package_loggers = [
+    "PineconeRag",
+    "Ingest",
+    "Retrieval",
+    "Embedding",
+    "VectorStore",
+    "Instrumentation",
+]
+
+DEFAULT_LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def configure_logging(
+    level: Union[int, str, None] = "INFO", format: Optional[str] = None
+):
+    # Sets the level of this project's loggers. A stderr handler is only
+    # installed when the application has not configured logging itself.
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    if not logging.getLogger().handlers:
+        logging.basicConfig(format=format or DEFAULT_LOG_FORMAT)
+    for name in package_loggers:
+        logging.getLogger(name).setLevel(level or logging.INFO)
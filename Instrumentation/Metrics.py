@@ -0,0 +1,291 @@
+import os
+import time
+import json
+import pstats
+import cProfile
+import threading
+import contextlib
+from typing import Dict, Iterable, Optional, Tuple
+
+# Upper bounds in seconds, the last bucket is +Inf
+DEFAULT_LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _labels_key(labels: Optional[dict]) -> Tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        # Upper bound of the bucket holding the q-th observation
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    # Process-wide counters, gauges and histograms, keyed by name and labels.
+    # Stages (see stage()) record seconds, runs and processed items, from
+    # which throughput such as pages/s or vectors/s is derived on export.
+    def __init__(self):
+        self.counters: Dict[str, Dict[Tuple, float]] = {}
+        self.gauges: Dict[str, Dict[Tuple, float]] = {}
+        self.histograms: Dict[str, Dict[Tuple, Histogram]] = {}
+        self.profile_stages = set()
+        self.profile_dir = None
+        # cProfile allows one active profiler at a time, so overlapping stages
+        # (e.g. concurrent pipeline workers) are only profiled by the first
+        self._profiling = False
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, labels: Optional[dict] = None):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _labels_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[dict] = None):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_labels_key(labels)] = value
+
+    def observe(self, name: str, value: float, labels: Optional[dict] = None):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            key = _labels_key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, labels: Optional[dict] = None):
+        # Observes the duration of the block in histogram `name`
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, labels)
+
+    def stage(self, name: str):
+        return Stage(self, name)
+
+    def enable_profiling(self, stages: Iterable[str], profile_dir: str):
+        # Each run of a listed stage is profiled with cProfile and written to
+        # <profile_dir>/<stage>-<timestamp>.prof
+        self.profile_stages = set(stages)
+        self.profile_dir = profile_dir
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def to_dict(self):
+        with self._lock:
+            stages = {}
+            for labels, seconds in self.counters.get("stage_seconds_total", {}).items():
+                stage = dict(labels)["stage"]
+                stages[stage] = {
+                    "seconds": seconds,
+                    "runs": self.counters["stage_runs_total"].get(labels, 0),
+                    "items": {},
+                    "per_second": {},
+                }
+            for labels, items in self.counters.get("stage_items_total", {}).items():
+                labels = dict(labels)
+                entry = stages.get(labels["stage"])
+                if entry is None:
+                    continue
+                entry["items"][labels["unit"]] = items
+                if entry["seconds"] > 0:
+                    entry["per_second"][labels["unit"]] = items / entry["seconds"]
+
+            def series(metrics):
+                return {
+                    name: [
+                        {"labels": dict(labels), "value": value}
+                        for labels, value in values.items()
+                    ]
+                    for name, values in metrics.items()
+                }
+
+            histograms = {
+                name: [
+                    {
+                        "labels": dict(labels),
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                        "buckets": dict(
+                            zip(
+                                [str(bound) for bound in histogram.buckets] + ["+Inf"],
+                                histogram.counts,
+                            )
+                        ),
+                        "p50": histogram.quantile(0.5),
+                        "p90": histogram.quantile(0.9),
+                        "p99": histogram.quantile(0.99),
+                    }
+                    for labels, histogram in values.items()
+                ]
+                for name, values in self.histograms.items()
+            }
+            return {
+                "stages": stages,
+                "counters": series(self.counters),
+                "gauges": series(self.gauges),
+                "histograms": histograms,
+            }
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent, default=str)
+
+    def to_prometheus(self, prefix: str = "pinecone_rag_") -> str:
+        # Prometheus text exposition format
+        lines = []
+        with self._lock:
+            for name, values in self.counters.items():
+                lines.append(f"# TYPE {prefix}{name} counter")
+                for labels, value in values.items():
+                    lines.append(f"{prefix}{name}{_format_labels(labels)} {value}")
+            for name, values in self.gauges.items():
+                lines.append(f"# TYPE {prefix}{name} gauge")
+                for labels, value in values.items():
+                    lines.append(f"{prefix}{name}{_format_labels(labels)} {value}")
+            for name, values in self.histograms.items():
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for labels, histogram in values.items():
+                    cumulative = 0
+                    for bound, count in zip(
+                        [str(bound) for bound in histogram.buckets] + ["+Inf"],
+                        histogram.counts,
+                    ):
+                        cumulative += count
+                        bucket_labels = labels + (("le", bound),)
+                        lines.append(
+                            f"{prefix}{name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+                        )
+                    lines.append(
+                        f"{prefix}{name}_sum{_format_labels(labels)} {histogram.sum}"
+                    )
+                    lines.append(
+                        f"{prefix}{name}_count{_format_labels(labels)} {histogram.count}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str):
+        # Format from the extension: .prom for Prometheus text, JSON otherwise
+        content = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+class Stage:
+    # Times one run of a pipeline stage, as a sync or async context manager:
+    #
+    #   with metrics.stage("extract") as stage:
+    #       pages = ...
+    #       stage.add(pages=len(pages))
+    def __init__(self, metrics: Metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+        self.items = {}
+        self.seconds = 0.0
+        self._profiler = None
+
+    def add(self, **items):
+        for unit, count in items.items():
+            self.items[unit] = self.items.get(unit, 0) + count
+
+    def __enter__(self):
+        if self.name in self.metrics.profile_stages and not self.metrics._profiling:
+            self.metrics._profiling = True
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.metrics._profiling = False
+            self._write_profile()
+        labels = {"stage": self.name}
+        self.metrics.inc("stage_seconds_total", self.seconds, labels)
+        self.metrics.inc("stage_runs_total", 1, labels)
+        if exc_type is not None:
+            self.metrics.inc("stage_errors_total", 1, labels)
+        for unit, count in self.items.items():
+            unit_labels = {"stage": self.name, "unit": unit}
+            self.metrics.inc("stage_items_total", count, unit_labels)
+            if self.seconds > 0:
+                self.metrics.set_gauge(
+                    "stage_last_per_second", count / self.seconds, unit_labels
+                )
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def _write_profile(self):
+        # Profiles only see the thread that entered the stage; work handed to
+        # worker threads or processes shows up as waiting time
+        profile_dir = self.metrics.profile_dir or "."
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.join(
+            profile_dir, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}-{id(self):x}.prof"
+        )
+        pstats.Stats(self._profiler).dump_stats(path)
+
+
+# Shared by PineconeRag, Ingest, both processors, the pipeline and Retrieval
+metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    return metrics
@@ -1,20 +1,27 @@
-import os
-from dotenv import load_dotenv
-from pinecone import Pinecone, PineconeAsyncio, ServerlessSpec
+import logging
+import asyncio
 from enum import Enum
 from pprint import pprint
-from typing import TypedDict, Optional
+from typing import TypedDict, Optional, List
 from Ingest.CSVProcessor import CSVProcessor
 from Ingest.PDFProcessor import PDFProcessor
 from Ingest.Ingest import Ingest
+from Ingest.Pipeline import IngestPipeline, DEFAULT_BATCH_SIZE
+from Ingest.Scheduler import IngestScheduler
+from Ingest.Checkpoint import Checkpoint, checkpointed_pipeline
+from Ingest.Manifest import Manifest
+from Ingest.ExtractionCache import get_extraction_cache
+from Ingest.UpsertEngine import UpsertEngine
 from Retrieval.Retrieval import Retrieval
+from Retrieval.RetrievalService import RetrievalService
+from Embedding.ModelRegistry import get_model, warmup
+from Embedding.EmbeddingPool import EmbeddingPool, get_ingest_model
+from Embedding.EmbeddingCache import get_embedding_cache
+from VectorStore.ConnectionManager import ConnectionManager
+from Instrumentation.Metrics import metrics
+from Instrumentation.Logging import configure_logging
 
-load_dotenv()
-
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-
-if not PINECONE_API_KEY:
-    raise ValueError("Pinecone API key not set.")
+logger = logging.getLogger(__name__)
 
 
 class SupportedFileTypes(Enum):
@@ -31,36 +38,124 @@ class PineconeRag:
         self.configs = configs
         self.file_configs = configs["file_configs"]
         self.pinecone_configs = configs["pinecone_configs"]
-        self.Embedder = Ingest(configs)
-        self.Retrieval = Retrieval(configs)
+        self.embedding_configs = configs.get("embedding_configs", {})
+        self.ingest_configs = configs.get("ingest_configs", {})
+        self.instrumentation_configs = configs.get("instrumentation_configs", {})
+        if self.instrumentation_configs.get("log_level"):
+            configure_logging(self.instrumentation_configs["log_level"])
+        if self.instrumentation_configs.get("profile_stages"):
+            metrics.enable_profiling(
+                self.instrumentation_configs["profile_stages"],
+                self.instrumentation_configs.get("profile_dir") or "profiles",
+            )
+        # Tracks upserted ids so re-ingestion only touches new, changed and removed chunks
+        self.manifest = (
+            Manifest(self.ingest_configs["manifest_path"])
+            if self.ingest_configs.get("manifest_path")
+            else None
+        )
+        # Page text of PDFs extracted in earlier runs, see ExtractionCache
+        self.extraction_cache = get_extraction_cache(
+            self.ingest_configs.get("extraction_cache_path")
+        )
+        # Byte-sized, concurrent and retried upsert requests
+        self.upsert_engine = UpsertEngine(configs.get("upsert_configs"))
+        # One shared model for ingestion and retrieval, see ModelRegistry
+        self.model = get_model(self.embedding_configs)
+        # Ingestion shards its batches over worker processes when
+        # embedding_configs["workers"] is set; queries stay in process
+        self.ingest_model = get_ingest_model(self.embedding_configs)
+        self.embedding_cache = get_embedding_cache(self.embedding_configs)
+        # Pooled client and cached index handles, closed by close(). Fails here
+        # rather than at import when the Pinecone API key is missing.
+        self.connection = ConnectionManager(configs)
+        self.Embedder = Ingest(
+            configs,
+            model=self.ingest_model,
+            embedding_cache=self.embedding_cache,
+            connection=self.connection,
+        )
+        self.Retrieval = Retrieval(
+            configs,
+            model=self.model,
+            embedding_cache=self.embedding_cache,
+            connection=self.connection,
+        )
+        # Micro-batches prompt() calls while running, see start_service()
+        self.service = None
 
         if not self.file_configs["file_type"].lower() in supported_file_types:
           raise ValueError(
               f"File type '{self.file_configs['file_type']}' not supported. Supported file types: {', '.join(supported_file_types)}"
           )
-        
+
+    def warmup(self):
+        # Pay model load and first-batch costs up front instead of on the first query
+        if isinstance(self.ingest_model, EmbeddingPool):
+            self.ingest_model.start()
+        return warmup(self.embedding_configs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start_service(self) -> RetrievalService:
+        # Long-lived mode for serving many concurrent prompt() calls: queries
+        # arriving within retrieval_configs["service_max_wait_ms"] of each
+        # other share one encode call. Stopped by stop_service() or close().
+        if self.service is None or not self.service.running:
+            retrieval_configs = self.configs.get("retrieval_configs", {})
+            self.service = RetrievalService(
+                self.Retrieval,
+                max_batch_size=retrieval_configs.get("service_max_batch_size"),
+                max_wait_ms=retrieval_configs.get("service_max_wait_ms"),
+            )
+            await self.service.start()
+        return self.service
+
+    async def stop_service(self):
+        # Pending queries are answered before it returns
+        if self.service is not None:
+            await self.service.stop()
+            self.service = None
+
+    async def close(self):
+        await self.stop_service()
+        await self.connection.close()
+        if self.embedding_cache is not None:
+            await asyncio.to_thread(self.embedding_cache.flush)
+        if isinstance(self.ingest_model, EmbeddingPool):
+            await asyncio.to_thread(self.ingest_model.close)
+        if self.instrumentation_configs.get("metrics_path"):
+            self.export_metrics()
+
+    def export_metrics(self, path: Optional[str] = None):
+        # Writes stage timings, throughput, queue depths and query latency
+        # histograms to path (.prom for Prometheus text, JSON otherwise).
+        # Without a path or metrics_path, returns them as a dict.
+        path = path or self.instrumentation_configs.get("metrics_path")
+        if not path:
+            return metrics.to_dict()
+        metrics.export(path)
+        logger.info(f"Metrics written to {path}")
+        return path
+
     async def get_index(self):
-      try:
-        async with PineconeAsyncio(api_key=self.pinecone_configs["api_key"]) as pc:
-          if not await pc.has_index(self.pinecone_configs["name"]):
-              print("Creating index")
-              pc_config = self.pinecone_configs.copy()
-              for k in ( 'api_key', 'host', 'namespace'):
-                  pc_config.pop(k, None)
-              pc_index = await pc.create_index(**pc_config)
-          else:
-              if not self.pinecone_configs["host"]:
-                  raise KeyError("PineconeConfig missing 'host' key")
-
-              print("Using existing index")
-              pc_index = pc.IndexAsyncio(self.pinecone_configs["host"])
-
-              if not pc_index:
-                  raise ValueError("Failed to initialize a Pinecone index")
-          
-          return pc_index
-      except Exception as e:
-        print(f"Error getting or creating index: {e}")
+        # Pinecone index or local store, depending on vector_store_configs.backend
+        try:
+            return await self.connection.get_vector_store()
+        except Exception as e:
+            logger.error(f"Error getting or creating index: {e}")
+            raise
+
+    def get_namespace(self):
+        return (
+            self.pinecone_configs["namespace"]
+            if self.pinecone_configs["namespace"]
+            else self.file_configs["file_name"]
+        )
 
     async def ingest(self):
         try:
@@ -69,43 +164,225 @@ class PineconeRag:
             file_type = self.file_configs["file_type"].lower()
 
             if file_type == SupportedFileTypes.PDF.value:
-                print("initializing processor")
-                dataset_processor = PDFProcessor(configs=self.file_configs)
+                logger.debug("initializing processor")
+                dataset_processor = PDFProcessor(
+                    configs=self.file_configs,
+                    model=self.ingest_model,
+                    embedding_cache=self.embedding_cache,
+                    embedding_configs=self.embedding_configs,
+                    extraction_cache=self.extraction_cache,
+                )
             elif file_type == SupportedFileTypes.CSV.value:
-                dataset_processor = CSVProcessor(configs=self.file_configs)
+                dataset_processor = CSVProcessor(
+                    configs=self.file_configs,
+                    model=self.ingest_model,
+                    embedding_cache=self.embedding_cache,
+                    embedding_configs=self.embedding_configs,
+                )
+
+            namespace = self.get_namespace()
+            if self.manifest:
+                dataset_processor.skip_ids = self.manifest.get_ids(
+                    namespace, self.file_configs["file_name"]
+                )
+
+            if self.ingest_configs.get("checkpoint_dir"):
+                return await self.ingest_checkpointed(pc_index, dataset_processor)
 
-            records = await dataset_processor.run(return_records=True)
-            # print("pinecone_records", len(records))
+            if self.ingest_configs.get("pipelined"):
+                return await self.ingest_pipelined(pc_index, dataset_processor)
 
-            # return records
+            if file_type == SupportedFileTypes.CSV.value and self.file_configs.get(
+                "chunk_size"
+            ):
+                return await self.ingest_stream(pc_index, dataset_processor)
+
+            await dataset_processor.extract_text_content()
+            # With a manifest, chunks only holds new or changed chunks
+            if dataset_processor.chunks:
+                await dataset_processor.embeded_text_content()
+                await dataset_processor.prepare_records_for_upsert()
+            records = dataset_processor.get_pinecone_records()
 
             # embedder = Embedder(configs=self.configs)
             # records = await self.Embedder.process()
 
-            if not records or len(records) == 0:
+            if not dataset_processor.seen_ids:
                 raise ValueError("No records to embed")
 
-            await pc_index.upsert(
-                vectors=records,
-                namespace=(
-                    self.pinecone_configs["namespace"]
-                    if self.pinecone_configs["namespace"]
-                    else self.file_configs["file_name"]
-                ),
-                batch_size=100,
-            )
-            print(f"Successfully upserted all {len(records)} records")
+            if records:
+                await self.upsert_records(pc_index, records)
+            await self.delete_removed_records(pc_index, dataset_processor)
+            logger.info(f"Successfully upserted all {len(records)} records")
 
             return pc_index
         except Exception as e:
-            print(f"Error upserting records: {e}")
+            logger.error(f"Error upserting records: {e}")
             raise
 
+    async def ingest_directory(self, source):
+        # Ingests every PDF and CSV of a directory, manifest file or list of
+        # paths, see IngestScheduler. Returns the throughput report.
+        scheduler = IngestScheduler(
+            self.configs,
+            model=self.ingest_model,
+            embedding_cache=self.embedding_cache,
+            connection=self.connection,
+            manifest=self.manifest,
+        )
+        report = await scheduler.run(source)
+        for namespace in report["namespaces"]:
+            self.Retrieval.invalidate_namespace(namespace)
+        return report
+
+    async def ingest_stream(self, pc_index, dataset_processor):
+        # Upserts each chunk as soon as it is embedded so only one chunk of
+        # records is held in memory at a time
+        total = 0
+        async for records in dataset_processor.stream_records():
+            await self.upsert_records(pc_index, records)
+            total += len(records)
+
+        if not dataset_processor.seen_ids:
+            raise ValueError("No records to embed")
+
+        await self.delete_removed_records(pc_index, dataset_processor)
+        logger.info(f"Successfully upserted all {total} records")
+        return pc_index
+
+    async def ingest_pipelined(self, pc_index, dataset_processor):
+        # Extraction, embedding and upserts overlap through bounded queues
+        async def upsert(records):
+            await self.upsert_records(pc_index, records)
+
+        pipeline = IngestPipeline(
+            source=lambda: dataset_processor.iter_text_batches(
+                batch_size=self.ingest_configs.get("batch_size") or DEFAULT_BATCH_SIZE
+            ),
+            embed=dataset_processor.embed_batch,
+            upsert=upsert,
+            configs={
+                key: self.ingest_configs[key]
+                for key in ("queue_size", "embed_concurrency", "upsert_concurrency")
+                if self.ingest_configs.get(key)
+            },
+        )
+        stats = await pipeline.run()
+
+        if not dataset_processor.seen_ids:
+            raise ValueError("No records to embed")
+
+        await self.delete_removed_records(pc_index, dataset_processor)
+
+        logger.info(f"Successfully upserted all {stats['upserted_records']} records")
+        return pc_index
+
+    async def ingest_checkpointed(self, pc_index, dataset_processor):
+        # Like ingest_pipelined, with every batch persisted under checkpoint_dir
+        # so a failed run resumes from the last upserted batch
+        checkpoint = await asyncio.to_thread(
+            Checkpoint,
+            self.ingest_configs["checkpoint_dir"],
+            dataset_processor.get_pdf_path()
+            if isinstance(dataset_processor, PDFProcessor)
+            else dataset_processor.get_csv_path(),
+            {
+                "file_configs": self.file_configs,
+                "model_name": self.embedding_configs.get("model_name"),
+                "backend": self.embedding_configs.get("backend"),
+                "namespace": self.get_namespace(),
+            },
+        )
+
+        async def upsert(records):
+            await self.upsert_records(pc_index, records)
+
+        pipeline = checkpointed_pipeline(
+            dataset_processor,
+            checkpoint,
+            upsert,
+            batch_size=self.ingest_configs.get("batch_size") or DEFAULT_BATCH_SIZE,
+            configs={
+                key: self.ingest_configs[key]
+                for key in ("queue_size", "embed_concurrency", "upsert_concurrency")
+                if self.ingest_configs.get(key)
+            },
+        )
+        stats = await pipeline.run()
+
+        if not dataset_processor.seen_ids:
+            raise ValueError("No records to embed")
+
+        await self.delete_removed_records(pc_index, dataset_processor)
+        checkpoint.remove()
+
+        logger.info(f"Successfully upserted all {stats['upserted_records']} records")
+        return pc_index
+
+    async def upsert_records(self, pc_index, records):
+        # records is a list of dicts or a RecordBatch; a RecordBatch is turned
+        # into dicts one upsert request at a time, see UpsertEngine
+        namespace = self.get_namespace()
+
+        def on_batch(batch):
+            if self.manifest:
+                self.manifest.add(
+                    namespace,
+                    self.file_configs["file_name"],
+                    [record["id"] for record in batch],
+                )
+
+        async with metrics.stage("upsert") as stage:
+            result = await self.upsert_engine.upsert(
+                pc_index, records, namespace, on_batch=on_batch
+            )
+            stage.add(vectors=result["vectors"])
+        logger.debug(
+            f"Upserted {result['vectors']} vectors in {result['batches']} requests: "
+            f"{result['vectors_per_second']:.1f} vectors/s, p50 {result['p50_batch_ms']}ms, {result['retries']} retries"
+        )
+        # Cached query results of this namespace may now be stale
+        self.Retrieval.invalidate_namespace(namespace)
+
+    async def delete_removed_records(self, pc_index, dataset_processor):
+        # Vectors of chunks that are no longer in the file, only known with a
+        # manifest and when the whole file was read
+        if not self.manifest:
+            return
+
+        ranges = ("start_on_page", "end_on_page", "start_row", "end_row")
+        if any(self.file_configs.get(key) for key in ranges):
+            return
+
+        namespace = self.get_namespace()
+        removed = list(dataset_processor.skip_ids - dataset_processor.seen_ids)
+        if not removed:
+            return
+
+        logger.info(f"Deleting {len(removed)} records removed from the file")
+        # Pinecone accepts at most 1000 ids per delete request
+        for i in range(0, len(removed), 1000):
+            batch = removed[i : i + 1000]
+            await pc_index.delete(ids=batch, namespace=namespace)
+            self.manifest.remove(namespace, batch)
+            metrics.inc("records_deleted_total", len(batch))
+        self.Retrieval.invalidate_namespace(namespace)
+
     async def prompt(self, text: str):
         try:
-            print("retrieval " + text)
+            logger.debug("retrieval " + text)
             #  retrieval = Retrieval()
-            return await self.Retrieval.query(text)
+            if self.service is not None and self.service.running:
+                return await self.service.query(self.get_namespace(), text)
+            return await self.Retrieval.query(self.get_namespace(), text)
         except Exception as e:
-            print(f"Error in retrieval: {e}")
+            logger.error(f"Error in retrieval: {e}")
             raise
+
+    async def prompt_many(self, texts: List[str]):
+        # One result per text, in order, see Retrieval.query_many
+        return await self.Retrieval.query_many(self.get_namespace(), texts)
+
+    async def prompt_lean(self, text: str, top_k: int = 3):
+        # Ids and scores only, metadata is fetched on first access
+        return await self.Retrieval.query_lean(self.get_namespace(), text, top_k)
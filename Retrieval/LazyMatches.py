@@ -0,0 +1,89 @@
+import asyncio
+from typing import List, Optional
+from .QueryCache import LRUCache
+
+DEFAULT_HYDRATION_CACHE_SIZE = 4096
+
+
+class LazyMatch:
+    # Id and score come with the query; metadata and values are fetched on
+    # first access, together with every other match of the same result
+    def __init__(self, parent, id: str, score: float):
+        self._parent = parent
+        self.id = id
+        self.score = score
+
+    async def get_metadata(self) -> dict:
+        record = await self._parent.get_record(self.id)
+        return record["metadata"] if record else {}
+
+    async def get_values(self) -> List[float]:
+        record = await self._parent.get_record(self.id)
+        return record["values"] if record else []
+
+    async def get_original_text(self) -> Optional[str]:
+        return (await self.get_metadata()).get("original_text")
+
+    def __repr__(self):
+        return f"LazyMatch(id={self.id!r}, score={self.score})"
+
+
+class LazyMatches:
+    # Lean query result: holds ids and scores only. The first access to any
+    # match's metadata or values hydrates all matches in one fetch request.
+    # Hydrated records are kept in a small cache shared across queries.
+    def __init__(
+        self, pc_index, namespace: str, matches, hydration_cache: LRUCache
+    ):
+        self.pc_index = pc_index
+        self.namespace = namespace
+        self.hydration_cache = hydration_cache
+        self.matches = [
+            LazyMatch(self, match["id"], match["score"]) for match in matches
+        ]
+        self.records = {}  # id -> {"id", "values", "metadata"} once hydrated
+        self._hydrating = None
+
+    def __len__(self):
+        return len(self.matches)
+
+    def __iter__(self):
+        return iter(self.matches)
+
+    def __getitem__(self, index):
+        return self.matches[index]
+
+    async def get_record(self, id: str):
+        if id not in self.records:
+            await self.hydrate()
+        return self.records.get(id)
+
+    async def hydrate(self):
+        # Concurrent first accesses share a single fetch
+        hydrating = self._hydrating
+        if hydrating is None:
+            hydrating = self._hydrating = asyncio.ensure_future(self._fetch_missing())
+        try:
+            await hydrating
+        finally:
+            if self._hydrating is hydrating and hydrating.done():
+                self._hydrating = None
+        return self
+
+    async def _fetch_missing(self):
+        missing = []
+        for match in self.matches:
+            if match.id in self.records:
+                continue
+            record = self.hydration_cache.get((self.namespace, match.id))
+            if record is None:
+                missing.append(match.id)
+            else:
+                self.records[match.id] = record
+        if not missing:
+            return
+
+        response = await self.pc_index.fetch(ids=missing, namespace=self.namespace)
+        for id, record in response["vectors"].items():
+            self.records[id] = record
+            self.hydration_cache.put((self.namespace, id), record)
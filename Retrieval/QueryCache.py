@@ -0,0 +1,117 @@
+import copy
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+from Embedding.EmbeddingCache import normalize_text
+
+DEFAULT_EMBEDDING_CACHE_SIZE = 4096
+DEFAULT_RESULT_CACHE_SIZE = 1024
+DEFAULT_RESULT_CACHE_TTL = 300
+
+
+class LRUCache:
+    # Least recently used eviction past max_entries, and optional expiry of
+    # entries older than ttl seconds
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (stored_at, value)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def remove(self, keys):
+        with self._lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def vector_hash(vector) -> str:
+    return hashlib.sha1(vector.tobytes()).hexdigest()
+
+
+class QueryCache:
+    # Two levels in front of the retrieval path:
+    #   normalized query text -> embedding (LRU)
+    #   (namespace, vector hash, top_k, include flags) -> matches (LRU + TTL)
+    # Results of a namespace are dropped by invalidate_namespace whenever
+    # PineconeRag writes to it.
+    def __init__(
+        self,
+        embedding_cache_size: int = DEFAULT_EMBEDDING_CACHE_SIZE,
+        result_cache_size: int = DEFAULT_RESULT_CACHE_SIZE,
+        result_cache_ttl: Optional[float] = DEFAULT_RESULT_CACHE_TTL,
+    ):
+        self.embeddings = LRUCache(embedding_cache_size)
+        # A ttl of 0 disables the result cache
+        self.results = LRUCache(
+            result_cache_size if result_cache_ttl != 0 else 0, ttl=result_cache_ttl
+        )
+        self.invalidations = 0
+
+    def get_embedding(self, text: str):
+        return self.embeddings.get(normalize_text(text))
+
+    def put_embedding(self, text: str, vector):
+        self.embeddings.put(normalize_text(text), vector)
+
+    def result_key(self, namespace, vector, top_k, include_metadata, include_values):
+        return (namespace, vector_hash(vector), top_k, include_metadata, include_values)
+
+    def get_result(self, key):
+        # A fresh copy per hit: callers may sort, filter or edit their matches
+        matches = self.results.get(key)
+        return None if matches is None else list(copy.deepcopy(matches))
+
+    def put_result(self, key, matches):
+        # Stored as a copy, so the caller that filled the cache keeps its own
+        self.results.put(key, tuple(copy.deepcopy(list(matches))))
+
+    def invalidate_namespace(self, namespace: str):
+        # The result cache is bounded, so a scan is cheap next to an upsert
+        self.results.remove(
+            [key for key in list(self.results.entries) if key[0] == namespace]
+        )
+        self.invalidations += 1
+
+    def stats(self):
+        return {
+            "embeddings": self.embeddings.stats(),
+            "results": self.results.stats(),
+            "invalidations": self.invalidations,
+        }
@@ -1,22 +1,78 @@
-import os
-from dotenv import load_dotenv
-from typing import List, Dict, Any, Callable, Optional
-from pinecone import PineconeAsyncio
-from sentence_transformers import SentenceTransformer
+import logging
+import time
+import asyncio
+from typing import List, Dict, Any, Callable, Optional, TypedDict
+from VectorStore.ConnectionManager import ConnectionManager
+from Embedding.ModelRegistry import get_model
+from Embedding.EmbeddingCache import get_embedding_cache
+from Embedding.Encoder import encode_texts
+from Instrumentation.Metrics import metrics
+from .QueryCache import (
+    QueryCache,
+    DEFAULT_EMBEDDING_CACHE_SIZE,
+    DEFAULT_RESULT_CACHE_SIZE,
+    DEFAULT_RESULT_CACHE_TTL,
+    LRUCache,
+)
+from .LazyMatches import LazyMatches, DEFAULT_HYDRATION_CACHE_SIZE
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+# Searches in flight at once for query_many
+DEFAULT_MAX_CONCURRENCY = 16
+
+
+class QueryResult(TypedDict):
+    text: str
+    matches: List[Dict[str, Any]]
+    # Set instead of matches when this query failed
+    error: Optional[Exception]
 
-if not PINECONE_API_KEY:
-    raise ValueError("Pinecone API key not set.")
 
 class Retrieval:
-    def __init__(self, configs):
+    def __init__(self, configs, model=None, embedding_cache=None, connection=None):
         self.configs = configs
         self.file_configs = configs["file_configs"]
         self.pinecone_configs = configs["pinecone_configs"]
-        print(self.configs)
+        self.model = (
+            model
+            if model is not None
+            else get_model(configs.get("embedding_configs"))
+        )
+        self.embedding_cache = (
+            embedding_cache
+            if embedding_cache is not None
+            else get_embedding_cache(configs.get("embedding_configs"))
+        )
+        self.connection = (
+            connection if connection is not None else ConnectionManager(configs)
+        )
+        self.retrieval_configs = configs.get("retrieval_configs", {})
+        self.query_cache = QueryCache(
+            embedding_cache_size=self.retrieval_configs.get(
+                "query_embedding_cache_size", DEFAULT_EMBEDDING_CACHE_SIZE
+            ),
+            result_cache_size=self.retrieval_configs.get(
+                "query_result_cache_size", DEFAULT_RESULT_CACHE_SIZE
+            ),
+            result_cache_ttl=self.retrieval_configs.get(
+                "query_result_cache_ttl", DEFAULT_RESULT_CACHE_TTL
+            ),
+        )
+        # (namespace, id) -> fetched metadata and values for lean queries
+        self.hydration_cache = LRUCache(
+            self.retrieval_configs.get(
+                "hydration_cache_size", DEFAULT_HYDRATION_CACHE_SIZE
+            )
+        )
+
+    def invalidate_namespace(self, namespace: str):
+        # Called after every write to namespace: cached results and hydrated
+        # records of it may be stale
+        self.query_cache.invalidate_namespace(namespace)
+        self.hydration_cache.remove(
+            [key for key in list(self.hydration_cache.entries) if key[0] == namespace]
+        )
 
     async def query(
         self,
@@ -28,49 +84,19 @@ class Retrieval:
         callback: Optional[Callable[[Dict[str, Any]], None]] = None,
         debug: bool = False,
     ):
+        started = time.perf_counter()
         try:
             if not text:
                 raise ValueError("Text to query with is required")
             
-            async with PineconeAsyncio(api_key=self.pinecone_configs["api_key"]) as pc:
-                if not await pc.has_index(self.pinecone_configs["name"]):
-                    print("Creating index")
-                    pc_config = self.pinecone_configs.copy()
-                    pc_config.pop("host")
-                    pc_index = await pc.create_index(**pc_config)
-                else:
-                    if not self.pinecone_configs["host"]:
-                        raise KeyError("PineconeConfig missing 'host' key")
-
-                    print("Using existing index")
-                    pc_index = pc.IndexAsyncio(self.pinecone_configs["host"])
-
-            model = SentenceTransformer(
-                "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
-            )
-            vector = model.encode(text)
-            vector_list = vector.tolist()
-            response = await pc_index.query(
-                namespace=namespace,
-                vector=vector_list,
-                top_k=top_k,
-                include_metadata=include_metadata,
-                include_values=include_values,
-            )
+            pc_index = await self.connection.get_vector_store()
 
-            if not response:
-                print("No response received from Pinecone")
-                return []
-
-            if "matches" not in response:
-                print("No 'matches' key in response")
-                print(f"Response keys: {response.keys() if response else 'None'}")
-                return []
-
-            matches = response["matches"]
+            vector = (await self.embed_queries([text]))[0]
+            matches = await self.search(
+                pc_index, namespace, vector, top_k, include_metadata, include_values
+            )
 
             if not matches:
-                print("No matches found in response")
                 return []
 
             if callback:
@@ -81,18 +107,162 @@ class Retrieval:
                 for match in matches:
                     id = match["id"]
                     score = match["score"]
-                    values = match["values"]
-                    metadata = match["metadata"]
-                    original_text = metadata["original_text"]
-                    print(f"id: {id}")
-                    print(f"score: {score}")
-                    print(f"values: {values}")
-                    print(f"original_text: {original_text}")
+                    values = match.get("values")
+                    metadata = match.get("metadata") or {}
+                    original_text = metadata.get("original_text")
+                    logger.info(f"id: {id}")
+                    logger.info(f"score: {score}")
+                    logger.info(f"values: {values}")
+                    logger.info(f"original_text: {original_text}")
 
             return matches
         except Exception as e:
-            print(f"Error querying Pinecone: {e}")
-            import traceback
+            metrics.inc("query_errors_total", labels={"method": "query"})
+            logger.exception(f"Error querying Pinecone: {e}")
+            return []
+        finally:
+            metrics.observe(
+                "query_latency_seconds",
+                time.perf_counter() - started,
+                {"method": "query"},
+            )
+            metrics.inc("queries_total", labels={"method": "query"})
+
+    async def query_lean(self, namespace: str, text: str, top_k: int = 3):
+        # Fetches only ids and scores; metadata and values are hydrated on
+        # first access with one batched fetch, see LazyMatches
+        if not text:
+            raise ValueError("Text to query with is required")
+
+        with metrics.timer("query_latency_seconds", {"method": "query_lean"}):
+            pc_index = await self.connection.get_vector_store()
+            vector = (await self.embed_queries([text]))[0]
+            matches = await self.search(
+                pc_index,
+                namespace,
+                vector,
+                top_k,
+                include_metadata=False,
+                include_values=False,
+            )
+        return LazyMatches(pc_index, namespace, matches, self.hydration_cache)
+
+    async def embed_queries(self, texts: List[str]):
+        # Repeated questions skip the model through the query embedding LRU
+        vectors = [self.query_cache.get_embedding(text) for text in texts]
+        misses = [index for index, vector in enumerate(vectors) if vector is None]
+        if misses:
+            encoded = await encode_texts(
+                self.model, [texts[index] for index in misses], cache=self.embedding_cache
+            )
+            for index, vector in zip(misses, encoded):
+                self.query_cache.put_embedding(texts[index], vector)
+                vectors[index] = vector
+        return vectors
+
+    async def search(
+        self, pc_index, namespace, vector, top_k, include_metadata, include_values
+    ):
+        key = self.query_cache.result_key(
+            namespace, vector, top_k, include_metadata, include_values
+        )
+        matches = self.query_cache.get_result(key)
+        if matches is not None:
+            metrics.inc("query_result_cache_total", labels={"result": "hit"})
+            return matches
+
+        metrics.inc("query_result_cache_total", labels={"result": "miss"})
+        with metrics.timer("search_latency_seconds"):
+            matches = await self._search(
+                pc_index, namespace, vector, top_k, include_metadata, include_values
+            )
+        self.query_cache.put_result(key, matches)
+        return matches
+
+    async def _search(
+        self, pc_index, namespace, vector, top_k, include_metadata, include_values
+    ):
+        response = await pc_index.query(
+            namespace=namespace,
+            vector=vector.tolist(),
+            top_k=top_k,
+            include_metadata=include_metadata,
+            include_values=include_values,
+        )
 
-            print(f"Full traceback: {traceback.format_exc()}")
+        if not response:
+            logger.warning("No response received from Pinecone")
+            return []
+
+        if "matches" not in response:
+            logger.warning(
+                f"No 'matches' key in response, response keys: {list(response.keys())}"
+            )
             return []
+
+        matches = response["matches"]
+
+        if not matches:
+            logger.debug("No matches found in response")
+            return []
+
+        return matches
+
+    async def query_many(
+        self,
+        namespace: str,
+        texts: List[str],
+        top_k: int = 3,
+        include_metadata: bool = True,
+        include_values: bool = True,
+        max_concurrency: Optional[int] = None,
+    ) -> List[QueryResult]:
+        # Encodes every text in one batched call, then runs the searches
+        # concurrently (at most max_concurrency in flight). Results are in the
+        # order of texts; a failing query sets its own "error" and does not
+        # affect the others.
+        results = [{"text": text, "matches": [], "error": None} for text in texts]
+        valid = [index for index, text in enumerate(texts) if text]
+        for index, text in enumerate(texts):
+            if not text:
+                results[index]["error"] = ValueError("Text to query with is required")
+
+        if not valid:
+            return results
+
+        started = time.perf_counter()
+        pc_index = await self.connection.get_vector_store()
+        vectors = await self.embed_queries([texts[index] for index in valid])
+
+        semaphore = asyncio.Semaphore(
+            max_concurrency
+            or self.retrieval_configs.get("max_concurrency")
+            or DEFAULT_MAX_CONCURRENCY
+        )
+
+        async def run(index, vector):
+            async with semaphore:
+                try:
+                    results[index]["matches"] = await self.search(
+                        pc_index,
+                        namespace,
+                        vector,
+                        top_k,
+                        include_metadata,
+                        include_values,
+                    )
+                except Exception as e:
+                    metrics.inc("query_errors_total", labels={"method": "query_many"})
+                    logger.error(f"Error querying Pinecone for query {index}: {e}")
+                    results[index]["error"] = e
+
+        await asyncio.gather(
+            *[run(index, vector) for index, vector in zip(valid, vectors)]
+        )
+        metrics.observe(
+            "query_latency_seconds",
+            time.perf_counter() - started,
+            {"method": "query_many"},
+        )
+        metrics.inc("queries_total", len(valid), {"method": "query_many"})
+        return results
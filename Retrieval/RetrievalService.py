@@ -0,0 +1,226 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+from Instrumentation.Metrics import metrics
+from .Retrieval import DEFAULT_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# Queries embedded together at most, and how long the first query of a batch
+# waits for others to arrive
+DEFAULT_SERVICE_MAX_BATCH_SIZE = 32
+DEFAULT_SERVICE_MAX_WAIT_MS = 5.0
+
+
+class _Request:
+    __slots__ = (
+        "namespace",
+        "text",
+        "top_k",
+        "include_metadata",
+        "include_values",
+        "future",
+        "submitted",
+    )
+
+    def __init__(self, namespace, text, top_k, include_metadata, include_values, future):
+        self.namespace = namespace
+        self.text = text
+        self.top_k = top_k
+        self.include_metadata = include_metadata
+        self.include_values = include_values
+        self.future = future
+        self.submitted = time.perf_counter()
+
+
+class RetrievalService:
+    # Long-lived micro-batching front of a Retrieval. Queries that arrive
+    # within max_wait_ms of the first pending one (or until max_batch_size are
+    # pending) are embedded with one encode call, then their searches run
+    # concurrently and each caller's future is resolved. Batches are embedded
+    # one at a time, so while the model is busy the next batch keeps filling
+    # and batches grow with load. max_wait_ms=0 only batches queries that
+    # are already waiting.
+    #
+    #   async with RetrievalService(retrieval, max_wait_ms=5) as service:
+    #       matches = await service.query(namespace, text)
+    def __init__(
+        self,
+        retrieval,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        self.retrieval = retrieval
+        self.max_batch_size = max_batch_size or DEFAULT_SERVICE_MAX_BATCH_SIZE
+        self.max_wait = (
+            DEFAULT_SERVICE_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+        ) / 1000
+        # Searches in flight at once across all batches
+        self.max_concurrency = (
+            max_concurrency
+            or retrieval.retrieval_configs.get("max_concurrency")
+            or DEFAULT_MAX_CONCURRENCY
+        )
+        if self.max_batch_size < 1 or self.max_wait < 0:
+            raise ValueError("max_batch_size must be at least 1 and max_wait_ms at least 0")
+        self._pending = deque()
+        self._arrived = None
+        self._filled = None
+        self._semaphore = None
+        self._searches = set()
+        self._worker = None
+        self._closing = False
+        # Encode calls made and queries they embedded
+        self.batches = 0
+        self.batched_queries = 0
+
+    @property
+    def mean_batch_size(self) -> Optional[float]:
+        return self.batched_queries / self.batches if self.batches else None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        if self.running:
+            return self
+        self._arrived = asyncio.Event()
+        self._filled = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._closing = False
+        self._worker = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self):
+        # Serves every query submitted so far, then stops
+        if not self.running:
+            return
+        self._closing = True
+        self._arrived.set()
+        self._filled.set()
+        await self._worker
+        await asyncio.gather(*self._searches, return_exceptions=True)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def query(
+        self,
+        namespace: str,
+        text: str,
+        top_k: int = 3,
+        include_metadata: bool = True,
+        include_values: bool = True,
+    ):
+        # Same results as Retrieval.query: matches, or [] when the query fails
+        started = time.perf_counter()
+        try:
+            if not text:
+                raise ValueError("Text to query with is required")
+            if not self.running or self._closing:
+                raise RuntimeError("Retrieval service is not running")
+            future = asyncio.get_running_loop().create_future()
+            self._pending.append(
+                _Request(namespace, text, top_k, include_metadata, include_values, future)
+            )
+            self._arrived.set()
+            if len(self._pending) >= self.max_batch_size:
+                self._filled.set()
+            return await future
+        except Exception as e:
+            metrics.inc("query_errors_total", labels={"method": "service"})
+            logger.exception(f"Error querying Pinecone: {e}")
+            return []
+        finally:
+            metrics.observe(
+                "query_latency_seconds",
+                time.perf_counter() - started,
+                {"method": "service"},
+            )
+            metrics.inc("queries_total", labels={"method": "service"})
+
+    async def _collect(self):
+        # Waits for a first query, then up to max_wait for the batch to fill
+        while not self._pending:
+            if self._closing:
+                return None
+            self._arrived.clear()
+            await self._arrived.wait()
+        if (
+            len(self._pending) < self.max_batch_size
+            and self.max_wait > 0
+            and not self._closing
+        ):
+            self._filled.clear()
+            try:
+                await asyncio.wait_for(self._filled.wait(), self.max_wait)
+            except asyncio.TimeoutError:
+                pass
+        size = min(len(self._pending), self.max_batch_size)
+        return [self._pending.popleft() for _ in range(size)]
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            if batch is None:
+                return
+            # Callers that gave up (cancelled) are not embedded
+            batch = [request for request in batch if not request.future.done()]
+            if batch:
+                await self._process(batch)
+
+    async def _process(self, batch):
+        embedding_started = time.perf_counter()
+        for request in batch:
+            metrics.observe(
+                "service_queue_wait_seconds", embedding_started - request.submitted
+            )
+        self.batches += 1
+        self.batched_queries += len(batch)
+        metrics.inc("service_batches_total")
+        metrics.inc("service_batched_queries_total", len(batch))
+
+        try:
+            pc_index = await self.retrieval.connection.get_vector_store()
+            # Repeated texts in a batch are embedded once
+            texts = list(dict.fromkeys(request.text for request in batch))
+            vectors = dict(zip(texts, await self.retrieval.embed_queries(texts)))
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        for request in batch:
+            task = asyncio.create_task(
+                self._search(pc_index, request, vectors[request.text])
+            )
+            self._searches.add(task)
+            task.add_done_callback(self._searches.discard)
+
+    async def _search(self, pc_index, request, vector):
+        async with self._semaphore:
+            if request.future.done():
+                return
+            try:
+                matches = await self.retrieval.search(
+                    pc_index,
+                    request.namespace,
+                    vector,
+                    request.top_k,
+                    request.include_metadata,
+                    request.include_values,
+                )
+            except Exception as e:
+                if not request.future.done():
+                    request.future.set_exception(e)
+                return
+        if not request.future.done():
+            request.future.set_result(matches)
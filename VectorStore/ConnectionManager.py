@@ -0,0 +1,132 @@
+import os
+import logging
+import asyncio
+from .VectorStore import VectorStore, PineconeVectorStore
+from .LocalVectorStore import LocalVectorStore
+
+logger = logging.getLogger(__name__)
+
+supported_backends = ["pinecone", "local"]
+
+
+def get_api_key(pinecone_configs) -> str:
+    # pinecone_configs["api_key"] first, then PINECONE_API_KEY from the
+    # environment or a .env file
+    api_key = pinecone_configs.get("api_key")
+    if not api_key:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        api_key = os.getenv("PINECONE_API_KEY")
+    if not api_key:
+        raise ValueError("Pinecone API key not set.")
+    return api_key
+
+
+class ConnectionManager:
+    # Long-lived access to the vector store, owned by PineconeRag and shared
+    # with Ingest and Retrieval. For Pinecone it keeps one client open for
+    # control-plane calls, caches has_index/describe_index results and keeps
+    # one IndexAsyncio (one pooled HTTP session) per host, so a query costs a
+    # single data-plane request. The local backend is opened once and reused.
+    #
+    #   async with ConnectionManager(configs) as connection:
+    #       index = await connection.get_vector_store()
+    def __init__(self, configs):
+        self.configs = configs
+        self.pinecone_configs = configs["pinecone_configs"]
+        self.vector_store_configs = configs.get("vector_store_configs") or {}
+        self.backend = (self.vector_store_configs.get("backend") or "pinecone").lower()
+        if self.backend not in supported_backends:
+            raise ValueError(
+                f"Vector store backend '{self.backend}' not supported. Supported backends: {', '.join(supported_backends)}"
+            )
+        # Only the Pinecone backend needs a key
+        self.api_key = (
+            get_api_key(self.pinecone_configs) if self.backend == "pinecone" else None
+        )
+        self.client = None
+        self.index_hosts = {}  # index name -> host, from has_index/describe_index
+        self.stores = {}  # host -> VectorStore
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def get_client(self):
+        if self.client is None:
+            # The SDK is imported on first use, local-only processes never load it
+            from pinecone import PineconeAsyncio
+
+            self.client = PineconeAsyncio(api_key=self.api_key)
+        return self.client
+
+    async def get_host(self, name: str) -> str:
+        # Control-plane round trips happen once per index name per process
+        host = self.index_hosts.get(name)
+        if host:
+            return host
+
+        pc = await self.get_client()
+        if not await pc.has_index(name):
+            logger.info("Creating index")
+            pc_config = self.pinecone_configs.copy()
+            for k in ("api_key", "host", "namespace"):
+                pc_config.pop(k, None)
+            await pc.create_index(**pc_config)
+            host = (await pc.describe_index(name)).host
+        elif self.pinecone_configs.get("host"):
+            logger.info("Using existing index")
+            host = self.pinecone_configs["host"]
+        else:
+            raise KeyError("PineconeConfig missing 'host' key")
+
+        self.index_hosts[name] = host
+        return host
+
+    async def get_vector_store(self) -> VectorStore:
+        if self.backend == "local":
+            key = "local"
+        else:
+            # Configured host skips the control plane entirely once known
+            key = self.index_hosts.get(self.pinecone_configs["name"])
+
+        store = self.stores.get(key) if key else None
+        if store is not None:
+            return store
+
+        async with self._lock:
+            if self.backend == "local":
+                store = self.stores.get("local")
+                if store is None:
+                    store = LocalVectorStore(
+                        path=self.vector_store_configs.get("path"),
+                        dimension=self.pinecone_configs.get("dimension") or 768,
+                        metric=self.pinecone_configs.get("metric") or "cosine",
+                        ivf_lists=self.vector_store_configs.get("ivf_lists"),
+                        nprobe=self.vector_store_configs.get("nprobe"),
+                        storage_dtype=self.vector_store_configs.get("storage_dtype"),
+                    )
+                    self.stores["local"] = store
+                return store
+
+            host = await self.get_host(self.pinecone_configs["name"])
+            store = self.stores.get(host)
+            if store is None:
+                pc = await self.get_client()
+                store = PineconeVectorStore(pc.IndexAsyncio(host=host))
+                self.stores[host] = store
+            return store
+
+    async def close(self):
+        stores = list(self.stores.values())
+        self.stores = {}
+        for store in stores:
+            await store.close()
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
@@ -0,0 +1,503 @@
+import logging
+import os
+import json
+import sqlite3
+import asyncio
+import threading
+import numpy as np
+from typing import Optional
+from urllib.parse import quote
+from Embedding.Quantization import (
+    quantize,
+    dequantize,
+    quantized_dot,
+    storage_numpy_dtypes,
+    storage_suffixes,
+    validate_storage_dtype,
+)
+from .VectorStore import VectorStore, supported_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NPROBE = 8
+# Below this many vectors an exact scan is as fast as probing an IVF index
+IVF_MIN_VECTORS = 10_000
+
+
+class LocalNamespace:
+    # Vectors of one namespace in a memory-mapped matrix of storage_dtype
+    # (float32, float16, or int8 with one float32 scale per row). Rows
+    # [0, count) are live; deleting a row moves the last row into its place so
+    # the matrix stays dense for vectorized scoring. Ids, rows and metadata are
+    # kept in a SQLite table (records.sqlite) that every write updates for the
+    # records it touches only.
+    def __init__(
+        self, path: Optional[str], dimension: int, storage_dtype: str = "float32"
+    ):
+        self.path = path
+        self.dimension = dimension
+        self.storage_dtype = validate_storage_dtype(storage_dtype)
+        self.count = 0
+        self.capacity = 0
+        self.vectors = np.zeros(
+            (0, dimension), dtype=storage_numpy_dtypes[self.storage_dtype]
+        )
+        self.scales = (
+            np.zeros(0, dtype=np.float32) if self.storage_dtype == "int8" else None
+        )
+        # Norms of the stored (dequantized) vectors
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.ids = []
+        self.metadata = []
+        self.rows = {}
+        # Coarse quantizer, trained lazily (see LocalVectorStore._candidate_rows).
+        # Written rows are assigned to the nearest centroid as they come in.
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.ivf_normalized = False
+        self.ivf_trained_count = 0
+        self.connection = None
+        # Writes run in worker threads and may overlap with queries
+        self.lock = threading.RLock()
+
+        if path and os.path.exists(os.path.join(path, "records.sqlite")):
+            self._load()
+
+    def _vectors_path(self):
+        return os.path.join(
+            self.path, f"vectors.{storage_suffixes[self.storage_dtype]}"
+        )
+
+    def _scales_path(self):
+        return os.path.join(self.path, "scales.f32")
+
+    def _open_db(self):
+        if self.connection is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.connection = sqlite3.connect(
+                os.path.join(self.path, "records.sqlite"), check_same_thread=False
+            )
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+                )
+                self.connection.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS records (
+                        id TEXT PRIMARY KEY,
+                        row INTEGER NOT NULL,
+                        metadata TEXT NOT NULL
+                    )
+                    """
+                )
+        return self.connection
+
+    def _load(self):
+        connection = self._open_db()
+        meta = dict(connection.execute("SELECT name, value FROM meta"))
+        if not meta:
+            return
+        storage_dtype = meta["storage_dtype"]
+        if storage_dtype != self.storage_dtype:
+            # The namespace keeps the format it was written in
+            logger.warning(
+                f"Namespace at {self.path} is stored as {storage_dtype}, not {self.storage_dtype}"
+            )
+            self.storage_dtype = storage_dtype
+        self.count = int(meta["count"])
+        self.capacity = int(meta["capacity"])
+        records = connection.execute(
+            "SELECT id, metadata FROM records ORDER BY row"
+        ).fetchall()
+        self.ids = [id for id, _ in records]
+        self.metadata = [json.loads(metadata) for _, metadata in records]
+        self.rows = {id: row for row, id in enumerate(self.ids)}
+        self.vectors = np.memmap(
+            self._vectors_path(),
+            dtype=storage_numpy_dtypes[self.storage_dtype],
+            mode="r+",
+            shape=(self.capacity, self.dimension),
+        )
+        if self.storage_dtype == "int8":
+            self.scales = np.memmap(
+                self._scales_path(), dtype=np.float32, mode="r+", shape=(self.capacity,)
+            )
+        self.norms = np.zeros(self.capacity, dtype=np.float32)
+        self.norms[: self.count] = np.linalg.norm(self.get_vectors(), axis=1)
+        self.assignments = np.zeros(self.capacity, dtype=np.int32)
+
+    def get_vectors(self, rows=None):
+        # Dequantized float32 copy of the given rows, all live rows by default
+        if rows is None:
+            rows = slice(0, self.count)
+        return dequantize(
+            self.vectors[rows], None if self.scales is None else self.scales[rows]
+        )
+
+    @property
+    def nbytes(self):
+        # Bytes of the live vectors as stored, scales included
+        itemsize = np.dtype(storage_numpy_dtypes[self.storage_dtype]).itemsize
+        return self.count * (
+            self.dimension * itemsize + (4 if self.scales is not None else 0)
+        )
+
+    def _grow_array(self, array, path, shape, dtype):
+        if path:
+            grown_path = path + ".grow"
+            grown = np.memmap(grown_path, dtype=dtype, mode="w+", shape=shape)
+            grown[: self.count] = array[: self.count]
+            grown.flush()
+            del grown
+            os.replace(grown_path, path)
+            return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+        grown = np.zeros(shape, dtype=dtype)
+        grown[: self.count] = array[: self.count]
+        return grown
+
+    def _grow(self, needed: int):
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, self.capacity * 2, 1024)
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+        self.vectors = self._grow_array(
+            self.vectors,
+            self.path and self._vectors_path(),
+            (capacity, self.dimension),
+            storage_numpy_dtypes[self.storage_dtype],
+        )
+        if self.scales is not None:
+            self.scales = self._grow_array(
+                self.scales, self.path and self._scales_path(), (capacity,), np.float32
+            )
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[: self.count] = self.norms[: self.count]
+        self.norms = norms
+        assignments = np.zeros(capacity, dtype=np.int32)
+        assignments[: self.count] = self.assignments[: self.count]
+        self.assignments = assignments
+        self.capacity = capacity
+
+    def assign(self, rows):
+        # Inverted list of each row: its nearest trained centroid
+        if self.centroids is None or len(rows) == 0:
+            return
+        rows = np.asarray(rows)
+        vectors = self.get_vectors(rows)
+        if self.ivf_normalized:
+            vectors = vectors / np.maximum(self.norms[rows, None], 1e-12)
+        distances = (
+            np.einsum("ij,ij->i", self.centroids, self.centroids)[None, :]
+            - 2 * vectors @ self.centroids.T
+        )
+        self.assignments[rows] = distances.argmin(axis=1)
+
+    def upsert(self, records):
+        with self.lock:
+            self._upsert(records)
+
+    def _upsert(self, records):
+        new_ids = [record["id"] for record in records if record["id"] not in self.rows]
+        self._grow(self.count + len(set(new_ids)))
+
+        written = {}
+        for record in records:
+            values = np.asarray(record["values"], dtype=np.float32)
+            if values.shape != (self.dimension,):
+                raise ValueError(
+                    f"Vector dimension {values.shape[-1]} does not match index dimension {self.dimension}"
+                )
+            data, scales = quantize(values, self.storage_dtype)
+            row = self.rows.get(record["id"])
+            if row is None:
+                row = self.count
+                self.count += 1
+                self.ids.append(record["id"])
+                self.metadata.append(record.get("metadata") or {})
+                self.rows[record["id"]] = row
+            else:
+                self.metadata[row] = record.get("metadata") or {}
+            self.vectors[row] = data[0]
+            if scales is not None:
+                self.scales[row] = scales[0]
+            self.norms[row] = np.linalg.norm(dequantize(data, scales))
+            written[record["id"]] = row
+
+        self.assign(list(written.values()))
+        self._save(written=written.keys())
+
+    def delete(self, ids):
+        with self.lock:
+            self._delete(ids)
+
+    def _delete(self, ids):
+        deleted = set()
+        moved = set()
+        for id in ids:
+            row = self.rows.pop(id, None)
+            if row is None:
+                continue
+            deleted.add(id)
+            last = self.count - 1
+            if row != last:
+                self.vectors[row] = self.vectors[last]
+                if self.scales is not None:
+                    self.scales[row] = self.scales[last]
+                self.norms[row] = self.norms[last]
+                self.assignments[row] = self.assignments[last]
+                self.ids[row] = self.ids[last]
+                self.metadata[row] = self.metadata[last]
+                self.rows[self.ids[row]] = row
+                moved.add(self.ids[row])
+            self.ids.pop()
+            self.metadata.pop()
+            self.count = last
+
+        if deleted:
+            self._save(deleted=deleted, moved=moved - deleted)
+
+    def _save(self, written=(), deleted=(), moved=()):
+        # Vectors first, then the index rows that point at them
+        if not self.path:
+            return
+        if isinstance(self.vectors, np.memmap):
+            self.vectors.flush()
+        if isinstance(self.scales, np.memmap):
+            self.scales.flush()
+        connection = self._open_db()
+        with connection:
+            connection.executemany(
+                "DELETE FROM records WHERE id = ?", [(id,) for id in deleted]
+            )
+            connection.executemany(
+                "UPDATE records SET row = ? WHERE id = ?",
+                [(self.rows[id], id) for id in moved],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO records (id, row, metadata) VALUES (?, ?, ?)",
+                [
+                    (id, self.rows[id], json.dumps(self.metadata[self.rows[id]]))
+                    for id in written
+                ],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                [
+                    ("storage_dtype", self.storage_dtype),
+                    ("count", str(self.count)),
+                    ("capacity", str(self.capacity)),
+                ],
+            )
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+def score_vectors(vectors, norms, query, metric, scales=None):
+    # Higher is better for cosine and dotproduct; euclidean returns the squared
+    # distance, where lower is better. Quantized rows are scored directly,
+    # see quantized_dot.
+    scores = quantized_dot(vectors, scales, query)
+    if metric == "euclidean":
+        return norms * norms - 2 * scores + query @ query
+    if metric == "cosine":
+        scores = scores / np.maximum(norms * np.linalg.norm(query), 1e-12)
+    return scores
+
+
+def namespace_dir(namespace: str) -> str:
+    # Directory name of a namespace: percent-encoded, so that any namespace
+    # (a file path from IngestScheduler, "..", "/etc") is one directory right
+    # under the store path
+    if not namespace:
+        return "__default__"
+    name = quote(namespace, safe="")
+    if name.strip(".") == "":
+        name = name.replace(".", "%2E")
+    return name
+
+
+def top_k_rows(scores, top_k, metric):
+    top_k = min(top_k, len(scores))
+    if top_k == 0:
+        return np.zeros(0, dtype=np.int64)
+    keys = scores if metric == "euclidean" else -scores
+    rows = np.argpartition(keys, top_k - 1)[:top_k]
+    return rows[np.argsort(keys[rows])]
+
+
+def kmeans(vectors, lists, iterations=10, seed=0):
+    # Plain Lloyd iterations, enough for a coarse quantizer
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=lists, replace=False)].copy()
+    for _ in range(iterations):
+        distances = (
+            np.einsum("ij,ij->i", vectors, vectors)[:, None]
+            - 2 * vectors @ centroids.T
+            + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+        )
+        assignments = distances.argmin(axis=1)
+        for list_id in range(lists):
+            members = vectors[assignments == list_id]
+            if len(members):
+                centroids[list_id] = members.mean(axis=0)
+    return centroids, assignments
+
+
+class LocalVectorStore(VectorStore):
+    # In-process vector store with exact top-k scoring in NumPy. Persisted under
+    # `path` (one directory per namespace, see namespace_dir) or kept in
+    # memory when path is None.
+    # With ivf_lists set and at least IVF_MIN_VECTORS vectors in a namespace,
+    # queries only score the `nprobe` inverted lists closest to the query.
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        dimension: int = 768,
+        metric: str = "cosine",
+        ivf_lists: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        storage_dtype: Optional[str] = None,
+    ):
+        metric = metric.lower()
+        if metric not in supported_metrics:
+            raise ValueError(
+                f"Metric '{metric}' not supported. Supported metrics: {', '.join(supported_metrics)}"
+            )
+        self.path = path
+        self.dimension = dimension
+        self.metric = metric
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe or DEFAULT_NPROBE
+        self.storage_dtype = validate_storage_dtype(storage_dtype)
+        self.namespaces = {}
+        self._lock = threading.Lock()
+
+    def get_namespace(self, namespace: str) -> LocalNamespace:
+        with self._lock:
+            store = self.namespaces.get(namespace)
+            if store is None:
+                path = (
+                    os.path.join(self.path, namespace_dir(namespace))
+                    if self.path
+                    else None
+                )
+                store = LocalNamespace(path, self.dimension, self.storage_dtype)
+                self.namespaces[namespace] = store
+            return store
+
+    def _candidate_rows(self, store: LocalNamespace, query):
+        if not self.ivf_lists or store.count < max(IVF_MIN_VECTORS, self.ivf_lists):
+            return None
+        # Writes assign their rows to the existing lists; the lists are only
+        # retrained once the namespace has doubled or halved since training
+        if (
+            store.centroids is None
+            or store.count > 2 * store.ivf_trained_count
+            or store.count < store.ivf_trained_count // 2
+        ):
+            logger.info(
+                f"Building IVF index with {self.ivf_lists} lists over {store.count} vectors"
+            )
+            vectors = store.get_vectors()
+            if self.metric == "cosine":
+                vectors = vectors / np.maximum(store.norms[: store.count, None], 1e-12)
+            store.centroids, assignments = kmeans(vectors, self.ivf_lists)
+            store.assignments[: store.count] = assignments
+            store.ivf_normalized = self.metric == "cosine"
+            store.ivf_trained_count = store.count
+        if self.metric == "cosine":
+            query = query / max(np.linalg.norm(query), 1e-12)
+        distances = np.linalg.norm(store.centroids - query, axis=1)
+        probes = np.argsort(distances)[: self.nprobe]
+        return np.flatnonzero(np.isin(store.assignments[: store.count], probes))
+
+    def _query(self, vector, top_k, namespace, include_values, include_metadata):
+        store = self.get_namespace(namespace)
+        with store.lock:
+            return self._query_namespace(
+                store, vector, top_k, namespace, include_values, include_metadata
+            )
+
+    def _query_namespace(
+        self, store, vector, top_k, namespace, include_values, include_metadata
+    ):
+        query = np.asarray(vector, dtype=np.float32)
+        if store.count == 0:
+            return {"namespace": namespace, "matches": []}
+
+        candidates = self._candidate_rows(store, query)
+        if candidates is None:
+            scores = score_vectors(
+                store.vectors[: store.count],
+                store.norms[: store.count],
+                query,
+                self.metric,
+                None if store.scales is None else store.scales[: store.count],
+            )
+            rows = top_k_rows(scores, top_k, self.metric)
+            row_scores = scores[rows]
+        else:
+            scores = score_vectors(
+                store.vectors[candidates],
+                store.norms[candidates],
+                query,
+                self.metric,
+                None if store.scales is None else store.scales[candidates],
+            )
+            best = top_k_rows(scores, top_k, self.metric)
+            rows, row_scores = candidates[best], scores[best]
+
+        matches = []
+        for row, score in zip(rows, row_scores):
+            match = {"id": store.ids[row], "score": float(score)}
+            if include_values:
+                match["values"] = store.get_vectors([row])[0].tolist()
+            if include_metadata:
+                match["metadata"] = store.metadata[row]
+            matches.append(match)
+        return {"namespace": namespace, "matches": matches}
+
+    async def upsert(self, vectors, namespace="", batch_size=100):
+        store = self.get_namespace(namespace)
+        await asyncio.to_thread(store.upsert, vectors)
+        return {"upserted_count": len(vectors)}
+
+    async def query(
+        self,
+        vector,
+        top_k=3,
+        namespace="",
+        include_values=False,
+        include_metadata=True,
+    ):
+        return await asyncio.to_thread(
+            self._query, vector, top_k, namespace, include_values, include_metadata
+        )
+
+    async def delete(self, ids, namespace=""):
+        store = self.get_namespace(namespace)
+        await asyncio.to_thread(store.delete, ids)
+
+    async def fetch(self, ids, namespace=""):
+        store = self.get_namespace(namespace)
+        vectors = {}
+        with store.lock:
+            for id in ids:
+                row = store.rows.get(id)
+                if row is not None:
+                    vectors[id] = {
+                        "id": id,
+                        "values": store.get_vectors([row])[0].tolist(),
+                        "metadata": store.metadata[row],
+                    }
+        return {"namespace": namespace, "vectors": vectors}
+
+    async def close(self):
+        with self._lock:
+            for store in self.namespaces.values():
+                store.close()
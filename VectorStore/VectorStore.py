@@ -0,0 +1,80 @@
+from typing import Any, Dict, List
+
+supported_metrics = ["cosine", "dotproduct", "euclidean"]
+
+
+class VectorStore:
+    # Upsert/query/delete/fetch surface shared by every backend. Methods mirror
+    # the pinecone IndexAsyncio arguments so callers do not depend on the backend.
+    async def upsert(
+        self, vectors: List[Dict[str, Any]], namespace: str = "", batch_size: int = 100
+    ):
+        raise NotImplementedError
+
+    async def query(
+        self,
+        vector,
+        top_k: int = 3,
+        namespace: str = "",
+        include_values: bool = False,
+        include_metadata: bool = True,
+    ):
+        # Returns {"namespace": str, "matches": [{"id", "score", "values"?, "metadata"?}]}
+        raise NotImplementedError
+
+    async def delete(self, ids: List[str], namespace: str = ""):
+        raise NotImplementedError
+
+    async def fetch(self, ids: List[str], namespace: str = ""):
+        # Returns {"namespace": str, "vectors": {id: {"id", "values", "metadata"}}}
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class PineconeVectorStore(VectorStore):
+    def __init__(self, index):
+        self.index = index
+
+    async def upsert(self, vectors, namespace="", batch_size=100):
+        return await self.index.upsert(
+            vectors=vectors, namespace=namespace, batch_size=batch_size
+        )
+
+    async def query(
+        self,
+        vector,
+        top_k=3,
+        namespace="",
+        include_values=False,
+        include_metadata=True,
+    ):
+        return await self.index.query(
+            vector=vector,
+            top_k=top_k,
+            namespace=namespace,
+            include_values=include_values,
+            include_metadata=include_metadata,
+        )
+
+    async def delete(self, ids, namespace=""):
+        return await self.index.delete(ids=ids, namespace=namespace)
+
+    async def fetch(self, ids, namespace=""):
+        response = await self.index.fetch(ids=ids, namespace=namespace)
+        # Same plain-dict shape as the other backends
+        return {
+            "namespace": namespace,
+            "vectors": {
+                id: {
+                    "id": id,
+                    "values": list(vector.values or []),
+                    "metadata": dict(vector.metadata or {}),
+                }
+                for id, vector in response.vectors.items()
+            },
+        }
+
+    async def close(self):
+        await self.index.close()
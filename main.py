@@ -4,6 +4,7 @@ from pinecone import ServerlessSpec
 from enum import Enum
 from typing import TypedDict, Optional
 from PineconeRag import PineconeRag
+from Instrumentation.Logging import configure_logging
 import asyncio
 
 load_dotenv()
@@ -86,14 +87,14 @@ async def test():
     }
 
     # Test implementation
-    rag = PineconeRag(configs=configs)
+    async with PineconeRag(configs=configs) as rag:
+        # would the user want to get the index details if creating a new index?
+        index_details = await rag.ingest()
+        print(index_details)
 
-    # would the user want to get the index details if creating a new index?
-    index_details = await rag.ingest()
-    print(index_details)
-
-    # answer = rag.prompt("What is the average income in state?")
+        # answer = rag.prompt("What is the average income in state?")
 
 
 if __name__ == "__main__":
+    configure_logging("INFO")
     asyncio.run(test())
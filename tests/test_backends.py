@@ -0,0 +1,10 @@
+import sys
+import pytest
+from Embedding.Backends import OnnxEmbedder
+
+
+@pytest.mark.parametrize("missing", ["onnx", "onnxruntime"])
+def test_onnx_backend_names_its_missing_dependencies(monkeypatch, missing):
+    monkeypatch.setitem(sys.modules, missing, None)
+    with pytest.raises(ImportError, match="'onnx' embedding backend.*requirements-onnx.txt"):
+        OnnxEmbedder("model")
@@ -0,0 +1,66 @@
+import os
+import asyncio
+import numpy as np
+from Ingest.Checkpoint import Checkpoint, checkpointed_pipeline
+
+
+def chunks(*ids):
+    return [
+        {"id": id, "text": id, "token_count": 1, "metadata": {"row": i}}
+        for i, id in enumerate(ids)
+    ]
+
+
+class FakeProcessor:
+    def __init__(self, batches):
+        self.batches = batches
+        self.seen_ids = set()
+        self.encoded = []
+
+    async def iter_text_batches(self, batch_size=32):
+        for batch in self.batches:
+            self.seen_ids.update(chunk["id"] for chunk in batch)
+            yield batch
+
+    async def encode_chunks(self, batch):
+        self.encoded.extend(chunk["id"] for chunk in batch)
+        return np.ones((len(batch), 4), dtype=np.float32)
+
+
+def run_pipeline(checkpoint, processor):
+    upserted = []
+
+    async def upsert(records):
+        upserted.extend(record["id"] for record in records)
+
+    asyncio.run(checkpointed_pipeline(processor, checkpoint, upsert).run())
+    return upserted
+
+
+def test_resume_skips_acknowledged_and_superseded_shards(tmp_path):
+    source = tmp_path / "data.csv"
+    source.write_text("text\na\nb\nc\nd\n")
+    checkpoint_dir = str(tmp_path / "checkpoints")
+
+    # First run: batch 1 upserted, batch 2 extracted, then a crash
+    first = Checkpoint(checkpoint_dir, str(source))
+    first.ack(first.write_chunks(chunks("a", "b")), ["a", "b"])
+    first.write_chunks(chunks("c", "d"))
+
+    # Second run extracts again: acknowledged chunks are skipped, the rest
+    # go to a new shard that supersedes shard 2
+    second = Checkpoint(checkpoint_dir, str(source))
+    processor = FakeProcessor([chunks("a", "b"), chunks("c", "d")])
+    assert run_pipeline(second, processor) == ["c", "d"]
+    assert second.extracted["shards"] == [3]
+
+    # Crash after extraction, before shard 3 was acknowledged
+    with open(os.path.join(second.path, "acks.log"), "w", encoding="utf-8") as f:
+        f.write("1\n")
+
+    # Third run replays the stored chunks and vectors once
+    third = Checkpoint(checkpoint_dir, str(source))
+    processor = FakeProcessor([])
+    assert run_pipeline(third, processor) == ["c", "d"]
+    assert processor.encoded == []
+    assert processor.seen_ids == {"a", "b", "c", "d"}
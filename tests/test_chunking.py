@@ -0,0 +1,43 @@
+import pytest
+import Ingest.Chunker as chunker_module
+from Ingest.CSVProcessor import CSVProcessor
+from Ingest.PDFProcessor import PDFProcessor
+
+
+class FakeTokenizer:
+    # One token per whitespace separated word
+    def num_special_tokens_to_add(self):
+        return 2
+
+
+class FakeModel:
+    max_seq_length = 64
+
+
+@pytest.fixture
+def tokenizer_names(monkeypatch):
+    names = []
+
+    def get_tokenizer(model_name):
+        names.append(model_name)
+        return FakeTokenizer()
+
+    monkeypatch.setattr(chunker_module, "get_tokenizer", get_tokenizer)
+    return names
+
+
+@pytest.mark.parametrize("processor_class", [CSVProcessor, PDFProcessor])
+def test_processors_chunk_with_the_configured_model_tokenizer(
+    processor_class, tokenizer_names
+):
+    processor_class(
+        {"file_name": "data.csv", "file_type": "csv", "text_column": "text"},
+        model=FakeModel(),
+        embedding_configs={"model_name": "custom/model"},
+    )
+    assert tokenizer_names == ["custom/model"]
+
+
+def test_chunker_defaults_to_the_default_model_tokenizer(tokenizer_names):
+    chunker_module.Chunker(max_tokens=32)
+    assert tokenizer_names == [chunker_module.DEFAULT_MODEL_NAME]
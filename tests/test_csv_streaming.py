@@ -0,0 +1,114 @@
+import re
+import csv
+import asyncio
+import zlib
+import numpy as np
+import pytest
+import Ingest.Chunker as chunker_module
+from Ingest.CSVProcessor import CSVProcessor
+from Ingest.Scheduler import plan_csv_ranges
+
+
+class FakeTokenizer:
+    # One token per whitespace separated word
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def __call__(self, texts, **kwargs):
+        return {
+            "offset_mapping": [
+                [match.span() for match in re.finditer(r"\S+", text)] for text in texts
+            ]
+        }
+
+
+class FakeModel:
+    max_seq_length = 64
+
+    def encode(self, texts, batch_size=None):
+        return np.stack(
+            [
+                np.random.default_rng(zlib.crc32(text.encode("utf-8"))).random(8)
+                for text in texts
+            ]
+        ).astype(np.float32)
+
+
+@pytest.fixture(autouse=True)
+def fake_tokenizer(monkeypatch):
+    monkeypatch.setattr(chunker_module, "get_tokenizer", lambda model_name: FakeTokenizer())
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "data.csv"
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "text"])
+        for i in range(10):
+            # Every third cell spans lines and holds quotes
+            text = f'row {i}\nsecond "line"' if i % 3 == 0 else f"row {i}"
+            writer.writerow([i, text])
+    return str(path)
+
+
+def processor(csv_path, **configs):
+    return CSVProcessor(
+        {
+            "file_name": csv_path,
+            "file_type": "csv",
+            "text_column": "text",
+            "start_row": 0,
+            "end_row": None,
+            **configs,
+        },
+        model=FakeModel(),
+    )
+
+
+def stream(processor):
+    async def run():
+        return [batch async for batch in processor.stream_records()]
+
+    return asyncio.run(run())
+
+
+def test_streamed_chunks_match_the_whole_file_read(csv_path):
+    batches = stream(processor(csv_path, start_row=2, end_row=9, chunk_size=3))
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    records = [record for batch in batches for record in batch]
+    assert [record["metadata"]["row"] for record in records] == list(range(2, 9))
+
+    whole = processor(csv_path, start_row=2, end_row=9)
+    asyncio.run(whole.run())
+    expected = whole.get_pinecone_records()
+    assert [record["id"] for record in records] == expected.ids
+    assert [record["metadata"]["original_text"] for record in records] == expected.texts
+
+
+def test_streaming_from_start_byte_keeps_row_provenance(csv_path):
+    start, end, start_byte, end_byte = plan_csv_ranges(csv_path, 4)[1]
+    seeked = stream(
+        processor(
+            csv_path,
+            start_row=start,
+            end_row=end,
+            start_byte=start_byte,
+            end_byte=end_byte,
+            chunk_size=3,
+        )
+    )
+    skipped = stream(processor(csv_path, start_row=start, end_row=end, chunk_size=3))
+
+    assert [len(batch) for batch in seeked] == [3, 1]
+    records = [record for batch in seeked for record in batch]
+    assert [record["metadata"]["row"] for record in records] == [4, 5, 6, 7]
+    assert records[2]["metadata"]["original_text"] == 'row 6\nsecond "line"'
+    assert [record["id"] for record in records] == [
+        record["id"] for batch in skipped for record in batch
+    ]
+
+
+def test_streaming_requires_chunk_size(csv_path):
+    with pytest.raises(ValueError):
+        stream(processor(csv_path))
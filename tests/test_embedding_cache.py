@@ -0,0 +1,90 @@
+import numpy as np
+from Embedding.EmbeddingCache import EmbeddingCache, get_embedding_cache
+
+
+def vectors(*values):
+    return np.array([[value] * 4 for value in values], dtype=np.float32)
+
+
+def test_hits_survive_reopen_after_flush(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=8)
+    cache.put_many(["a", "b"], vectors(1, 2))
+    cache.flush()
+
+    reopened = EmbeddingCache(str(tmp_path), "model", max_entries=8)
+    found, misses = reopened.get_many(["b", "a", "c"])
+    assert misses == [2]
+    np.testing.assert_array_equal(found[0], vectors(2)[0])
+    np.testing.assert_array_equal(found[1], vectors(1)[0])
+
+
+def test_unflushed_entries_are_misses_after_reopen(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=8)
+    cache.put_many(["a"], vectors(1))
+
+    reopened = EmbeddingCache(str(tmp_path), "model", max_entries=8)
+    assert reopened.get_many(["a"])[1] == [0]
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=2)
+    cache.put_many(["a", "b"], vectors(1, 2))
+    cache.get_many(["a"])
+    cache.put_many(["c"], vectors(3))
+
+    found, misses = cache.get_many(["a", "b", "c"])
+    assert misses == [1]
+    np.testing.assert_array_equal(found[2], vectors(3)[0])
+
+
+def test_cached_key_in_the_batch_is_not_evicted_for_a_new_one(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=2)
+    cache.put_many(["a", "b"], vectors(1, 2))
+    cache.put_many(["a", "c"], vectors(1, 3))
+
+    found, misses = cache.get_many(["a", "b", "c"])
+    assert misses == [1]
+    np.testing.assert_array_equal(found[0], vectors(1)[0])
+    np.testing.assert_array_equal(found[2], vectors(3)[0])
+    assert len(set(cache.entries.values())) == len(cache.entries) == 2
+
+
+def test_evicted_row_is_not_served_for_its_old_key_after_a_crash(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=4)
+    cache.put_many(["a", "b", "c", "d"], vectors(1, 2, 3, 4))
+    cache.flush()
+    # Evicts "a" and reuses its row; the process "dies" before the next flush
+    cache.put_many(["e"], vectors(9))
+
+    reopened = EmbeddingCache(str(tmp_path), "model", max_entries=4)
+    found, misses = reopened.get_many(["a", "b", "e"])
+    assert misses == [0, 2]
+    np.testing.assert_array_equal(found[1], vectors(2)[0])
+
+
+def test_batch_larger_than_cache_keeps_the_last_texts(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=2)
+    cache.put_many(["a", "b", "c"], vectors(1, 2, 3))
+
+    found, misses = cache.get_many(["a", "b", "c"])
+    assert misses == [0]
+    np.testing.assert_array_equal(found[1], vectors(2)[0])
+    np.testing.assert_array_equal(found[2], vectors(3)[0])
+
+
+def test_changed_storage_dtype_starts_a_new_cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=4)
+    cache.put_many(["a"], vectors(1))
+    cache.flush()
+
+    reopened = EmbeddingCache(str(tmp_path), "model", max_entries=4, storage_dtype="int8")
+    assert reopened.get_many(["a"])[1] == [0]
+
+
+def test_precision_and_storage_dtype_get_separate_caches(tmp_path):
+    configs = {"cache_dir": str(tmp_path), "model_name": "model"}
+    fp32 = get_embedding_cache(configs)
+    fp16 = get_embedding_cache({**configs, "precision": "fp16"})
+    int8 = get_embedding_cache({**configs, "storage_dtype": "int8"})
+    assert len({id(fp32), id(fp16), id(int8)}) == 3
+    assert len({fp32.cache_dir, fp16.cache_dir, int8.cache_dir}) == 3
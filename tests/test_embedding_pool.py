@@ -0,0 +1,112 @@
+import os
+import zlib
+import asyncio
+import numpy as np
+import pytest
+import Embedding.EmbeddingPool as pool_module
+from concurrent.futures import ProcessPoolExecutor
+from Embedding.EmbeddingPool import (
+    PinnedSpawnContext,
+    get_embedding_pool,
+    thread_variables,
+)
+from Embedding.Encoder import encode_texts
+
+
+def thread_environment():
+    return {variable: os.environ.get(variable) for variable in thread_variables}
+
+
+def test_workers_start_with_pinned_thread_counts():
+    before = thread_environment()
+    with ProcessPoolExecutor(1, mp_context=PinnedSpawnContext(3)) as executor:
+        assert executor.submit(thread_environment).result() == {
+            variable: "3" for variable in thread_variables
+        }
+    # The parent's environment is left as it was
+    assert thread_environment() == before
+
+
+def test_pools_are_shared_per_model_precision_and_size():
+    configs = {"model_name": "model", "workers": 2}
+    pool = get_embedding_pool(configs)
+    assert get_embedding_pool({**configs, "precision": "fp32"}) is pool
+    assert get_embedding_pool({**configs, "precision": "fp16"}) is not pool
+    assert get_embedding_pool({**configs, "workers": 3}) is not pool
+    assert get_embedding_pool({"model_name": "model", "workers": 1}) is None
+
+
+class FakeModel:
+    # Deterministic vector per text; fails on "boom"
+    max_seq_length = 64
+
+    def get_sentence_embedding_dimension(self):
+        return 8
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        if "boom" in texts:
+            raise RuntimeError("worker failed")
+        return np.stack(
+            [
+                np.random.default_rng(zlib.crc32(text.encode("utf-8"))).random(8)
+                for text in texts
+            ]
+        ).astype(np.float32)
+
+
+def _init_fake_worker(embedding_configs, threads):
+    # Runs in the spawned worker, in place of loading a real model
+    pool_module._worker_model = FakeModel()
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    monkeypatch.setattr(pool_module, "_init_worker", _init_fake_worker)
+    created = []
+
+    class RecordingSharedMemory(pool_module.SharedMemory):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            if kwargs.get("create"):
+                created.append(self.name)
+
+    monkeypatch.setattr(pool_module, "SharedMemory", RecordingSharedMemory)
+    pool = pool_module.EmbeddingPool(workers=2, threads=1)
+    pool.created_blocks = created
+    yield pool
+    pool.close()
+
+
+def assert_unlinked(names):
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            pool_module.SharedMemory(name=name)
+
+
+def test_pool_matches_encode_texts_in_one_process(fake_pool):
+    texts = [f"text {i} " + "word " * (i % 7) for i in range(40)]
+    token_counts = [2 + i % 7 for i in range(40)]
+
+    def encode(model):
+        return asyncio.run(
+            encode_texts(model, texts, token_counts=token_counts, max_batch_tokens=32)
+        )
+
+    expected = np.stack(encode(FakeModel()))
+    # Many batches, written to shared memory by two workers, in input order
+    np.testing.assert_array_equal(np.stack(encode(fake_pool)), expected)
+    np.testing.assert_array_equal(fake_pool.encode(texts, batch_size=7), expected)
+    assert fake_pool.get_sentence_embedding_dimension() == 8
+    assert_unlinked(fake_pool.created_blocks)
+
+
+def test_shared_memory_is_released_after_a_worker_error(fake_pool):
+    texts = ["a", "b", "boom", "c"]
+    with pytest.raises(RuntimeError, match="worker failed"):
+        asyncio.run(fake_pool.encode_batches(texts, [[0, 1], [2], [3]]))
+    with pytest.raises(RuntimeError, match="worker failed"):
+        fake_pool.encode(texts, batch_size=1)
+    assert len(fake_pool.created_blocks) == 2
+    assert_unlinked(fake_pool.created_blocks)
+    # The pool keeps working after a failed call
+    assert fake_pool.encode(["a"]).shape == (1, 8)
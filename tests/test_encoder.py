@@ -0,0 +1,42 @@
+import asyncio
+import numpy as np
+from Embedding.Encoder import encode_texts, plan_batches
+
+
+class RecordingModel:
+    max_seq_length = 512
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        self.calls.append((len(texts), batch_size))
+        return np.array([[len(text), 0.0] for text in texts], dtype=np.float32)
+
+
+def test_plan_batches_stays_within_padded_token_budget():
+    counts = [10, 200, 15, 180, 12, 30]
+    batches, padded, real = plan_batches(counts, max_batch_tokens=400, max_batch_size=8)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(counts)))
+    for batch in batches:
+        assert len(batch) * max(counts[i] for i in batch) <= 400
+    assert real == sum(counts)
+    assert padded >= real
+
+
+def test_encode_texts_runs_each_planned_batch_as_one_forward_pass():
+    model = RecordingModel()
+    texts = ["x" * n for n in range(1, 101)]
+    stats = {}
+    embeddings = asyncio.run(
+        encode_texts(
+            model,
+            texts,
+            token_counts=list(range(1, 101)),
+            max_batch_tokens=1000,
+            stats=stats,
+        )
+    )
+    assert [int(vector[0]) for vector in embeddings] == list(range(1, 101))
+    assert all(size == batch_size for size, batch_size in model.calls)
+    assert len(model.calls) == stats["batches"]
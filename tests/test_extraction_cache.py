@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+import Ingest.ExtractionCache as extraction_cache_module
+from Ingest.ExtractionCache import ExtractionCache
+
+
+def write_pdf(path, texts):
+    # One page per text, drawn with a shared Helvetica font
+    from PyPDF2 import PageObject, PdfWriter
+    from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    writer = PdfWriter()
+    font = writer._add_object(
+        DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject("/Helvetica"),
+            }
+        )
+    )
+    for text in texts:
+        page = PageObject.create_blank_page(None, 200, 200)
+        contents = DecodedStreamObject()
+        contents.set_data(f"BT /F1 12 Tf 10 100 Td ({text}) Tj ET".encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(contents)
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+        )
+        writer.add_page(page)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+@pytest.fixture
+def extracted_pages(monkeypatch):
+    # Page indexes actually extracted with PyPDF2, per call
+    calls = []
+    extract_pages = extraction_cache_module.extract_pages
+
+    async def recording_extract_pages(pdf_path, start, end, workers, executor=None, pages=None):
+        calls.append(list(pages))
+        return await extract_pages(pdf_path, start, end, workers, executor, pages=pages)
+
+    monkeypatch.setattr(extraction_cache_module, "extract_pages", recording_extract_pages)
+    return calls
+
+
+def extract(cache, pdf_path, start, end):
+    return asyncio.run(cache.extract(str(pdf_path), start, end, workers=1))
+
+
+def test_reopened_cache_serves_unchanged_file(tmp_path, extracted_pages):
+    pdf_path = tmp_path / "doc.pdf"
+    write_pdf(pdf_path, ["alpha", "beta", "gamma"])
+    cache_path = str(tmp_path / "cache.sqlite")
+    cache = ExtractionCache(cache_path)
+    assert extract(cache, pdf_path, 0, 3) == ["alpha", "beta", "gamma"]
+    assert cache.page_count(str(pdf_path)) == 3
+    cache.close()
+
+    reopened = ExtractionCache(cache_path)
+    assert extract(reopened, pdf_path, 0, 3) == ["alpha", "beta", "gamma"]
+    assert extracted_pages == [[0, 1, 2]]
+
+
+def test_partial_range_hit_extracts_only_missing_pages(tmp_path, extracted_pages):
+    pdf_path = tmp_path / "doc.pdf"
+    write_pdf(pdf_path, ["alpha", "beta", "gamma", "delta"])
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite"))
+    assert extract(cache, pdf_path, 1, 3) == ["beta", "gamma"]
+    assert extract(cache, pdf_path, 0, 4) == ["alpha", "beta", "gamma", "delta"]
+    assert extracted_pages == [[1, 2], [0, 3]]
+
+
+def test_changed_file_reextracts_changed_and_new_pages_only(tmp_path, extracted_pages):
+    pdf_path = tmp_path / "doc.pdf"
+    write_pdf(pdf_path, ["alpha", "beta", "gamma"])
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite"))
+    extract(cache, pdf_path, 0, 3)
+
+    # Page 1 edited and a page appended: no stale text is served
+    write_pdf(pdf_path, ["alpha", "beta edited", "gamma", "delta"])
+    assert cache.page_count(str(pdf_path)) == 4
+    assert extract(cache, pdf_path, 0, 4) == ["alpha", "beta edited", "gamma", "delta"]
+    assert extracted_pages == [[0, 1, 2], [1, 3]]
@@ -0,0 +1,84 @@
+import asyncio
+import numpy as np
+import VectorStore.LocalVectorStore as local_vector_store
+from VectorStore.LocalVectorStore import LocalNamespace, LocalVectorStore
+
+
+def records(ids, dimension=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {"id": id, "values": rng.random(dimension), "metadata": {"original_text": id}}
+        for id in ids
+    ]
+
+
+def test_records_survive_reopen(tmp_path):
+    store = LocalNamespace(str(tmp_path), 8)
+    written = records(["a", "b", "c"])
+    store.upsert(written)
+    store.upsert([{**written[1], "metadata": {"original_text": "b2"}}])
+    store.close()
+
+    reopened = LocalNamespace(str(tmp_path), 8)
+    assert reopened.count == 3
+    assert reopened.ids == ["a", "b", "c"]
+    assert reopened.metadata[1] == {"original_text": "b2"}
+    np.testing.assert_allclose(reopened.get_vectors([2])[0], written[2]["values"], rtol=1e-6)
+
+
+def test_delete_moves_last_row_and_persists(tmp_path):
+    store = LocalNamespace(str(tmp_path), 8)
+    written = records(["a", "b", "c", "d"])
+    store.upsert(written)
+    store.delete(["a", "missing"])
+    assert store.ids == ["d", "b", "c"]
+    store.close()
+
+    reopened = LocalNamespace(str(tmp_path), 8)
+    assert reopened.rows == {"d": 0, "b": 1, "c": 2}
+    assert reopened.metadata[0] == {"original_text": "d"}
+    np.testing.assert_allclose(reopened.get_vectors([0])[0], written[3]["values"], rtol=1e-6)
+
+
+def test_writes_keep_the_ivf_lists(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_vector_store, "IVF_MIN_VECTORS", 16)
+    store = LocalVectorStore(str(tmp_path), dimension=8, ivf_lists=4, nprobe=4)
+
+    async def run():
+        await store.upsert(records([f"a{i}" for i in range(32)]), "ns")
+        query = np.ones(8)
+        await store.query(query, 1, "ns")
+        namespace = store.get_namespace("ns")
+        centroids = namespace.centroids
+
+        await store.upsert(records([f"b{i}" for i in range(8)], seed=1), "ns")
+        assert namespace.centroids is centroids
+        # New rows are assigned to their nearest list, so all lists together
+        # still cover every row
+        assert namespace.assignments[: namespace.count].max() < 4
+        result = await store.query(query, 40, "ns")
+        assert len(result["matches"]) == 40
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_namespaces_stay_inside_the_store_path(tmp_path):
+    root = tmp_path / "store"
+    store = LocalVectorStore(str(root), dimension=8)
+    namespaces = ["", "..", "../escaped", "/absolute", "reports/q1.pdf", "."]
+
+    async def run():
+        for namespace in namespaces:
+            await store.upsert(records([f"{namespace}-id"]), namespace)
+        await store.close()
+
+    asyncio.run(run())
+    assert not (tmp_path / "escaped").exists()
+    directories = sorted(path.name for path in root.iterdir())
+    assert len(directories) == len(namespaces)
+    assert all(path.is_dir() for path in root.iterdir())
+
+    reopened = LocalVectorStore(str(root), dimension=8)
+    for namespace in namespaces:
+        assert reopened.get_namespace(namespace).ids == [f"{namespace}-id"]
@@ -0,0 +1,131 @@
+import re
+import asyncio
+import zlib
+import numpy as np
+import pytest
+import Ingest.Chunker as chunker_module
+from Ingest.Manifest import Manifest
+from Ingest.Scheduler import IngestScheduler
+from VectorStore.LocalVectorStore import LocalVectorStore
+
+
+class FakeTokenizer:
+    # One token per whitespace separated word
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def __call__(self, texts, **kwargs):
+        return {
+            "offset_mapping": [
+                [match.span() for match in re.finditer(r"\S+", text)] for text in texts
+            ]
+        }
+
+
+class FakeModel:
+    max_seq_length = 64
+
+    def encode(self, texts, batch_size=None):
+        return np.stack(
+            [
+                np.random.default_rng(zlib.crc32(text.encode("utf-8"))).random(8)
+                for text in texts
+            ]
+        ).astype(np.float32)
+
+
+class FakeConnection:
+    def __init__(self, store):
+        self.store = store
+
+    async def get_vector_store(self):
+        return self.store
+
+
+@pytest.fixture(autouse=True)
+def fake_tokenizer(monkeypatch):
+    monkeypatch.setattr(chunker_module, "get_tokenizer", lambda model_name: FakeTokenizer())
+
+
+def test_manifest_ids_are_scoped_and_persisted(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+    manifest.add("ns", "a.csv", ["1", "2"])
+    manifest.add("ns", "b.csv", ["3"])
+    manifest.add("other", "a.csv", ["1"])
+    manifest.remove("ns", ["2"])
+    manifest.close()
+
+    reopened = Manifest(str(tmp_path / "manifest.sqlite"))
+    assert reopened.get_ids("ns", "a.csv") == {"1"}
+    assert reopened.get_ids("ns", "b.csv") == {"3"}
+    assert reopened.get_ids("other", "a.csv") == {"1"}
+
+
+def ingest(source, store, manifest):
+    scheduler = IngestScheduler(
+        {
+            "pinecone_configs": {"namespace": "ns"},
+            "scheduler_configs": {"extract_workers": 1},
+        },
+        model=FakeModel(),
+        connection=FakeConnection(store),
+        manifest=manifest,
+    )
+    return asyncio.run(scheduler.run(str(source))), scheduler
+
+
+def test_reingest_deletes_records_removed_from_the_file(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    csv_path = source / "data.csv"
+    csv_path.write_text("text\nfirst row\nsecond row\nthird row\n", encoding="utf-8")
+    store = LocalVectorStore(dimension=8)
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+
+    report, scheduler = ingest(source, store, manifest)
+    assert report["records"] == 3 and report["deleted"] == 0
+    source_name = scheduler.get_source_name(str(csv_path))
+    ids = manifest.get_ids("ns", source_name)
+    assert len(ids) == 3
+
+    # Second row edited, third removed
+    csv_path.write_text("text\nfirst row\nsecond row edited\n", encoding="utf-8")
+    report, _ = ingest(source, store, manifest)
+    # Only the edited row is upserted; the old second and third rows are
+    # deleted from the store and the manifest
+    assert report["records"] == 1 and report["deleted"] == 2
+    remaining = manifest.get_ids("ns", source_name)
+    assert len(remaining) == 2 and len(remaining & ids) == 1
+    fetched = asyncio.run(store.fetch(sorted(ids | remaining), "ns"))
+    assert set(fetched["vectors"]) == remaining
+
+
+class FailingDeleteStore(LocalVectorStore):
+    fail_deletes = True
+
+    async def delete(self, ids, namespace=""):
+        if self.fail_deletes:
+            raise RuntimeError("delete failed")
+        return await super().delete(ids, namespace)
+
+
+def test_failed_delete_is_reported_and_retried(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.csv").write_text("text\nfirst\nsecond\n", encoding="utf-8")
+    (source / "b.csv").write_text("text\nother\n", encoding="utf-8")
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+    store = FailingDeleteStore(dimension=8)
+    ingest(source, store, manifest)
+
+    (source / "a.csv").write_text("text\nfirst\n", encoding="utf-8")
+    report, _ = ingest(source, store, manifest)
+    assert report["failed_units"] == []
+    assert [failure["path"] for failure in report["failed_deletes"]] == [
+        str(source / "a.csv")
+    ]
+
+    # The manifest still lists the removed id, so the next run deletes it
+    store.fail_deletes = False
+    report, _ = ingest(source, store, manifest)
+    assert report["deleted"] == 1 and report["failed_deletes"] == []
@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from Ingest.Pipeline import IngestPipeline
+
+
+def source(batches):
+    async def iterate():
+        for batch in batches:
+            yield batch
+
+    return iterate
+
+
+async def embed(batch):
+    return [{"id": item} for item in batch]
+
+
+def test_every_batch_is_upserted_once():
+    upserted = []
+
+    async def upsert(records):
+        await asyncio.sleep(0)
+        upserted.extend(record["id"] for record in records)
+
+    batches = [[f"{i}-{j}" for j in range(3)] for i in range(10)]
+    pipeline = IngestPipeline(
+        source(batches),
+        embed,
+        upsert,
+        {"queue_size": 1, "embed_concurrency": 2, "upsert_concurrency": 3},
+    )
+    stats = asyncio.run(pipeline.run())
+
+    assert sorted(upserted) == sorted(item for batch in batches for item in batch)
+    assert stats["upserted_batches"] == 10 and stats["upserted_records"] == 30
+
+
+def test_first_error_is_raised_and_other_stages_are_cancelled():
+    cancelled = []
+    extracted = []
+
+    async def endless_source():
+        i = 0
+        while True:
+            extracted.append(i)
+            yield [i]
+            i += 1
+
+    async def failing_embed(batch):
+        if batch == [2]:
+            raise RuntimeError("embed failed")
+        return [{"id": batch[0]}]
+
+    async def slow_upsert(records):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(records[0]["id"])
+            raise
+
+    pipeline = IngestPipeline(
+        endless_source,
+        failing_embed,
+        slow_upsert,
+        {"queue_size": 2, "embed_concurrency": 1, "upsert_concurrency": 2},
+    )
+
+    async def run():
+        with pytest.raises(RuntimeError, match="embed failed"):
+            await asyncio.wait_for(pipeline.run(), timeout=2)
+        return asyncio.all_tasks()
+
+    remaining = asyncio.run(run())
+    # Upserts in flight were cancelled instead of waited for and no pipeline
+    # task outlived run(). The source stopped at the bounded queue: three
+    # batches reached embed, two were queued and one was waiting to be put.
+    assert sorted(cancelled) == [0, 1]
+    assert len(extracted) <= 3 + 2 + 1
+    assert len(remaining) == 1
+
+
+def test_invalid_configs_are_rejected():
+    with pytest.raises(ValueError):
+        IngestPipeline(source([]), embed, embed, {"queue_size": 0})
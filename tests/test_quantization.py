@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from Embedding.Quantization import QuantizedVectors, quantize, quantized_dot
+
+
+@pytest.mark.parametrize("storage_dtype", ["float32", "float16", "int8"])
+def test_negative_indexes_return_rows_from_the_end(storage_dtype):
+    vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+    quantized = QuantizedVectors.from_vectors(list(vectors), storage_dtype)
+    np.testing.assert_allclose(quantized[-1], quantized[2])
+    np.testing.assert_allclose(quantized[-3], quantized[0])
+    with pytest.raises(IndexError):
+        quantized[3]
+    with pytest.raises(IndexError):
+        quantized[-4]
+
+
+@pytest.mark.parametrize("storage_dtype", ["float16", "int8"])
+def test_quantized_dot_matches_dequantized_scores(storage_dtype):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((10, 8)).astype(np.float32)
+    query = rng.standard_normal(8).astype(np.float32)
+    data, scales = quantize(vectors, storage_dtype)
+    expected = QuantizedVectors(data, scales, storage_dtype).to_float() @ query
+    scores = quantized_dot(data, scales, query, block_rows=3)
+    assert scores.dtype == np.float32
+    np.testing.assert_allclose(scores, expected, rtol=1e-5, atol=1e-5)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from Embedding.Quantization import QuantizedVectors
+from Ingest.RecordBatch import RecordBatch, iter_record_slices
+
+
+def chunks(count):
+    return [
+        {
+            "id": f"id-{i}",
+            "text": f"text {i}",
+            # Page chunks have no row and row chunks have no page
+            "metadata": {"row": i} if i % 2 else {"page": i, "source": "a.pdf"},
+        }
+        for i in range(count)
+    ]
+
+
+def vectors(count):
+    return np.arange(count * 4, dtype=np.float32).reshape(count, 4) / 10
+
+
+def expected_record(i):
+    metadata = {"original_text": f"text {i}"}
+    metadata.update({"row": i} if i % 2 else {"page": i, "source": "a.pdf"})
+    return {"id": f"id-{i}", "values": list(vectors(5)[i]), "metadata": metadata}
+
+
+def test_indexing_slicing_and_iteration_build_the_same_records():
+    batch = RecordBatch.from_chunks(chunks(5), list(vectors(5)))
+    records = [expected_record(i) for i in range(5)]
+
+    for i in range(-5, 5):
+        assert batch[i]["id"] == records[i]["id"]
+        np.testing.assert_allclose(batch[i]["values"], records[i]["values"])
+        assert batch[i]["metadata"] == records[i]["metadata"]
+    assert [record["id"] for record in batch] == [record["id"] for record in records]
+    part = batch[1:4]
+    assert len(part) == 3 and part.ids == ["id-1", "id-2", "id-3"]
+    assert [record["metadata"] for record in part] == [
+        record["metadata"] for record in records[1:4]
+    ]
+    assert [len(part) for part in iter_record_slices(batch, 2)] == [2, 2, 1]
+
+
+@pytest.mark.parametrize(
+    "storage_dtype, tolerance", [("float32", 0), ("float16", 1e-3), ("int8", 1e-2)]
+)
+def test_records_dequantize_to_the_original_vectors(storage_dtype, tolerance):
+    original = vectors(5)
+    batch = RecordBatch.from_chunks(
+        chunks(5), QuantizedVectors.from_vectors(list(original), storage_dtype)
+    )
+    values = np.array([record["values"] for record in batch])
+    assert all(type(value) is float for value in batch[0]["values"])
+    np.testing.assert_allclose(values, original, atol=tolerance * np.abs(original).max())
+
+
+def test_mismatched_columns_are_rejected():
+    with pytest.raises(ValueError):
+        RecordBatch(["a", "b"], QuantizedVectors.from_vectors(list(vectors(1))), ["a", "b"])
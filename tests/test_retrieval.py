@@ -0,0 +1,76 @@
+import asyncio
+import numpy as np
+from Retrieval.Retrieval import Retrieval
+from Retrieval.QueryCache import QueryCache
+from VectorStore.LocalVectorStore import LocalVectorStore
+
+
+class OnesModel:
+    max_seq_length = 64
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+class StubConnection:
+    def __init__(self, store):
+        self.store = store
+
+    async def get_vector_store(self):
+        return self.store
+
+
+def test_invalidate_namespace_drops_results_and_hydrated_records():
+    retrieval = Retrieval(
+        {"file_configs": {}, "pinecone_configs": {}},
+        model=object(),
+        embedding_cache=object(),
+        connection=object(),
+    )
+    for namespace in ("written", "other"):
+        retrieval.query_cache.put_result((namespace, "hash", 3, True, False), [])
+        retrieval.hydration_cache.put((namespace, "id"), {"metadata": {}})
+
+    retrieval.invalidate_namespace("written")
+
+    assert list(retrieval.query_cache.results.entries) == [("other", "hash", 3, True, False)]
+    assert list(retrieval.hydration_cache.entries) == [("other", "id")]
+
+
+def test_cached_results_are_not_shared_with_callers():
+    cache = QueryCache()
+    matches = [{"id": "a", "score": 0.9, "metadata": {"original_text": "a"}}]
+    cache.put_result("key", matches)
+    matches.pop()
+
+    first = cache.get_result("key")
+    first[0]["metadata"].pop("original_text")
+    first.sort(key=lambda match: match["score"])
+    first.append({"id": "b", "score": 0.1})
+
+    assert cache.get_result("key") == [
+        {"id": "a", "score": 0.9, "metadata": {"original_text": "a"}}
+    ]
+
+
+def test_query_returns_values_unless_asked_not_to():
+    store = LocalVectorStore(dimension=4)
+    record = {"id": "a", "values": np.ones(4), "metadata": {"original_text": "a"}}
+    asyncio.run(store.upsert([record], "ns"))
+    retrieval = Retrieval(
+        {"file_configs": {}, "pinecone_configs": {}},
+        model=OnesModel(),
+        embedding_cache=None,
+        connection=StubConnection(store),
+    )
+
+    [match] = asyncio.run(retrieval.query("ns", "question", top_k=1))
+    np.testing.assert_allclose(match["values"], np.ones(4))
+    [result] = asyncio.run(retrieval.query_many("ns", ["question"], top_k=1))
+    [match] = result["matches"]
+    np.testing.assert_allclose(match["values"], np.ones(4))
+    [match] = asyncio.run(
+        retrieval.query("ns", "question", top_k=1, include_values=False)
+    )
+    assert "values" not in match
+    assert match["metadata"] == {"original_text": "a"}
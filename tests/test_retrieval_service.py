@@ -0,0 +1,125 @@
+import asyncio
+import numpy as np
+from Retrieval.Retrieval import Retrieval
+from Retrieval.RetrievalService import RetrievalService
+from VectorStore.LocalVectorStore import LocalVectorStore
+
+TEXTS = [f"question {i}" for i in range(12)]
+
+
+def vector(text):
+    values = np.zeros(16, dtype=np.float32)
+    values[TEXTS.index(text)] = 1
+    return values
+
+
+class RecordingModel:
+    # One-hot vector per known text; records the texts of every encode call
+    max_seq_length = 64
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        self.calls.append(list(texts))
+        return np.stack([vector(text) for text in texts])
+
+
+class StubConnection:
+    def __init__(self, store):
+        self.store = store
+
+    async def get_vector_store(self):
+        return self.store
+
+
+class FailingStore(LocalVectorStore):
+    async def query(self, vector, top_k=3, namespace="", **kwargs):
+        if namespace == "broken":
+            raise RuntimeError("search failed")
+        return await super().query(vector, top_k, namespace, **kwargs)
+
+
+def make_retrieval():
+    store = FailingStore(dimension=16)
+    asyncio.run(
+        store.upsert(
+            [{"id": text, "values": vector(text), "metadata": {}} for text in TEXTS],
+            "ns",
+        )
+    )
+    model = RecordingModel()
+    retrieval = Retrieval(
+        {"file_configs": {}, "pinecone_configs": {}},
+        model=model,
+        embedding_cache=None,
+        connection=StubConnection(store),
+    )
+    return retrieval, model
+
+
+def top_ids(results):
+    return [matches[0]["id"] if matches else None for matches in results]
+
+
+def test_queries_within_the_window_share_one_encode_call():
+    retrieval, model = make_retrieval()
+
+    async def run():
+        async with RetrievalService(retrieval, max_batch_size=8, max_wait_ms=50) as service:
+            return await asyncio.gather(
+                *[service.query("ns", text, top_k=1) for text in TEXTS[:5]]
+            ), service
+
+    results, service = asyncio.run(run())
+    assert top_ids(results) == TEXTS[:5]
+    assert model.calls == [TEXTS[:5]]
+    assert service.batches == 1 and service.mean_batch_size == 5
+
+
+def test_batches_are_capped_at_max_batch_size():
+    retrieval, model = make_retrieval()
+
+    async def run():
+        async with RetrievalService(retrieval, max_batch_size=4, max_wait_ms=50) as service:
+            return await asyncio.gather(
+                *[service.query("ns", text, top_k=1) for text in TEXTS[:10]]
+            )
+
+    assert top_ids(asyncio.run(run())) == TEXTS[:10]
+    assert [len(call) for call in model.calls] == [4, 4, 2]
+
+
+def test_a_failing_search_only_fails_its_own_query():
+    retrieval, _ = make_retrieval()
+
+    async def run():
+        async with RetrievalService(retrieval, max_wait_ms=50) as service:
+            return await asyncio.gather(
+                service.query("ns", TEXTS[0], top_k=1),
+                service.query("broken", TEXTS[1], top_k=1),
+                service.query("ns", TEXTS[2], top_k=1),
+            )
+
+    assert top_ids(asyncio.run(run())) == [TEXTS[0], None, TEXTS[2]]
+
+
+def test_stop_serves_pending_queries_then_rejects_new_ones():
+    retrieval, _ = make_retrieval()
+
+    async def run():
+        service = RetrievalService(retrieval, max_wait_ms=1000)
+        await service.start()
+        pending = [
+            asyncio.create_task(service.query("ns", text, top_k=1)) for text in TEXTS[:3]
+        ]
+        await asyncio.sleep(0)
+        # Stopping does not wait out the batching window
+        await asyncio.wait_for(service.stop(), timeout=0.5)
+        served = await asyncio.gather(*pending)
+        return served, await service.query("ns", TEXTS[0]), service.running
+
+    served, after_stop, running = asyncio.run(run())
+    assert top_ids(served) == TEXTS[:3]
+    assert after_stop == []
+    assert not running
@@ -0,0 +1,83 @@
+import os
+import csv
+import pytest
+import Ingest.Chunker as chunker_module
+from Ingest.CSVProcessor import CSVProcessor
+from Ingest.Scheduler import IngestScheduler, plan_csv_ranges
+
+
+class FakeTokenizer:
+    def num_special_tokens_to_add(self):
+        return 2
+
+
+class FakeModel:
+    max_seq_length = 64
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "data.csv"
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "text"])
+        for i in range(10):
+            # Every third cell spans lines and holds quotes
+            text = f'row {i}\nsecond "line"' if i % 3 == 0 else f"row {i}"
+            writer.writerow([i, text])
+    return str(path)
+
+
+def read_unit(csv_path, start, end, start_byte, end_byte, monkeypatch):
+    monkeypatch.setattr(chunker_module, "get_tokenizer", lambda model_name: FakeTokenizer())
+    processor = CSVProcessor(
+        {
+            "file_name": csv_path,
+            "file_type": "csv",
+            "text_column": "text",
+            "start_row": start,
+            "end_row": end,
+            "start_byte": start_byte,
+            "end_byte": end_byte,
+            "chunk_size": 2,
+        },
+        model=FakeModel(),
+    )
+    return [text for _, texts in processor.iter_text_chunks() for text in texts]
+
+
+def test_csv_ranges_cover_every_row_once(csv_path):
+    ranges = plan_csv_ranges(csv_path, 4)
+    assert [(start, end) for start, end, _, _ in ranges] == [(0, 4), (4, 8), (8, 10)]
+    # Contiguous byte ranges from the end of the header to the end of the file
+    assert all(ranges[i][3] == ranges[i + 1][2] for i in range(len(ranges) - 1))
+    with open(csv_path, "rb") as f:
+        assert ranges[-1][3] == len(f.read())
+
+
+def test_csv_units_read_the_same_rows_as_skipping(csv_path, monkeypatch):
+    for start, end, start_byte, end_byte in plan_csv_ranges(csv_path, 4):
+        assert read_unit(
+            csv_path, start, end, start_byte, end_byte, monkeypatch
+        ) == read_unit(csv_path, start, end, None, None, monkeypatch)
+
+
+def test_record_sources_are_relative_to_data_files(monkeypatch):
+    monkeypatch.setattr(chunker_module, "get_tokenizer", lambda model_name: FakeTokenizer())
+    scheduler = IngestScheduler({}, model=FakeModel())
+    data_files = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data_files")
+    path = os.path.join(data_files, "reports", "q1.pdf")
+    assert scheduler.get_source_name(path) == os.path.join("reports", "q1.pdf")
+    processor = scheduler.build_processor(
+        {
+            "path": path,
+            "file_type": "pdf",
+            "start": 0,
+            "end": 1,
+            "start_byte": None,
+            "end_byte": None,
+        },
+        executor=None,
+        extract_workers=1,
+    )
+    assert processor.get_pdf_path() == path
@@ -0,0 +1,100 @@
+import asyncio
+import numpy as np
+import pytest
+from Ingest.UpsertEngine import UpsertEngine, record_bytes
+
+
+class StatusError(Exception):
+    def __init__(self, status):
+        super().__init__(f"status {status}")
+        self.status = status
+
+
+class FakeIndex:
+    # Accepts batches of at most max_records, throttles the first `throttled`
+    # requests and tracks requests in flight
+    def __init__(self, max_records=None, throttled=0, error=None):
+        self.max_records = max_records
+        self.throttled = throttled
+        self.error = error
+        self.calls = 0
+        self.accepted = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def upsert(self, vectors, namespace, batch_size):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.001)
+            if self.error is not None:
+                raise self.error
+            if self.throttled > 0:
+                self.throttled -= 1
+                raise StatusError(429)
+            if self.max_records and len(vectors) > self.max_records:
+                raise StatusError(413)
+            self.accepted.append(list(vectors))
+        finally:
+            self.in_flight -= 1
+
+
+def records(count, dimension=4):
+    return [
+        {
+            "id": f"id-{i}",
+            "values": np.full(dimension, i, dtype=np.float32),
+            "metadata": {"original_text": "x" * (i % 50)},
+        }
+        for i in range(count)
+    ]
+
+
+def engine(**configs):
+    engine = UpsertEngine(configs)
+    engine.backoff = lambda attempt: 0
+    return engine
+
+
+def test_every_record_is_upserted_once_through_throttling_and_splits():
+    index = FakeIndex(max_records=7, throttled=5)
+    upsert_engine = engine(max_batch_bytes=4000, max_batch_records=50, concurrency=3)
+    accepted = []
+    result = asyncio.run(
+        upsert_engine.upsert(index, records(300), "ns", on_batch=accepted.extend)
+    )
+
+    upserted = [record["id"] for batch in index.accepted for record in batch]
+    assert sorted(upserted) == sorted(f"id-{i}" for i in range(300))
+    assert len(set(upserted)) == 300
+    assert sorted(record["id"] for record in accepted) == sorted(upserted)
+    for batch in index.accepted:
+        assert len(batch) <= 7
+        assert sum(record_bytes(record) for record in batch) <= 4000
+    assert result["vectors"] == 300
+    assert result["retries"] == 5
+    assert result["splits"] > 0
+    assert index.max_in_flight <= 3
+
+
+def test_retries_stop_at_max_retries():
+    index = FakeIndex(throttled=100)
+    with pytest.raises(StatusError):
+        asyncio.run(engine(max_retries=3, concurrency=1).upsert(index, records(5), "ns"))
+    assert index.calls == 4
+    assert index.accepted == []
+
+
+def test_errors_that_are_not_transient_are_not_retried():
+    index = FakeIndex(error=StatusError(400))
+    with pytest.raises(StatusError):
+        asyncio.run(engine(max_retries=3).upsert(index, records(5), "ns"))
+    assert index.calls == 1
+
+
+def test_backoff_is_jittered_below_the_cap():
+    upsert_engine = UpsertEngine({"backoff_base": 0.5, "backoff_max": 2.0})
+    delays = [upsert_engine.backoff(attempt) for attempt in range(10) for _ in range(20)]
+    assert all(0 <= delay <= 2.0 for delay in delays)
+    assert len(set(delays)) > 1